@@ -0,0 +1,39 @@
+import httpx
+from fastapi import Header, HTTPException, Request
+
+from app.infrastructure.akua_client import AkuaClient
+from app.infrastructure.jobs import InvalidCallbackUrl, JobOptions, check_callback_url
+from app.infrastructure.timing import stage
+
+
+async def get_http_client(request: Request) -> httpx.AsyncClient:
+    """
+    Cliente HTTP compartido creado en el lifespan de la aplicación
+    """
+    return request.app.state.http_client
+
+
+async def get_akua_client(request: Request) -> AkuaClient:
+    return AkuaClient(request.app.state.http_client)
+
+
+async def get_job_options(
+    prefer: str | None = Header(
+        default=None,
+        alias="Prefer",
+        description="`respond-async` encola la operación y responde 202 con el id del job",
+    ),
+    callback_url: str | None = Header(
+        default=None,
+        alias="Callback-Url",
+        description="Modo asíncrono: URL que recibe un POST con el estado final del job",
+    ),
+) -> JobOptions:
+    requested = prefer is not None and "respond-async" in prefer.lower()
+    if requested and callback_url is not None:
+        try:
+            with stage("callback_check"):
+                await check_callback_url(callback_url)
+        except InvalidCallbackUrl as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return JobOptions(requested=requested, callback_url=callback_url if requested else None)
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from app.schemas.authorization import AuthorizationRequest
 from app.infrastructure.akua_client import AkuaClient
-from app.infrastructure.database import save_authorization
+from app.api.dependencies import get_akua_client, get_job_options
+from app.infrastructure.idempotency import IdempotencyConflict
+from app.infrastructure.database import authorization_record
+from app.infrastructure.write_behind import write_queue
+from app.infrastructure.passthrough import envelope_response
+from app.infrastructure.jobs import JobOptions, accepted_response, job_queue
+from app.infrastructure.timing import TimedRoute
 
-router = APIRouter(prefix="/authorization", tags=["authorization"])
+router = APIRouter(prefix="/authorization", tags=["authorization"], route_class=TimedRoute)
 
 # https://docs.akua.la/reference/authorize
 
@@ -17,10 +23,15 @@ async def create_authorization_endpoint(
     card_cvv: str | None = Query(default="123", description="CVV (Ejp: 123)"),
     card_exp_month: str | None = Query(default="12", description="Mes expiración (Ejp: 12)"),
     card_exp_year: str | None = Query(default="26", description="Año expiración (Ejp: 26)"),
+    idempotency_key: str | None = Header(
+        default=None,
+        alias="Idempotency-Key",
+        description="Key de idempotencia. Sin key ni `id` la autorización no se deduplica",
+    ),
+    client: AkuaClient = Depends(get_akua_client),
+    options: JobOptions = Depends(get_job_options),
 ):
 
-    client = AkuaClient()
-
     if amount is not None and body.amount is not None:
         body.amount.value = amount
 
@@ -46,22 +57,32 @@ async def create_authorization_endpoint(
     if body.amount is not None:
         body.amount.currency = "USD"
 
+    if options.requested:
+        job = await job_queue.enqueue(
+            "authorization", body.model_dump(exclude_none=True), idempotency_key, callback_url=options.callback_url
+        )
+        return accepted_response(job)
+
     try:
-        result = await client.create_authorization(body)
+        result = await client.create_authorization(body, idempotency_key)
 
         akua = result.get("akua_response", {})
 
-        save_authorization(
-            merchant_id=body.merchant_id,
-            authorization_id=body.id or "auto-generated",
-            payment_id=akua.get("payment_id"),
-            transaction_id=akua.get("transaction", {}).get("id"),
-            status=akua.get("transaction", {}).get("status", "UNKNOWN"),
-            raw_response=akua,
-            auth_type="AUTHORIZATION"
-        )
+        # Un duplicado respondido desde el registro de idempotencia ya fue persistido
+        if not result.get("replayed"):
+            await write_queue.submit(authorization_record(
+                merchant_id=body.merchant_id,
+                authorization_id=body.id or "auto-generated",
+                payment_id=akua.get("payment_id"),
+                transaction_id=akua.get("transaction", {}).get("id"),
+                status=akua.get("transaction", {}).get("status", "UNKNOWN"),
+                raw_response=akua,
+                auth_type="AUTHORIZATION"
+            ))
         
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=502, detail=str(e))
 
-    return result
\ No newline at end of file
+    return envelope_response(result)
\ No newline at end of file
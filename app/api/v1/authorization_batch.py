@@ -0,0 +1,339 @@
+import asyncio
+import codecs
+import json
+import logging
+import math
+from functools import partial
+from typing import AsyncIterator
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
+
+from app.config import settings
+from app.schemas.authorization import AuthorizationRequest
+from app.infrastructure.akua_client import AkuaClient
+from app.api.dependencies import get_akua_client
+from app.infrastructure.admission import admission_controller
+from app.infrastructure.database import authorization_record
+from app.infrastructure.storage import storage
+from app.infrastructure.timing import TimedRoute, stage
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/authorization", tags=["authorization"], route_class=TimedRoute)
+
+_DONE = object()
+# Referencias a los lotes en curso: siguen procesándose aunque el cliente se desconecte
+_running_batches: set[asyncio.Task] = set()
+
+
+_decoder = json.JSONDecoder()
+
+
+async def _json_items(request: Request) -> AsyncIterator[tuple[int, object]]:
+    """
+    Recorre la lista JSON a medida que llega: cada elemento se decodifica apenas
+    está completo, sin cargar el cuerpo entero
+    """
+    chunks = request.stream()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer, ended = "", False
+
+    async def more() -> bool:
+        nonlocal buffer, ended
+        if not ended:
+            chunk = await anext(chunks, None)
+            ended = chunk is None
+            buffer += text.decode(chunk or b"", final=ended)
+        return not ended
+
+    async def token() -> str:
+        # Siguiente carácter que no es espacio ("" al terminar el cuerpo)
+        nonlocal buffer
+        while not (buffer := buffer.lstrip()) and await more():
+            pass
+        return buffer[:1]
+
+    if await token() != "[":
+        raise ValueError("Se esperaba una lista JSON de autorizaciones")
+    buffer = buffer[1:]
+    if await token() == "]":
+        buffer = buffer[1:]
+    else:
+        index = 0
+        while True:
+            if not await token():
+                raise ValueError("Lista JSON incompleta")
+            try:
+                item, end = _decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if await more():
+                    continue
+                raise
+            # Un número al final del bloque puede seguir en el siguiente
+            if end == len(buffer) and await more():
+                continue
+            buffer = buffer[end:]
+            yield index, item
+            index += 1
+
+            separator = await token()
+            buffer = buffer[1:]
+            if separator == "]":
+                break
+            if not separator:
+                raise ValueError("Lista JSON incompleta")
+            if separator != ",":
+                raise ValueError("Se esperaba ',' o ']' entre los elementos de la lista")
+    if await token():
+        raise ValueError("Contenido después de la lista JSON")
+
+
+async def _ndjson_items(request: Request) -> AsyncIterator[tuple[int, object]]:
+    """
+    Lee el cuerpo línea a línea a medida que llega, sin cargarlo completo
+    """
+    index = 0
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield index, _parse_line(line)
+                index += 1
+    if buffer.strip():
+        yield index, _parse_line(buffer)
+
+
+def _parse_line(line: bytes) -> object:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return e
+
+
+class _Batch:
+    """
+    Ejecuta las autorizaciones con concurrencia acotada y publica cada resultado
+    en `results` apenas termina. Los registros se persisten por bloques de
+    `persist_chunk` mientras avanza el lote, no solo al final.
+    """
+
+    def __init__(self, client: AkuaClient, concurrency: int, max_items: int, persist_chunk: int) -> None:
+        self.client = client
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_items = max_items
+        self.persist_chunk = persist_chunk
+        # Acotada: con un cliente lento las autorizaciones esperan a que lea
+        self.results: asyncio.Queue = asyncio.Queue(maxsize=2 * concurrency)
+        self.intake_done = asyncio.Event()
+        self.records: list = []
+        self.tasks: set[asyncio.Task] = set()
+        self.total = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.persisted = 0
+        self.persistence_error: str | None = None
+        self.body_error: str | None = None
+        self._streamed = False
+        self._drain: asyncio.Task | None = None
+
+    async def run(self, first: tuple[int, object] | None, items: AsyncIterator[tuple[int, object]]) -> None:
+        """
+        Lee el resto del cuerpo enviando cada elemento apenas llega y cierra el
+        lote; corre en su propia tarea mientras la respuesta ya se está enviando
+        """
+        try:
+            if first is not None:
+                await self.submit(*first)
+                async for index, raw in items:
+                    await self.submit(index, raw)
+        except ValueError as e:
+            self.body_error = f"Cuerpo inválido: {e}"
+        except ClientDisconnect:
+            self.body_error = "El cliente se desconectó antes de enviar el cuerpo completo"
+        except Exception as e:
+            logger.exception("Error leyendo el cuerpo del lote de autorizaciones")
+            self.body_error = str(e)
+        finally:
+            self.intake_done.set()
+        await self.finish()
+
+    async def submit(self, index: int, raw: object) -> None:
+        self.total += 1
+        if index >= self.max_items:
+            await self._fail(index, f"El lote supera el máximo de {self.max_items} elementos")
+            return
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self._authorize(index, raw))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def finish(self) -> None:
+        if self.tasks:
+            await asyncio.gather(*self.tasks)
+        await self._persist()
+
+        summary = {
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "persisted": self.persistence_error is None,
+            "persisted_records": self.persisted,
+        }
+        if self.persistence_error:
+            summary["persistence_error"] = self.persistence_error
+        if self.body_error:
+            summary["body_error"] = self.body_error
+        await self.results.put({"summary": summary})
+        await self.results.put(_DONE)
+
+    async def stream(self) -> AsyncIterator[str]:
+        while (item := await self.results.get()) is not _DONE:
+            yield json.dumps(item) + "\n"
+        self._streamed = True
+
+    def detach(self) -> None:
+        """
+        El cliente dejó de leer: el lote sigue y sus resultados se descartan
+        """
+        if not self._streamed and self._drain is None:
+            self._drain = asyncio.create_task(self._discard_results())
+            _running_batches.add(self._drain)
+            self._drain.add_done_callback(_running_batches.discard)
+
+    async def _discard_results(self) -> None:
+        while await self.results.get() is not _DONE:
+            pass
+
+    async def _persist(self) -> None:
+        records, self.records = self.records, []
+        if not records:
+            return
+        try:
+            with stage("persist"):
+                await storage.write_records(records)
+            self.persisted += len(records)
+        except Exception as e:
+            logger.exception("Error persistiendo lote de autorizaciones")
+            self.persistence_error = self.persistence_error or str(e)
+
+    async def _authorize(self, index: int, raw: object) -> None:
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            body = AuthorizationRequest.model_validate(raw)
+            if settings.rate_limit_enabled:
+                # Cada elemento consume su token global y de su merchant, igual
+                # que una autorización individual
+                retry_after, limited_by = await admission_controller.admit(body.merchant_id)
+                if limited_by is not None:
+                    scope_text = "global" if limited_by == "global" else f"del merchant {body.merchant_id}"
+                    await self._fail(
+                        index, f"Límite de requests {scope_text} excedido",
+                        status_code=429, retry_after=max(1, math.ceil(retry_after)),
+                    )
+                    return
+            result = await self.client.create_authorization(body)
+            akua = result.get("akua_response", {})
+            transaction = akua.get("transaction", {})
+
+            if not result.get("replayed"):
+                self.records.append(authorization_record(
+                    merchant_id=body.merchant_id,
+                    authorization_id=body.id or "auto-generated",
+                    payment_id=akua.get("payment_id"),
+                    transaction_id=transaction.get("id"),
+                    status=transaction.get("status", "UNKNOWN"),
+                    raw_response=akua,
+                    auth_type="PRE_AUTHORIZATION" if body.intent == "pre-authorization" else "AUTHORIZATION",
+                ))
+                # Los cobros ya hechos se guardan sin esperar al final del lote
+                if len(self.records) >= self.persist_chunk:
+                    await self._persist()
+            self.succeeded += 1
+            await self.results.put({
+                "index": index,
+                "status": "ok",
+                "id": body.id,
+                "payment_id": akua.get("payment_id"),
+                "transaction_status": transaction.get("status", "UNKNOWN"),
+                "replayed": result.get("replayed", False),
+            })
+        except ValidationError as e:
+            await self._fail(index, e.errors(include_url=False, include_context=False, include_input=False))
+        except Exception as e:
+            await self._fail(index, str(e))
+        finally:
+            self.semaphore.release()
+
+    async def _fail(self, index: int, error: object, **extra) -> None:
+        self.failed += 1
+        await self.results.put({"index": index, "status": "error", "error": error, **extra})
+
+
+class _BatchResponse(StreamingResponse):
+    """
+    NDJSON de resultados que empieza a enviarse mientras el lote todavía lee el
+    cuerpo. StreamingResponse escucha la desconexión en `receive` desde el
+    principio y se quedaría con el cuerpo: acá se escucha recién cuando el lote
+    terminó de leerlo.
+    """
+
+    def __init__(self, batch: _Batch) -> None:
+        super().__init__(batch.stream(), media_type="application/x-ndjson")
+        self.batch = batch
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            async with anyio.create_task_group() as task_group:
+
+                async def wrap(func) -> None:
+                    await func()
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(wrap, partial(self.stream_response, send))
+                await self.batch.intake_done.wait()
+                await wrap(partial(self.listen_for_disconnect, receive))
+        finally:
+            self.batch.detach()
+
+
+@router.post(
+    "/batch",
+    summary="Crear autorizaciones en lote",
+    description=(
+        "Recibe una lista JSON de autorizaciones (o NDJSON con `content-type: application/x-ndjson`) "
+        "y las envía a Akua en paralelo con concurrencia acotada. Responde NDJSON con una línea por "
+        "elemento a medida que termina y una línea final `summary`."
+    ),
+)
+async def create_authorization_batch(
+    request: Request,
+    concurrency: int = Query(
+        default=settings.batch_concurrency,
+        ge=1,
+        le=settings.batch_max_concurrency,
+        description="Autorizaciones simultáneas hacia Akua",
+    ),
+    client: AkuaClient = Depends(get_akua_client),
+):
+    batch = _Batch(client, concurrency, settings.batch_max_items, settings.batch_persist_chunk)
+    content_type = request.headers.get("content-type", "")
+    items = _ndjson_items(request) if "ndjson" in content_type else _json_items(request)
+
+    # Solo se espera el primer elemento (400 si el cuerpo no es una lista); el
+    # resto se lee en la tarea del lote mientras ya se envían los resultados
+    try:
+        first = await anext(items, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Cuerpo inválido: {e}")
+
+    task = asyncio.create_task(batch.run(first, items))
+    _running_batches.add(task)
+    task.add_done_callback(_running_batches.discard)
+    return _BatchResponse(batch)
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Query
+from app.infrastructure.cache import listing_cache
+from app.infrastructure.timing import TimedRoute
+
+router = APIRouter(prefix="/cache", tags=["cache"], route_class=TimedRoute)
+
+
+@router.get("/stats", summary="Contadores del cache de listados de Akua")
+async def cache_stats():
+    return listing_cache.stats()
+
+
+@router.delete("", summary="Invalidar el cache de listados de Akua")
+async def invalidate_cache(
+    resource: str | None = Query(default=None, description="organizations o merchants (todos si se omite)"),
+    organization_id: str | None = Query(default=None, description="Solo merchants de esta organización"),
+):
+    def matches(key: tuple) -> bool:
+        if resource and key[0] != resource:
+            return False
+        if organization_id and (key[0] != "merchants" or key[2] != organization_id):
+            return False
+        return True
+
+    return {"invalidated": listing_cache.invalidate(matches)}
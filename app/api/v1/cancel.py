@@ -1,26 +1,53 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
 from app.schemas.cancel import CancelRequest
 from app.infrastructure.akua_client import AkuaClient
-from app.infrastructure.database import save_cancellation
+from app.api.dependencies import get_akua_client, get_job_options
+from app.infrastructure.idempotency import IdempotencyConflict
+from app.infrastructure.payment_state import InvalidTransition
+from app.infrastructure.database import cancellation_record
+from app.infrastructure.write_behind import write_queue
+from app.infrastructure.passthrough import envelope_response
+from app.infrastructure.jobs import JobOptions, accepted_response, job_queue
+from app.infrastructure.timing import TimedRoute
 
-router = APIRouter(prefix="/cancel", tags=["cancel"])
+router = APIRouter(prefix="/cancel", tags=["cancel"], route_class=TimedRoute)
 
 # https://docs.akua.la/reference/authorize-cancel
 
 @router.post("/{payment_id}", summary="Cancelar un pago")
-async def cancel_payment(payment_id: str, body: CancelRequest):
-    client = AkuaClient()
+async def cancel_payment(
+    payment_id: str,
+    body: CancelRequest,
+    idempotency_key: str | None = Header(
+        default=None,
+        alias="Idempotency-Key",
+        description="Key de idempotencia. Si se omite se deriva del contenido del request",
+    ),
+    client: AkuaClient = Depends(get_akua_client),
+    options: JobOptions = Depends(get_job_options),
+):
+    if options.requested:
+        job = await job_queue.enqueue(
+            "cancel", body.model_dump(exclude_none=True), idempotency_key,
+            payment_id=payment_id, callback_url=options.callback_url,
+        )
+        return accepted_response(job)
+
     try:
-        result = await client.cancel_payment(payment_id, body)
+        result = await client.cancel_payment(payment_id, body, idempotency_key)
         akua = result.get("akua_response", {})
 
-        save_cancellation(
-            payment_id=akua.get("payment_id"),
-            transaction_id=akua.get("transaction", {}).get("id"),
-            status=akua.get("transaction", {}).get("status", "UNKNOWN"),
-            raw_response=akua,
-        )
+        # Un duplicado respondido desde el registro de idempotencia ya fue persistido
+        if not result.get("replayed"):
+            await write_queue.submit(cancellation_record(
+                payment_id=akua.get("payment_id"),
+                transaction_id=akua.get("transaction", {}).get("id"),
+                status=akua.get("transaction", {}).get("status", "UNKNOWN"),
+                raw_response=akua,
+            ))
 
+    except (IdempotencyConflict, InvalidTransition) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=502, detail=str(e))
-    return result
\ No newline at end of file
+    return envelope_response(result)
\ No newline at end of file
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from app.schemas.capture import CaptureRequest
 from app.infrastructure.akua_client import AkuaClient
-from app.infrastructure.database import save_capture
+from app.api.dependencies import get_akua_client, get_job_options
+from app.infrastructure.idempotency import IdempotencyConflict
+from app.infrastructure.payment_state import InvalidTransition
+from app.infrastructure.database import capture_record
+from app.infrastructure.write_behind import write_queue
+from app.infrastructure.passthrough import envelope_response
+from app.infrastructure.jobs import JobOptions, accepted_response, job_queue
+from app.infrastructure.timing import TimedRoute
 
-router = APIRouter(prefix="/capture", tags=["capture"])
+router = APIRouter(prefix="/capture", tags=["capture"], route_class=TimedRoute)
 
 @router.post("/{payment_id}", summary="Capturar un pago")
 async def capture_payment(
@@ -17,8 +24,14 @@ async def capture_payment(
         default=None,
         description="Moneda del monto a capturar. Si se omite, se usa la moneda del pago",
     ),
+    idempotency_key: str | None = Header(
+        default=None,
+        alias="Idempotency-Key",
+        description="Key de idempotencia. Si se omite se deriva del contenido del request",
+    ),
+    client: AkuaClient = Depends(get_akua_client),
+    options: JobOptions = Depends(get_job_options),
 ):
-    client = AkuaClient()
 
     if value is not None or currency is not None:
         if body.amount is None:
@@ -32,18 +45,29 @@ async def capture_payment(
             if currency is not None:
                 body.amount.currency = currency
 
+    if options.requested:
+        job = await job_queue.enqueue(
+            "capture", body.model_dump(exclude_none=True), idempotency_key,
+            payment_id=payment_id, callback_url=options.callback_url,
+        )
+        return accepted_response(job)
+
     try:
-        result = await client.capture_payment(payment_id, body)
+        result = await client.capture_payment(payment_id, body, idempotency_key)
         akua = result.get("akua_response", {})
 
-        save_capture(
-            payment_id=akua.get("payment_id"),
-            transaction_id=akua.get("transaction", {}).get("id"),
-            amount=str(akua.get("transaction", {}).get("amount")) if akua.get("transaction") else None,
-            status=akua.get("transaction", {}).get("status", "UNKNOWN"),
-            raw_response=akua,
-        )
+        # Un duplicado respondido desde el registro de idempotencia ya fue persistido
+        if not result.get("replayed"):
+            await write_queue.submit(capture_record(
+                payment_id=akua.get("payment_id"),
+                transaction_id=akua.get("transaction", {}).get("id"),
+                amount=str(akua.get("transaction", {}).get("amount")) if akua.get("transaction") else None,
+                status=akua.get("transaction", {}).get("status", "UNKNOWN"),
+                raw_response=akua,
+            ))
+    except (IdempotencyConflict, InvalidTransition) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=502, detail=str(e))
 
-    return result
\ No newline at end of file
+    return envelope_response(result)
\ No newline at end of file
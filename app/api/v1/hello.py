@@ -1,6 +1,11 @@
 from fastapi import APIRouter
+from app.infrastructure.write_behind import write_queue
+from app.infrastructure.capture_scheduler import capture_scheduler
+from app.infrastructure.jobs import job_queue
+from app.infrastructure.resilience import upstream_stats
+from app.infrastructure.timing import TimedRoute
 
-router = APIRouter(prefix="/health", tags=["Healthcheck"])
+router = APIRouter(prefix="/health", tags=["Healthcheck"], route_class=TimedRoute)
 
 
 @router.get("", summary="Servicio de healthcheck del API", status_code=200)
@@ -9,4 +14,23 @@ async def health_check():
         "status": "ok",
         "message": "Servicio operativo",
         "component": "Akua Integration PoC"
-    }
\ No newline at end of file
+    }
+
+@router.get("/persistence", summary="Estado de la cola de persistencia (write-behind)")
+async def persistence_stats():
+    return write_queue.stats()
+
+
+@router.get("/upstream", summary="Estado de los circuit breakers y reintentos hacia Akua")
+async def upstream_health():
+    return upstream_stats.snapshot()
+
+
+@router.get("/auto-capture", summary="Estado del scheduler de capturas automáticas")
+async def auto_capture_stats():
+    return capture_scheduler.stats()
+
+
+@router.get("/jobs", summary="Estado de la cola de jobs del modo asíncrono")
+async def jobs_stats():
+    return job_queue.stats()
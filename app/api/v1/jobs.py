@@ -0,0 +1,17 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException
+
+from app.infrastructure.jobs import get_job, job_envelope
+from app.infrastructure.passthrough import envelope_response
+from app.infrastructure.timing import TimedRoute
+
+router = APIRouter(prefix="/jobs", tags=["jobs"], route_class=TimedRoute)
+
+
+@router.get("/{job_id}", summary="Estado de una operación en modo asíncrono")
+async def get_job_status(job_id: str):
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job no encontrado: {job_id}")
+    return envelope_response(job_envelope(job))
@@ -1,7 +1,13 @@
-from fastapi import APIRouter, HTTPException, Query
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from app.infrastructure.akua_client import AkuaClient
+from app.api.dependencies import get_akua_client
+from app.infrastructure.passthrough import envelope_response
+from app.infrastructure.timing import TimedRoute
 
-router = APIRouter(prefix="/v1", tags=["Merchants"])
+router = APIRouter(prefix="/v1", tags=["Merchants"], route_class=TimedRoute)
 
 @router.get(
     "/merchants",
@@ -14,18 +20,55 @@ async def list_merchants(
     organization_id: str = Query(..., description="ID de la organización en Akua"),
     page: int = Query(1, ge=1, description="Número de página"),
     page_size: int = Query(20, ge=1, le=100, description="Tamaño de página"),
+    akua_client: AkuaClient = Depends(get_akua_client),
 ):
 
-    akua_client = AkuaClient()
-
     try:
-        return await akua_client.list_merchants(
+        return envelope_response(await akua_client.list_merchants(
             organization_id=organization_id,
             page=page,
             page_size=page_size,
+        ))
+    except Exception as e:
+        raise HTTPException(
+            status_code=502,
+            detail=f"Error consultando merchants en Akua: {e}",
         )
+
+
+@router.get(
+    "/merchants/export",
+    summary="Exportar todos los comercios de una organización (NDJSON)",
+    description=(
+        "Recorre todas las páginas de merchants en Akua y los entrega como NDJSON "
+        "(un merchant por línea) a medida que llegan"
+    ),
+)
+async def export_merchants(
+    organization_id: str = Query(..., description="ID de la organización en Akua"),
+    page_size: int = Query(100, ge=1, le=100, description="Tamaño de página hacia Akua"),
+    akua_client: AkuaClient = Depends(get_akua_client),
+):
+    merchants = akua_client.iter_merchants(organization_id, page_size=page_size)
+
+    # La primera página se pide antes de responder para poder devolver 502 si falla
+    try:
+        first = await anext(merchants, None)
     except Exception as e:
         raise HTTPException(
             status_code=502,
             detail=f"Error consultando merchants en Akua: {e}",
-        )
\ No newline at end of file
+        )
+
+    async def ndjson():
+        if first is None:
+            return
+        yield json.dumps(first) + "\n"
+        try:
+            async for merchant in merchants:
+                yield json.dumps(merchant) + "\n"
+        except Exception as e:
+            # Los headers ya se enviaron: el error se informa como última línea
+            yield json.dumps({"error": f"Error consultando merchants en Akua: {e}"}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
@@ -0,0 +1,106 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.infrastructure.cache import listing_cache
+from app.infrastructure.capture_scheduler import capture_scheduler
+from app.infrastructure.jobs import job_queue
+from app.infrastructure.ledger import payment_ledger
+from app.infrastructure.metrics import registry
+from app.infrastructure.resilience import CLOSED, HALF_OPEN, upstream_stats
+from app.infrastructure.write_behind import write_queue
+
+router = APIRouter(tags=["Métricas"])
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+_BREAKER_STATE = {CLOSED: 0, HALF_OPEN: 1}
+
+
+def _upstream_metrics() -> list:
+    snapshot = upstream_stats.snapshot()
+
+    def per_operation(field: str) -> list:
+        return [({"operation": op}, values.get(field, 0)) for op, values in snapshot.items()]
+
+    return [
+        ("akua_upstream_retries_total", "counter", "Reintentos de llamadas a Akua", per_operation("retries")),
+        ("akua_upstream_hedged_total", "counter", "GETs a Akua que dispararon hedging", per_operation("hedged_requests")),
+        (
+            "akua_circuit_state", "gauge", "Estado del circuit breaker (0 cerrado, 1 en prueba, 2 abierto)",
+            [({"operation": op}, _BREAKER_STATE.get(values.get("state"), 2)) for op, values in snapshot.items()
+             if "state" in values],
+        ),
+        ("akua_circuit_opened_total", "counter", "Veces que se abrió el circuit breaker", per_operation("times_opened")),
+        ("akua_circuit_rejected_total", "counter", "Llamadas rechazadas con el circuito abierto", per_operation("rejected")),
+    ]
+
+
+def _cache_metrics() -> list:
+    stats = listing_cache.stats()
+    return [
+        (
+            "listing_cache_requests_total", "counter", "Lecturas del cache de listados por resultado",
+            [({"result": result}, stats[field]) for result, field in (("hit", "hits"), ("stale", "stale_hits"), ("miss", "misses"))],
+        ),
+        ("listing_cache_evictions_total", "counter", "Entradas desalojadas por LRU", [({}, stats["evictions"])]),
+        (
+            "listing_cache_refreshes_total", "counter", "Refrescos en segundo plano por resultado",
+            [({"result": "ok"}, stats["refreshes"]), ({"result": "error"}, stats["refresh_errors"])],
+        ),
+        ("listing_cache_entries", "gauge", "Entradas en el cache de listados", [({}, stats["entries"])]),
+    ]
+
+
+def _write_queue_metrics() -> list:
+    stats = write_queue.stats()
+    return [
+        ("write_behind_queue_depth", "gauge", "Registros pendientes en la cola de persistencia", [({}, stats["queue_depth"])]),
+        ("write_behind_flushed_records_total", "counter", "Registros persistidos por la cola", [({}, stats["flushed_records"])]),
+        ("write_behind_failed_records_total", "counter", "Registros que no se pudieron persistir", [({}, stats["failed_records"])]),
+    ]
+
+
+def _ledger_metrics() -> list:
+    return [(
+        "payment_ledger_rejections_total", "counter", "Operaciones rechazadas localmente por payment_ledger",
+        [({}, payment_ledger.rejected)],
+    )]
+
+
+def _auto_capture_metrics() -> list:
+    stats = capture_scheduler.stats()
+    return [
+        ("auto_capture_pending", "gauge", "Capturas automáticas programadas pendientes", [({}, stats["pending"])]),
+        (
+            "auto_capture_total", "counter", "Capturas automáticas por resultado",
+            [({"result": result}, stats[result]) for result in ("captured", "skipped", "failed", "retried")],
+        ),
+    ]
+
+
+def _job_metrics() -> list:
+    stats = job_queue.stats()
+    return [
+        ("jobs_queued", "gauge", "Jobs del modo asíncrono esperando un worker", [({}, stats["queued"])]),
+        ("jobs_busy_workers", "gauge", "Workers ejecutando un job", [({}, stats["busy_workers"])]),
+        (
+            "jobs_completed_total", "counter", "Jobs terminados por resultado",
+            [({"result": "succeeded"}, stats["succeeded"]), ({"result": "failed"}, stats["failed"])],
+        ),
+        (
+            "jobs_callbacks_total", "counter", "Callbacks de jobs por resultado",
+            [({"result": "delivered"}, stats["callbacks_delivered"]), ({"result": "failed"}, stats["callbacks_failed"])],
+        ),
+    ]
+
+
+registry.add_collector(_upstream_metrics)
+registry.add_collector(_cache_metrics)
+registry.add_collector(_write_queue_metrics)
+registry.add_collector(_ledger_metrics)
+registry.add_collector(_auto_capture_metrics)
+registry.add_collector(_job_metrics)
+
+
+@router.get("/metrics", summary="Métricas en formato de texto de Prometheus", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from app.infrastructure.akua_client import AkuaClient
+from app.api.dependencies import get_akua_client
+from app.infrastructure.passthrough import envelope_response
+from app.infrastructure.timing import TimedRoute
 
-router = APIRouter(prefix="/v1", tags=["Organizations"])
+router = APIRouter(prefix="/v1", tags=["Organizations"], route_class=TimedRoute)
 
 @router.get("/organizations")
-async def list_organizations():
-    client = AkuaClient()
+async def list_organizations(client: AkuaClient = Depends(get_akua_client)):
     """
     Lista las organizaciones configuradas en Akua para el token actual.
 
@@ -13,7 +15,7 @@ async def list_organizations():
     - En modo REAL consulta a Akua y devuelve el JSON tal cual.
     """
     try:
-        return await client.list_organizations()
+        return envelope_response(await client.list_organizations())
     except Exception as e:
         raise HTTPException(
             status_code=502,
@@ -0,0 +1,81 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.infrastructure.export import MEDIA_TYPES, UnsupportedFormat, check_format, stream_export
+from app.infrastructure.queries import InvalidCursor
+from app.infrastructure.storage import storage
+from app.infrastructure.timing import TimedRoute, stage
+
+router = APIRouter(prefix="/payments", tags=["payments"], route_class=TimedRoute)
+
+TRANSACTION_TYPES = "AUTHORIZATION, PRE_AUTHORIZATION, CAPTURE, CANCELLATION o REFUND"
+
+
+@router.get("", summary="Listar transacciones registradas localmente")
+async def list_payments(
+    merchant_id: str | None = Query(default=None, description="Filtrar por comercio"),
+    status: str | None = Query(default=None, description="Filtrar por estado (ej: APPROVED)"),
+    type: str | None = Query(default=None, description=f"Tipo de transacción: {TRANSACTION_TYPES}"),
+    created_from: str | None = Query(default=None, description="Desde (ISO 8601, inclusive)"),
+    created_to: str | None = Query(default=None, description="Hasta (ISO 8601, exclusivo)"),
+    cursor: str | None = Query(default=None, description="Cursor `next_cursor` de la página anterior"),
+    limit: int = Query(default=50, ge=1, le=500, description="Tamaño de página"),
+    include_raw: bool = Query(default=False, description="Incluir la respuesta completa de Akua"),
+):
+    """
+    Consulta el histórico local (SQLite o PostgreSQL) sin llamar a Akua. Ordenado del más reciente
+    al más antiguo; usar `next_cursor` para pedir la siguiente página.
+    """
+    try:
+        with stage("db"):
+            items, next_cursor = await storage.list_transactions(
+                merchant_id=merchant_id,
+                status=status,
+                tx_type=type,
+                created_from=created_from,
+                created_to=created_to,
+                cursor=cursor,
+                limit=limit,
+                include_raw=include_raw,
+            )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.get("/export", summary="Exportar el histórico local a CSV o Parquet")
+async def export_payments(
+    format: str = Query(default="csv", description="csv o parquet (requiere pyarrow)"),
+    merchant_id: str | None = Query(default=None, description="Filtrar por comercio"),
+    created_from: str | None = Query(default=None, description="Desde (ISO 8601, inclusive)"),
+    created_to: str | None = Query(default=None, description="Hasta (ISO 8601, exclusivo)"),
+):
+    """
+    Descarga todas las transacciones del filtro como un único archivo. Las filas
+    se leen con un cursor en bloques de EXPORT_CHUNK_SIZE y se envían a medida
+    que se codifican, sin cargar las tablas en memoria.
+    """
+    try:
+        check_format(format)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        stream_export(format, settings.export_chunk_size, merchant_id, created_from, created_to),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="transactions.{format}"'},
+    )
+
+
+@router.get("/{payment_id}", summary="Consultar un pago registrado localmente")
+async def get_payment_detail(
+    payment_id: str,
+    include_raw: bool = Query(default=False, description="Incluir la respuesta completa de Akua"),
+):
+    with stage("db"):
+        payment = await storage.get_payment(payment_id, include_raw)
+    if payment is None:
+        raise HTTPException(status_code=404, detail=f"Pago {payment_id} no encontrado")
+    return payment
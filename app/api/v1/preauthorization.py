@@ -1,9 +1,20 @@
-from fastapi import APIRouter, HTTPException, Query
+import logging
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from app.config import settings
 from app.schemas.authorization import AuthorizationRequest
 from app.infrastructure.akua_client import AkuaClient
-from app.infrastructure.database import save_authorization
+from app.api.dependencies import get_akua_client
+from app.infrastructure.idempotency import IdempotencyConflict
+from app.infrastructure.database import authorization_record
+from app.infrastructure.capture_scheduler import capture_scheduler, parse_capture_after
+from app.infrastructure.write_behind import write_queue
+from app.infrastructure.passthrough import envelope_response
+from app.infrastructure.timing import TimedRoute
+
+logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/preauthorization", tags=["preauthorization"])
+router = APIRouter(prefix="/preauthorization", tags=["preauthorization"], route_class=TimedRoute)
 
 @router.post("", summary="Crear una pre-autorización")
 async def create_preauthorization(
@@ -12,14 +23,33 @@ async def create_preauthorization(
     card_number: str = Query(default="5200000000000007", description="Número de tarjeta (ej: 5200000000000007)"),
     cvv: str = Query(default="123", description="Código CVV (ej: 123)"),
     expiration_month: str = Query(default="12", description="Mes de expiración (ej: 12)"),
-    expiration_year: str = Query(default="26", description="Año de expiración (ej: 26)")
+    expiration_year: str = Query(default="26", description="Año de expiración (ej: 26)"),
+    capture_after: str | None = Query(
+        default=None,
+        description=(
+            "Captura automática: segundos desde ahora o fecha ISO 8601 (UTC si no trae zona). "
+            "Si se omite, la captura queda a cargo del cliente"
+        ),
+    ),
+    idempotency_key: str | None = Header(
+        default=None,
+        alias="Idempotency-Key",
+        description="Key de idempotencia. Sin key ni `id` la autorización no se deduplica",
+    ),
+    client: AkuaClient = Depends(get_akua_client),
 ):
-    client = AkuaClient()
+
+    due = None
+    if capture_after:
+        try:
+            due = parse_capture_after(capture_after)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"capture_after inválido: {e}")
 
     body = AuthorizationRequest(
         intent="pre-authorization",
         amount={"value": amount_value, "currency": "USD"},
-        merchant_id="mer-d43nagkm4gl7c1b8dqhg",
+        merchant_id=settings.preauthorization_merchant_id,
         instrument={
             "type": "CARD",
             "card": {
@@ -33,20 +63,36 @@ async def create_preauthorization(
         capture={"mode": "MANUAL", "capture_after": ""},
     )
 
+    scheduled_payment_id = None
     try:
-        result = await client.create_authorization(body)
+        result = await client.create_authorization(body, idempotency_key)
         akua = result.get("akua_response", {})
 
-        save_authorization(
-            merchant_id=body.merchant_id,
-            authorization_id=body.id or "auto-generated",
-            payment_id=akua.get("payment_id"),
-            transaction_id=akua.get("transaction", {}).get("id"),
-            status=akua.get("transaction", {}).get("status", "UNKNOWN"),
-            raw_response=akua,
-            auth_type="PRE_AUTHORIZATION",
-        )
+        # Un duplicado respondido desde el registro de idempotencia ya fue persistido
+        if not result.get("replayed"):
+            await write_queue.submit(authorization_record(
+                merchant_id=body.merchant_id,
+                authorization_id=body.id or "auto-generated",
+                payment_id=akua.get("payment_id"),
+                transaction_id=akua.get("transaction", {}).get("id"),
+                status=akua.get("transaction", {}).get("status", "UNKNOWN"),
+                raw_response=akua,
+                auth_type="PRE_AUTHORIZATION",
+            ))
+            if due is not None and akua.get("transaction", {}).get("status") == "APPROVED":
+                scheduled_payment_id = akua.get("payment_id")
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=502, detail=str(e))
 
-    return result
\ No newline at end of file
+    if scheduled_payment_id:
+        # El pago ya existe en Akua: un fallo al programar la captura no es un 502
+        try:
+            await capture_scheduler.schedule(scheduled_payment_id, due, body.merchant_id)
+            result["capture_after"] = due.isoformat()
+        except Exception as e:
+            logger.exception("Error programando la captura automática de %s", scheduled_payment_id)
+            result["capture_schedule_error"] = f"No se pudo programar la captura automática: {e}"
+
+    return envelope_response(result)
\ No newline at end of file
@@ -1,17 +1,53 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
 from app.schemas.refund import RefundRequest
 from app.infrastructure.akua_client import AkuaClient
+from app.api.dependencies import get_akua_client, get_job_options
+from app.infrastructure.idempotency import IdempotencyConflict
+from app.infrastructure.payment_state import InvalidTransition
+from app.infrastructure.database import refund_record
+from app.infrastructure.write_behind import write_queue
+from app.infrastructure.passthrough import envelope_response
+from app.infrastructure.jobs import JobOptions, accepted_response, job_queue
+from app.infrastructure.timing import TimedRoute
 
-router = APIRouter(prefix="/refund", tags=["refund"])
+router = APIRouter(prefix="/refund", tags=["refund"], route_class=TimedRoute)
 
 
 @router.post("/{payment_id}", summary="Reembolsar un pago")
-async def refund_payment(payment_id: str, body: RefundRequest):
-    client = AkuaClient()
+async def refund_payment(
+    payment_id: str,
+    body: RefundRequest,
+    idempotency_key: str | None = Header(
+        default=None,
+        alias="Idempotency-Key",
+        description="Key de idempotencia. Si se omite se deriva del contenido del request",
+    ),
+    client: AkuaClient = Depends(get_akua_client),
+    options: JobOptions = Depends(get_job_options),
+):
+
+    if options.requested:
+        job = await job_queue.enqueue(
+            "refund", body.model_dump(exclude_none=True), idempotency_key,
+            payment_id=payment_id, callback_url=options.callback_url,
+        )
+        return accepted_response(job)
 
     try:
-        result = await client.refund_payment(payment_id, body)
+        result = await client.refund_payment(payment_id, body, idempotency_key)
+        akua = result.get("akua_response", {})
+
+        # Un duplicado respondido desde el registro de idempotencia ya fue persistido
+        if not result.get("replayed"):
+            await write_queue.submit(refund_record(
+                payment_id=akua.get("payment_id") or payment_id,
+                transaction_id=akua.get("transaction", {}).get("id"),
+                status=akua.get("transaction", {}).get("status", "UNKNOWN"),
+                raw_response=akua,
+            ))
+    except (IdempotencyConflict, InvalidTransition) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=502, detail=str(e))
 
-    return result
\ No newline at end of file
+    return envelope_response(result)
\ No newline at end of file
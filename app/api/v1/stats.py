@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException, Query
+
+from app.infrastructure.rollups import InvalidRange, stats_window
+from app.infrastructure.storage import storage
+from app.infrastructure.timing import TimedRoute, stage
+
+router = APIRouter(prefix="/stats", tags=["stats"], route_class=TimedRoute)
+
+
+@router.get("", summary="Volumen por comercio, por hora o por día")
+async def volume_stats(
+    merchant_id: str | None = Query(default=None, description="Comercio (sin filtro: todos sumados)"),
+    granularity: str = Query(default="hour", description="hour o day"),
+    created_from: str | None = Query(default=None, description="Desde (ISO 8601; por defecto 24 horas o 30 días atrás)"),
+    created_to: str | None = Query(default=None, description="Hasta (ISO 8601, exclusivo; por defecto ahora)"),
+):
+    """
+    Cantidad y monto de transacciones por bucket, tipo (AUTHORIZATION, CAPTURE,
+    CANCELLATION, ...) y estado, leídos de los rollups que se actualizan con cada
+    escritura: el costo depende de la cantidad de buckets, no de transacciones.
+    """
+    try:
+        start, end = stats_window(granularity, created_from, created_to)
+    except InvalidRange as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    with stage("db"):
+        buckets = await storage.volume_stats(granularity, merchant_id, start, end)
+    return {"merchant_id": merchant_id, "granularity": granularity, "from": start, "to": end, "buckets": buckets}
@@ -1,50 +1,37 @@
-import requests
-from fastapi import APIRouter, HTTPException
-from app.config import settings
+import httpx
+from fastapi import APIRouter, Depends, HTTPException
+from app.api.dependencies import get_http_client
+from app.infrastructure.akua_auth import AkuaTokenError, token_manager
+from app.infrastructure.timing import TimedRoute
 
-router = APIRouter(prefix="/akua", tags=["akua-token"])
+router = APIRouter(prefix="/akua", tags=["akua-token"], route_class=TimedRoute)
 
 
 @router.get("/token/test", summary="Obtener Credenciales Akua válidas")
-def test_akua_token():
+async def test_akua_token(http_client: httpx.AsyncClient = Depends(get_http_client)):
     """
     Este endpoint valida que el Client ID y Client Secret permitan obtener
     un access_token real desde Akua.
+
+    Usa el mismo token cacheado que los flujos de pago, por lo que no fuerza
+    una llamada a /oauth/token si el token vigente sigue siendo válido.
     """
 
-    if not settings.akua_client_id or not settings.akua_client_secret:
+    if not token_manager.has_credentials:
         raise HTTPException(
             status_code=400,
             detail="AKUA_CLIENT_ID o AKUA_CLIENT_SECRET no están configurados en .env"
         )
 
-    url = f"{settings.akua_base_url}/oauth/token"
-
-    payload = {
-        "grant_type": "client_credentials",
-        "audience": settings.akua_base_url,
-        "client_id": settings.akua_client_id,
-        "client_secret": settings.akua_client_secret
-    }
-
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json"
-    }
-
     try:
-        response = requests.post(url, json=payload, headers=headers)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error conectando con Akua: {e}")
-
-    if response.status_code != 200:
-        raise HTTPException(status_code=response.status_code, detail=response.text)
-
-    data = response.json()
+        info = await token_manager.token_info(http_client)
+    except AkuaTokenError as e:
+        raise HTTPException(status_code=e.status_code or 500, detail=str(e))
 
     return {
         "status": "ok",
-        "token_prefix": data["access_token"][:20] + "...",
-        "expires_in": data.get("expires_in"),
-        "token_type": data.get("token_type")
-    }
\ No newline at end of file
+        "token_prefix": info["access_token"][:20] + "...",
+        "expires_in": info["expires_in"],
+        "remaining": info["remaining"],
+        "token_type": "Bearer"
+    }
@@ -0,0 +1,50 @@
+"""
+Recalcula los rollups de volumen por comercio (merchant_volume_hourly y
+merchant_volume_daily) desde las tablas de registros.
+
+En SQLite la migración que los crea ya los llena; este comando sirve para
+PostgreSQL (tablas creadas sobre registros existentes) o para rehacerlos si
+se cargaron registros por fuera de la API. El recálculo es una sola
+transacción: las escrituras de la API esperan a que termine y suman sus
+deltas sobre el resultado.
+
+Uso:
+    python -m app.commands.backfill_rollups
+    STORAGE_BACKEND=postgres python -m app.commands.backfill_rollups
+"""
+import argparse
+import asyncio
+import time
+
+from dotenv import load_dotenv
+
+
+async def backfill() -> None:
+    from app.infrastructure.storage import storage
+
+    await storage.start()
+    try:
+        await storage.rebuild_rollups()
+    finally:
+        await storage.close()
+
+
+def main() -> None:
+    load_dotenv()
+    from app.infrastructure.database import close_connections, init_db
+    from app.infrastructure.storage import storage
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    init_db()
+    started = time.perf_counter()
+    try:
+        asyncio.run(backfill())
+    finally:
+        close_connections()
+    print(f"Rollups recalculados ({storage.name}) en {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
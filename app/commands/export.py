@@ -0,0 +1,83 @@
+"""
+Exportación del histórico local de transacciones a CSV o Parquet.
+
+Con --out-dir escribe una partición por día completo (date=YYYY-MM-DD) y las
+corridas siguientes siguen desde el último día exportado; con --output escribe
+un único archivo.
+Las filas se leen con un cursor por bloques: la memoria no depende del
+tamaño de las tablas.
+
+Uso:
+    python -m app.commands.export --out-dir exports/ --format parquet
+    python -m app.commands.export --output merchant.csv --merchant-id mer-1 --from 2025-01-01 --to 2025-02-01
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import date
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+
+async def export(args: argparse.Namespace) -> dict | None:
+    from app.infrastructure.export import export_partitions, stream_export
+    from app.infrastructure.storage import storage
+
+    await storage.start()
+    try:
+        if args.out_dir:
+            return await export_partitions(
+                Path(args.out_dir),
+                args.format,
+                args.chunk_size,
+                merchant_id=args.merchant_id,
+                start=date.fromisoformat(args.created_from) if args.created_from else None,
+                end=date.fromisoformat(args.created_to) if args.created_to else None,
+            )
+
+        stream = stream_export(args.format, args.chunk_size, args.merchant_id, args.created_from, args.created_to)
+        handle = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            async for data in stream:
+                handle.write(data)
+        finally:
+            if handle is not sys.stdout.buffer:
+                handle.close()
+        return None
+    finally:
+        await storage.close()
+
+
+def main() -> None:
+    load_dotenv()
+    from app.config import settings
+    from app.infrastructure.database import close_connections, init_db
+    from app.infrastructure.export import FORMATS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--out-dir", help="Carpeta con una partición por día (incremental)")
+    target.add_argument("--output", help="Archivo único ('-' para stdout)")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--merchant-id", default=None)
+    parser.add_argument("--from", dest="created_from", default=None, help="Desde (ISO 8601, inclusive)")
+    parser.add_argument("--to", dest="created_to", default=None,
+                        help="Hasta (ISO 8601, exclusivo; con --out-dir por defecto hoy: solo días completos)")
+    parser.add_argument("--chunk-size", type=int, default=settings.export_chunk_size, help="Filas por bloque del cursor")
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        summary = asyncio.run(export(args))
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        close_connections()
+    if summary is not None:
+        print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
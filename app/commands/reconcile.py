@@ -0,0 +1,68 @@
+"""
+Conciliación incremental entre el registro local y Akua.
+
+Recorre por bloques los pagos en estado no final del payment_ledger, consulta
+su estado actual en Akua (GET /v1/payments/{id}) con concurrencia acotada,
+corrige ledger y estados de transacciones y escribe un reporte JSONL con las
+diferencias. Una corrida interrumpida se retoma desde el último checkpoint.
+
+Uso:
+    python -m app.commands.reconcile --concurrency 8 --chunk-size 200
+    python -m app.commands.reconcile --dry-run --restart
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from dotenv import load_dotenv
+
+
+async def reconcile(args: argparse.Namespace) -> dict:
+    from app.infrastructure.akua_auth import token_manager
+    from app.infrastructure.akua_client import AkuaClient
+    from app.infrastructure.http_client import build_http_client
+    from app.infrastructure.reconciliation import Reconciler
+    from app.infrastructure.storage import storage
+
+    await storage.start()
+    http_client = build_http_client()
+    try:
+        reconciler = Reconciler(
+            AkuaClient(http_client), chunk_size=args.chunk_size, concurrency=args.concurrency, dry_run=args.dry_run
+        )
+        return await reconciler.run(restart=args.restart, max_payments=args.max_payments)
+    finally:
+        await token_manager.aclose()
+        await http_client.aclose()
+        await storage.close()
+
+
+def main() -> None:
+    load_dotenv()
+    from app.config import settings
+    from app.infrastructure.database import DB_PATH, close_connections, init_db
+    from app.infrastructure.shared_state import is_leader
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=settings.reconcile_chunk_size, help="Pagos por checkpoint")
+    parser.add_argument("--concurrency", type=int, default=settings.reconcile_concurrency, help="Consultas simultáneas a Akua")
+    parser.add_argument("--max-payments", type=int, default=None, help="Corta después de N pagos (la siguiente corrida sigue)")
+    parser.add_argument("--dry-run", action="store_true", help="Solo reporta, sin corregir")
+    parser.add_argument("--restart", action="store_true", help="Empieza desde el principio aunque haya una corrida sin terminar")
+    args = parser.parse_args()
+
+    # Una sola conciliación a la vez por base
+    if not is_leader(DB_PATH.with_name(DB_PATH.name + ".reconcile.lock")):
+        sys.exit("Ya hay una conciliación en curso")
+
+    init_db()
+    try:
+        summary = asyncio.run(reconcile(args))
+    finally:
+        close_connections()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
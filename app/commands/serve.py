@@ -0,0 +1,56 @@
+"""
+Servidor multi-proceso: N workers de uvicorn (por defecto uno por núcleo).
+
+Antes de crear los workers aplica las migraciones una sola vez y activa el
+estado compartido entre procesos (token de Akua, cache de listados y, si no
+se configuró otro, el backend SQLite del control de admisión).
+
+Uso:
+    python -m app.commands.serve --workers 4 --port 8000
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+
+def default_workers() -> int:
+    return int(os.getenv("WEB_CONCURRENCY") or 0) or os.cpu_count() or 1
+
+
+def main() -> None:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=None, help="Por defecto WEB_CONCURRENCY o la cantidad de núcleos")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", action="store_true")
+    args = parser.parse_args()
+    workers = args.workers or default_workers()
+
+    # Antes de importar app.config: los workers heredan el entorno
+    if workers > 1:
+        os.environ.setdefault("SHARED_STATE", "true")
+        os.environ.setdefault("RATE_LIMIT_BACKEND", "sqlite")
+
+    import uvicorn
+
+    from app.infrastructure.database import close_connections, init_db
+
+    init_db()
+    close_connections()
+
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        log_level=args.log_level,
+        access_log=not args.no_access_log,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import asyncio
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.infrastructure.database import DB_PATH
+from app.infrastructure.ledger import payment_ledger
+from app.infrastructure.metrics import admission_rejections
+from app.infrastructure.timing import stage
+
+GLOBAL_KEY = "global"
+
+# Cada cuánto (segundos) se descartan los buckets que ya se rellenaron: uno
+# lleno equivale a uno inexistente, así no crecen con cada merchant visto
+SWEEP_INTERVAL = 60.0
+
+# Rutas que llegan a Akua. Grupo "payment": el merchant se toma del ledger;
+# grupo "body": del merchant_id del JSON (sin pasar por Pydantic); grupo
+# "preauthorization": el merchant fijo con el que esa ruta llama a Akua. El
+# lote (/v1/authorization/batch) se admite por elemento en su router
+_ADMITTED_ROUTES = re.compile(
+    r"^/v1/(?:(?P<body>authorization)|(?P<preauthorization>preauthorization)"
+    r"|(?:capture|cancel|refund)/(?P<payment>[^/]+))/?$"
+)
+
+Limit = tuple[str, float, float]  # (clave, tokens por segundo, burst)
+
+
+class MemoryBuckets:
+    """
+    Token buckets en memoria del proceso (un solo worker de uvicorn)
+    """
+
+    def __init__(self) -> None:
+        # clave -> (tokens, actualizado, momento en que vuelve a estar lleno)
+        self._buckets: dict[str, tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def take(self, limits: list[Limit]) -> tuple[float, str | None]:
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._next_sweep:
+                self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+                self._next_sweep = now + SWEEP_INTERVAL
+            state = {key: _refill(self._buckets.get(key), rate, burst, now) for key, rate, burst in limits}
+            retry_after, limited_by = _consume(limits, state)
+            for key, rate, burst in limits:
+                self._buckets[key] = (state[key], now, _full_at(state[key], rate, burst, now))
+        return retry_after, limited_by
+
+
+class SQLiteBuckets:
+    """
+    Token buckets en un archivo SQLite compartido por todos los workers de
+    uvicorn de la máquina. Va en un archivo propio (RATE_LIMIT_DB_PATH) para no
+    competir por el lock de escritura con la base de pagos; su contenido es
+    efímero, así que se escribe sin fsync. Los buckets que ya se rellenaron se
+    borran cada SWEEP_INTERVAL segundos.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._next_sweep = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL DEFAULT 0)"
+            )
+            # Archivos creados antes de que existiera full_at
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(token_buckets)")}
+            if "full_at" not in columns:
+                try:
+                    conn.execute("ALTER TABLE token_buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0")
+                except sqlite3.OperationalError:
+                    pass  # otro worker la agregó entre medio
+            self._local.conn = conn
+        return conn
+
+    def take(self, limits: list[Limit]) -> tuple[float, str | None]:
+        conn = self._connection()
+        keys = [key for key, _rate, _burst in limits]
+        # BEGIN IMMEDIATE: leer y descontar es atómico entre procesos
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Reloj de pared: el único comparable entre procesos
+            now = time.time()
+            if now >= self._next_sweep:
+                conn.execute("DELETE FROM token_buckets WHERE full_at <= ?", (now,))
+                self._next_sweep = now + SWEEP_INTERVAL
+            rows = conn.execute(
+                f"SELECT key, tokens, updated_at FROM token_buckets WHERE key IN ({', '.join('?' for _ in keys)})",
+                keys,
+            ).fetchall()
+            stored = {key: (tokens, updated_at) for key, tokens, updated_at in rows}
+            state = {key: _refill(stored.get(key), rate, burst, now) for key, rate, burst in limits}
+            retry_after, limited_by = _consume(limits, state)
+            conn.executemany(
+                "INSERT OR REPLACE INTO token_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+                [(key, state[key], now, _full_at(state[key], rate, burst, now)) for key, rate, burst in limits],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after, limited_by
+
+
+def _refill(bucket: tuple[float, ...] | None, rate: float, burst: float, now: float) -> float:
+    if bucket is None:
+        return burst
+    tokens, updated_at = bucket[:2]
+    return min(burst, tokens + max(0.0, now - updated_at) * rate)
+
+
+def _full_at(tokens: float, rate: float, burst: float, now: float) -> float:
+    """
+    Momento en que el bucket vuelve a tener `burst` tokens; desde ahí puede
+    descartarse sin cambiar el resultado
+    """
+    return now + max(0.0, burst - tokens) / rate
+
+
+def _consume(limits: list[Limit], state: dict[str, float]) -> tuple[float, str | None]:
+    """
+    Descuenta un token de todos los buckets o de ninguno. Devuelve (0, None) si
+    entra; si no, los segundos hasta que el bucket más lento tenga un token y
+    su clave
+    """
+    retry_after, limited_by = 0.0, None
+    for key, rate, _burst in limits:
+        if state[key] < 1:
+            wait = (1 - state[key]) / rate
+            if wait > retry_after:
+                retry_after, limited_by = wait, key
+    if limited_by is None:
+        for key in state:
+            state[key] -= 1
+    return retry_after, limited_by
+
+
+def _parse_limits(raw: str) -> dict[str, tuple[float, float]]:
+    """
+    Convierte "mer-a=5:10,mer-b=50" en {"mer-a": (5.0, 10.0), "mer-b": (50.0, 50.0)}
+    """
+    limits: dict[str, tuple[float, float]] = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        rate, _, burst = value.partition(":")
+        limits[name.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+class AdmissionController:
+    """
+    Control de admisión antes de llamar a Akua: un token bucket global y uno
+    por merchant (tasa y burst configurables, con excepciones por merchant).
+    Una tasa de 0 desactiva ese bucket.
+    """
+
+    def __init__(
+        self,
+        backend: MemoryBuckets | SQLiteBuckets,
+        global_limit: tuple[float, float],
+        merchant_limit: tuple[float, float],
+        overrides: dict[str, tuple[float, float]],
+    ) -> None:
+        self.backend = backend
+        self.global_limit = global_limit
+        self.merchant_limit = merchant_limit
+        self.overrides = overrides
+
+    def limits_for(self, merchant_id: str | None) -> list[Limit]:
+        limits = []
+        if merchant_id:
+            rate, burst = self.overrides.get(merchant_id, self.merchant_limit)
+            if rate > 0:
+                limits.append((f"merchant:{merchant_id}", rate, burst))
+        rate, burst = self.global_limit
+        if rate > 0:
+            limits.append((GLOBAL_KEY, rate, burst))
+        return limits
+
+    async def admit(self, merchant_id: str | None) -> tuple[float, str | None]:
+        """
+        (0, None) si el request entra; si no, segundos sugeridos para
+        Retry-After y el límite excedido ("merchant" o "global")
+        """
+        limits = self.limits_for(merchant_id)
+        if not limits:
+            return 0.0, None
+        if isinstance(self.backend, MemoryBuckets):
+            retry_after, limited_by = self.backend.take(limits)
+        else:
+            retry_after, limited_by = await asyncio.to_thread(self.backend.take, limits)
+        if limited_by is None:
+            return 0.0, None
+        scope = "global" if limited_by == GLOBAL_KEY else "merchant"
+        admission_rejections.inc(scope)
+        return retry_after, scope
+
+
+def _merchant_from_body(body: bytes) -> str | None:
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    merchant_id = data.get("merchant_id") if isinstance(data, dict) else None
+    return merchant_id if isinstance(merchant_id, str) else None
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI que aplica el control de admisión a las rutas que llaman a
+    Akua, antes de validar el request con Pydantic. El merchant sale del
+    payment_ledger (captura, cancelación, reembolso), del `merchant_id` del
+    JSON (autorización) o del merchant fijo de la pre-autorización; nunca de
+    un header que el cliente pueda omitir o rotar. Sin merchant conocido solo
+    aplica el bucket global. Si no hay cupo responde 429 con Retry-After.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not settings.rate_limit_enabled:
+            await self.app(scope, receive, send)
+            return
+        match = _ADMITTED_ROUTES.match(scope["path"])
+        if match is None:
+            await self.app(scope, receive, send)
+            return
+
+        with stage("admission"):
+            merchant_id = None
+            if match.group("payment"):
+                entry = await payment_ledger.get(match.group("payment"))
+                merchant_id = entry["merchant_id"] if entry else None
+            elif match.group("body"):
+                body, receive = await _buffer_body(receive)
+                merchant_id = _merchant_from_body(body)
+            elif match.group("preauthorization"):
+                merchant_id = settings.preauthorization_merchant_id
+            retry_after, limited_by = await admission_controller.admit(merchant_id)
+
+        if limited_by is not None:
+            await _reject(send, retry_after, "global" if limited_by == "global" else f"del merchant {merchant_id}")
+            return
+        await self.app(scope, receive, send)
+
+
+async def _buffer_body(receive):
+    """
+    Lee el cuerpo completo y devuelve un `receive` que lo vuelve a entregar a la app
+    """
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    body = b"".join(chunks)
+    delivered = False
+
+    async def replay():
+        nonlocal delivered
+        if not delivered:
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+async def _reject(send, retry_after: float, scope_text: str) -> None:
+    content = json.dumps({"detail": f"Límite de requests {scope_text} excedido"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(content)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": content})
+
+
+def _build_backend() -> MemoryBuckets | SQLiteBuckets:
+    if settings.rate_limit_backend.lower() == "sqlite":
+        path = Path(settings.rate_limit_db_path) if settings.rate_limit_db_path else DB_PATH.with_name("rate_limit.db")
+        return SQLiteBuckets(path)
+    return MemoryBuckets()
+
+
+admission_controller = AdmissionController(
+    backend=_build_backend(),
+    global_limit=(settings.rate_limit_global_rps, settings.rate_limit_global_burst),
+    merchant_limit=(settings.rate_limit_merchant_rps, settings.rate_limit_merchant_burst),
+    overrides=_parse_limits(settings.rate_limit_merchant_overrides),
+)
@@ -1,16 +1,54 @@
-import requests
+import asyncio
+import hashlib
+import time
+
+import httpx
+
 from app.config import settings
+from app.infrastructure.http_client import akua_base_url, operation_timeout
+from app.infrastructure.metrics import token_refreshes
+from app.infrastructure.shared_state import SharedStateStore, shared_state
+
+# Con estado compartido: cuánto reserva un worker la renovación del token y
+# cada cuánto los demás miran si ya terminó
+_LEASE_SECONDS = 10.0
+_LEASE_POLL_SECONDS = 0.05
+
+
+class AkuaTokenError(RuntimeError):
+    """
+    Error obteniendo el access token de Akua
+    """
+
+    def __init__(self, message: str, status_code: int | None = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _credentials() -> tuple[str | None, str | None]:
+    """
+    Contra el simulador no hacen falta credenciales reales
+    """
+    if settings.akua_client_id and settings.akua_client_secret:
+        return settings.akua_client_id, settings.akua_client_secret
+    if settings.akua_mode.upper() != "REAL":
+        return "simulator", "simulator"
+    return None, None
+
 
 class AkuaAuth:
-    TOKEN_URL = f"{settings.akua_base_url}/oauth/token"
+    @staticmethod
+    def token_url() -> str:
+        return f"{akua_base_url()}/oauth/token"
 
     @staticmethod
-    def get_access_token():
+    async def get_access_token(http_client: httpx.AsyncClient) -> tuple[str, int]:
+        client_id, client_secret = _credentials()
         payload = {
             "grant_type": "client_credentials",
             "audience": settings.akua_base_url,
-            "client_id": settings.akua_client_id,
-            "client_secret": settings.akua_client_secret,
+            "client_id": client_id,
+            "client_secret": client_secret,
         }
 
         headers = {
@@ -18,10 +56,185 @@ class AkuaAuth:
             "content-type": "application/json"
         }
 
-        response = requests.post(AkuaAuth.TOKEN_URL, json=payload, headers=headers)
+        try:
+            response = await http_client.post(
+                AkuaAuth.token_url(), json=payload, headers=headers, timeout=operation_timeout("token")
+            )
+        except httpx.HTTPError as e:
+            raise AkuaTokenError(f"Error conectando con Akua: {e}") from e
 
         if response.status_code != 200:
-            raise Exception(f"Error obteniendo token Akua: {response.text}")
+            raise AkuaTokenError(f"Error obteniendo token Akua: {response.text}", response.status_code)
 
         data = response.json()
-        return data["access_token"], data.get("expires_in", 0)
\ No newline at end of file
+        return data["access_token"], data.get("expires_in", 0)
+
+
+class AccessTokenManager:
+    """
+    Cache del access token de Akua compartido por todo el proceso.
+
+    - Reutiliza el token hasta `refresh_margin` segundos antes de `expires_in`
+    - Dentro de la ventana `refresh_ahead` lo renueva en segundo plano
+    - Las renovaciones concurrentes se agrupan en una sola llamada a /oauth/token
+    - Con `shared` (varios workers) el token se publica en el estado compartido:
+      lo renueva un solo worker y los demás lo adoptan
+    """
+
+    def __init__(
+        self,
+        refresh_margin: float,
+        refresh_ahead: float,
+        default_ttl: float,
+        shared: SharedStateStore | None = None,
+    ) -> None:
+        self.refresh_margin = refresh_margin
+        self.refresh_ahead = refresh_ahead
+        self.default_ttl = default_ttl
+        self.shared = shared
+        self._token: str | None = None
+        self._expires_in: int = 0
+        self._expires_at: float = 0.0
+        self._valid_until: float = 0.0
+        self._renew_from: float = 0.0
+        self._inflight: asyncio.Task | None = None
+
+    @property
+    def has_credentials(self) -> bool:
+        return all(_credentials())
+
+    async def get_token(self, http_client: httpx.AsyncClient) -> str | None:
+        """
+        Devuelve un token válido, o None si no hay credenciales configuradas
+        """
+        if settings.akua_access_token:
+            return settings.akua_access_token
+        if not self.has_credentials:
+            return None
+
+        now = time.monotonic()
+        if self._token and now < self._valid_until:
+            if now >= self._renew_from:
+                self._start_refresh(http_client)
+            return self._token
+
+        return await self._refresh(http_client)
+
+    async def token_info(self, http_client: httpx.AsyncClient) -> dict:
+        token = await self.get_token(http_client)
+        return {
+            "access_token": token,
+            "expires_in": self._expires_in,
+            "remaining": max(0, int(self._expires_at - time.monotonic())) if self._token else None,
+        }
+
+    def identity(self) -> str | None:
+        """
+        Identidad estable de las credenciales (no cambia al renovar el token),
+        usada para separar datos cacheados por cuenta de Akua
+        """
+        if settings.akua_access_token:
+            return "token:" + hashlib.sha256(settings.akua_access_token.encode()).hexdigest()[:16]
+        if self.has_credentials:
+            return f"client:{_credentials()[0]}"
+        return None
+
+    def invalidate(self, token: str) -> None:
+        """
+        Descarta el token (ej: Akua respondió 401). Solo si sigue siendo el vigente,
+        para no tirar uno que otra petición ya renovó.
+        """
+        if self._token == token:
+            self._token = None
+            self._valid_until = 0.0
+            if self.shared is not None:
+                self.shared.delete_token(self.identity(), token)
+
+    async def aclose(self) -> None:
+        if self._inflight is not None and not self._inflight.done():
+            self._inflight.cancel()
+        self._inflight = None
+
+    def _start_refresh(self, http_client: httpx.AsyncClient) -> asyncio.Task:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._fetch(http_client))
+        return self._inflight
+
+    async def _refresh(self, http_client: httpx.AsyncClient) -> str:
+        # shield: si quien espera se cancela, la renovación sigue para los demás
+        return await asyncio.shield(self._start_refresh(http_client))
+
+    async def _fetch(self, http_client: httpx.AsyncClient) -> str:
+        if self.shared is None:
+            return await self._fetch_from_akua(http_client)
+
+        identity = self.identity()
+        deadline = time.monotonic() + _LEASE_SECONDS
+        while True:
+            if self._adopt(await asyncio.to_thread(self.shared.get_token, identity)):
+                token_refreshes.inc("shared")
+                return self._token
+            if await asyncio.to_thread(self.shared.try_lease, identity, _LEASE_SECONDS):
+                break
+            # Otro worker lo está renovando; si tarda demasiado se pide uno propio
+            if time.monotonic() > deadline:
+                return await self._fetch_from_akua(http_client)
+            await asyncio.sleep(_LEASE_POLL_SECONDS)
+
+        try:
+            token = await self._fetch_from_akua(http_client)
+        except Exception:
+            await asyncio.to_thread(self.shared.release_lease, identity)
+            raise
+        offset = time.time() - time.monotonic()
+        await asyncio.to_thread(
+            self.shared.put_token, identity, token, self._expires_in, self._expires_at + offset,
+            self._valid_until + offset, self._renew_from + offset,
+        )
+        return token
+
+    def _adopt(self, shared_token: dict | None) -> bool:
+        """
+        Toma el token publicado por otro worker si todavía no entró en la
+        ventana de renovación anticipada (si entró, hay que renovarlo)
+        """
+        if shared_token is None or shared_token["token"] == self._token:
+            return False
+        now_wall = time.time()
+        if shared_token["renew_from"] <= now_wall:
+            return False
+        offset = time.monotonic() - now_wall
+        self._token = shared_token["token"]
+        self._expires_in = shared_token["expires_in"]
+        self._expires_at = shared_token["expires_at"] + offset
+        self._valid_until = shared_token["valid_until"] + offset
+        self._renew_from = shared_token["renew_from"] + offset
+        return True
+
+    async def _fetch_from_akua(self, http_client: httpx.AsyncClient) -> str:
+        try:
+            token, expires_in = await AkuaAuth.get_access_token(http_client)
+        except Exception:
+            token_refreshes.inc("error")
+            raise
+        token_refreshes.inc("ok")
+        ttl = expires_in or self.default_ttl
+        # Con tokens de vida corta los márgenes no pueden comerse todo el TTL
+        margin = min(self.refresh_margin, ttl / 2)
+        ahead = max(min(self.refresh_ahead, ttl * 3 / 4), margin)
+
+        now = time.monotonic()
+        self._token = token
+        self._expires_in = expires_in
+        self._expires_at = now + ttl
+        self._valid_until = now + ttl - margin
+        self._renew_from = now + ttl - ahead
+        return token
+
+
+token_manager = AccessTokenManager(
+    refresh_margin=settings.akua_token_refresh_margin,
+    refresh_ahead=settings.akua_token_refresh_ahead,
+    default_ttl=settings.akua_token_default_ttl,
+    shared=shared_state,
+)
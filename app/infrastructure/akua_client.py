@@ -1,4 +1,9 @@
+import asyncio
+import logging
+import time
 import uuid
+from typing import AsyncIterator, Awaitable
+
 import httpx
 
 from app.config import settings
@@ -6,98 +11,258 @@ from app.schemas.authorization import AuthorizationRequest
 from app.schemas.cancel import CancelRequest
 from app.schemas.capture import CaptureRequest
 from app.schemas.refund import RefundRequest
-from app.infrastructure.akua_auth import AkuaAuth
+from app.infrastructure.akua_auth import AccessTokenManager, token_manager
+from app.infrastructure.cache import TTLCache, listing_cache
+from app.infrastructure.idempotency import IdempotencyStore, idempotency_store, request_hash
+from app.infrastructure.http_client import akua_base_url, operation_timeout
+from app.infrastructure.ledger import PaymentLedger, payment_ledger
+from app.infrastructure.metrics import upstream_duration
+from app.infrastructure.passthrough import AkuaBody
+from app.infrastructure.payment_state import InvalidTransition
+from app.infrastructure.resilience import RETRY_STATUSES, hedged, retry_policy, upstream_stats
+from app.infrastructure.timing import stage
+
+logger = logging.getLogger(__name__)
+
 class AkuaClient:
     """
     Cliente de Akua en modo SandBox usando AKUA_BASE_URL y AKUA_ACCESS_TOKEN
+
+    Recibe el httpx.AsyncClient compartido de la aplicación (ver app.main) y
+    obtiene el token desde el AccessTokenManager del proceso
     """
 
-    def __init__(self) -> None:
-        self.base_url = (settings.akua_base_url or "").rstrip("/")
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        tokens: AccessTokenManager = token_manager,
+        cache: TTLCache = listing_cache,
+        idempotency: IdempotencyStore = idempotency_store,
+        ledger: PaymentLedger = payment_ledger,
+    ) -> None:
+        self.http = http_client
+        self.tokens = tokens
+        self.cache = cache
+        self.idempotency = idempotency
+        self.ledger = ledger
+        self.base_url = akua_base_url()
+
+    async def _send(self, method: str, url: str, operation: str, headers: dict, **kwargs) -> httpx.Response:
+        """
+        Camino común de todas las llamadas a Akua:
+
+        - circuit breaker por operación (falla rápido si Akua está degradado)
+        - reintentos con backoff + jitter en 5xx/429/errores de red, solo para
+          llamadas idempotentes (GET o con Idempotency-Key)
+        - hedging opcional de GETs (AKUA_HEDGE_DELAY_MS)
+        """
+        breaker = upstream_stats.breaker(operation)
+        idempotent = method == "GET" or "Idempotency-Key" in headers
+        started = time.monotonic()
+        attempt = 0
+
+        while True:
+            breaker.check()
+            try:
+                response = await self._attempt(method, url, operation, headers, **kwargs)
+            except httpx.TransportError:
+                breaker.record_failure()
+                delay = retry_policy.delay(attempt)
+                if not self._should_retry(idempotent, attempt, started, delay):
+                    raise
+            except BaseException:
+                # Cualquier otro final (token, error local, CancelledError de un
+                # cliente desconectado o un hedge cancelado) debe liberar la prueba
+                breaker.release()
+                raise
+            else:
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = retry_policy.delay(attempt, response.headers.get("Retry-After"))
+                if not self._should_retry(idempotent, attempt, started, delay):
+                    return response
+
+            upstream_stats.retries[operation] += 1
+            with stage("retry_wait"):
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _should_retry(idempotent: bool, attempt: int, started: float, delay: float | None) -> bool:
+        # El presupuesto se compara con el momento del próximo intento (después
+        # de la espera); sin espera posible (Retry-After largo) no se reintenta
+        return (
+            idempotent
+            and delay is not None
+            and attempt + 1 < retry_policy.max_attempts
+            and time.monotonic() - started + delay <= retry_policy.budget
+        )
+
+    async def _attempt(self, method: str, url: str, operation: str, headers: dict, **kwargs) -> httpx.Response:
+        """
+        Un intento autenticado. Ante un 401 descarta el token y reintenta una vez
+        """
+        with stage("token"):
+            token = await self.tokens.get_token(self.http)
+        if not token:
+            raise RuntimeError(
+                "AKUA_MODE=REAL requiere AKUA_ACCESS_TOKEN o (AKUA_CLIENT_ID + AKUA_CLIENT_SECRET)"
+            )
+
+        response = await self._request(method, url, operation, headers, token, **kwargs)
+
+        if response.status_code == 401 and self.tokens.has_credentials and not settings.akua_access_token:
+            self.tokens.invalidate(token)
+            with stage("token"):
+                token = await self.tokens.get_token(self.http)
+            response = await self._request(method, url, operation, headers, token, **kwargs)
 
-        if settings.akua_access_token:
-            self.access_token = settings.akua_access_token
+        return response
 
-        elif settings.akua_client_id and settings.akua_client_secret:
-            token, _ = AkuaAuth.get_access_token()
-            self.access_token = token
+    async def _request(self, method: str, url: str, operation: str, headers: dict, token: str, **kwargs) -> httpx.Response:
+        def call() -> Awaitable[httpx.Response]:
+            return self.http.request(
+                method, url, headers={**headers, "authorization": f"Bearer {token}"},
+                timeout=operation_timeout(operation), **kwargs
+            )
 
-        else:
-            self.access_token = None
+        started = time.perf_counter()
+        status = "error"
+        try:
+            if method != "GET" or settings.akua_hedge_delay_ms <= 0:
+                with stage("upstream"):
+                    response = await call()
+            else:
+                with stage("upstream"):
+                    response, was_hedged = await hedged(call, settings.akua_hedge_delay_ms / 1000)
+                if was_hedged:
+                    upstream_stats.hedges[operation] += 1
+            status = str(response.status_code)
+            return response
+        finally:
+            upstream_duration.observe(time.perf_counter() - started, operation, status)
+
+    async def _idempotent(
+        self,
+        operation: str,
+        key: str,
+        req_hash: str,
+        call,
+        payment_id: str | None = None,
+        amount: float | None = None,
+    ) -> dict:
+        """
+        Ejecuta `call` una sola vez por Idempotency-Key; los duplicados se
+        responden desde el registro local (replayed=True).
 
-    async def create_authorization(self, payload: AuthorizationRequest) -> dict:
+        Sobre un pago existente, antes de ir a Akua se valida la transición
+        contra payment_ledger y lo imposible se rechaza localmente.
+        """
+        if payment_id is not None:
+            try:
+                await self.ledger.check(operation, payment_id, amount)
+            except InvalidTransition:
+                # El reintento de una operación ya completada se sigue respondiendo
+                # desde el registro de idempotencia
+                if not await self.idempotency.is_completed(key, req_hash):
+                    self.ledger.rejected += 1
+                    raise
+
+        async def upstream() -> AkuaBody:
+            body = (await call())["akua_response"]
+            try:
+                await self.ledger.record(operation, body, payment_id)
+            except Exception:
+                # La operación ya se hizo en Akua: un fallo del ledger no la invalida
+                logger.exception("Error actualizando payment_ledger para %s", payment_id)
+            return body
+
+        akua_response, replayed = await self.idempotency.run(key, operation, req_hash, upstream)
+        return {
+            "mode": settings.akua_mode,
+            "akua_response": akua_response,
+            "idempotency_key": key,
+            "replayed": replayed,
+        }
+
+    async def create_authorization(self, payload: AuthorizationRequest, idempotency_key: str | None = None) -> dict:
         """
         Autorización de un pago
         Llama Akua /v1/authorizations
+
+        Solo se deduplica por lo que envía el cliente (Idempotency-Key o `id`):
+        dos compras iguales sin ninguno de los dos son dos cobros distintos, así
+        que reciben un `id` y una key aleatorios. Con key y sin `id`, el `id` se
+        deriva de la key (reintentar con la misma key es el mismo request).
         """
 
         if not getattr(payload, "id", None):
-            payload.id = f"AB-{uuid.uuid4().hex[:12]}"
-        return await self._real_authorization(payload)
+            seed = request_hash("authorization-id", idempotency_key) if idempotency_key else uuid.uuid4().hex
+            payload.id = f"AB-{seed[:12]}"
 
-    async def _real_authorization(self, payload: AuthorizationRequest) -> dict:
-        if not self.access_token:
-            raise RuntimeError(
-                "AKUA_MODE=REAL requiere AKUA_ACCESS_TOKEN o (AKUA_CLIENT_ID + AKUA_CLIENT_SECRET)"
-            )
+        json_payload = payload.model_dump(exclude_none=True)
+        req_hash = request_hash("authorization", json_payload)
+        key = idempotency_key or f"{payload.id}-{req_hash[:24]}"
+        return await self._idempotent(
+            "authorization", key, req_hash, lambda: self._real_authorization(payload, key)
+        )
 
+    async def _real_authorization(self, payload: AuthorizationRequest, idempotency_key: str) -> dict:
         url = f"{self.base_url.rstrip('/')}/v1/authorizations"
 
-        json_payload = payload.model_dump(exclude_none=True)
-        idempotency_key = f"{payload.id}-{uuid.uuid4()}"
+        body = payload.model_dump_json(exclude_none=True).encode()
 
         headers = {
             "accept": "application/json",
             "content-type": "application/json",
-            "authorization": f"Bearer {self.access_token}",
             "Idempotency-Key": idempotency_key,
         }
 
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.post(url, json=json_payload, headers=headers)
+        response = await self._send("POST", url, "authorization", headers, content=body)
 
         if response.status_code >= 400:
             raise RuntimeError(
                 f"ERROR desde Akua Authorization:\n"
                 f"- Status: {response.status_code}\n"
                 f"- URL: {url}\n"
-                f"- Request JSON: {json_payload}\n"
+                f"- Request JSON: {body.decode()}\n"
                 f"- Response Body: {response.text}"
             )
 
         return {
-            "mode": "REAL",
-            "akua_response": response.json(),
+            "mode": settings.akua_mode,
+            "akua_response": AkuaBody.from_response(response),
         }
     
     ### Cancelamiento de pagos ###
 
-    async def cancel_payment(self, payment_id: str, payload: CancelRequest) -> dict:
+    async def cancel_payment(self, payment_id: str, payload: CancelRequest, idempotency_key: str | None = None) -> dict:
         """
         Cancelación de un pago
         Llama Akua /v1/payments/{payment_id}/cancel
         """
-        return await self._real_cancel(payment_id, payload)
-
-    async def _real_cancel(self, payment_id: str, payload: CancelRequest) -> dict:
-        if not self.access_token:
-            raise RuntimeError("AKUA_MODE=REAL requiere AKUA_ACCESS_TOKEN o (AKUA_CLIENT_ID + AKUA_CLIENT_SECRET)")
+        req_hash = request_hash("cancel", payment_id, payload.model_dump(exclude_none=True))
+        key = idempotency_key or f"cancel-{payment_id}-{req_hash[:24]}"
+        return await self._idempotent(
+            "cancel", key, req_hash, lambda: self._real_cancel(payment_id, payload, key), payment_id
+        )
 
+    async def _real_cancel(self, payment_id: str, payload: CancelRequest, idempotency_key: str) -> dict:
         url = f"{self.base_url.rstrip('/')}/v1/payments/{payment_id}/cancel"
 
-        json_body = payload.model_dump(exclude_none=True)
-
-        idempotency_key = f"cancel-{payment_id}-{uuid.uuid4()}"
+        body = payload.model_dump_json(exclude_none=True).encode()
 
         headers = {
             "accept": "application/json",
             "content-type": "application/json",
             "Idempotency-Key": idempotency_key,
-            "authorization": f"Bearer {self.access_token}",
         }
 
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.post(url, json=json_body, headers=headers)
+        response = await self._send("POST", url, "cancel", headers, content=body)
         
         if response.status_code >= 400:
             raise RuntimeError(
@@ -105,39 +270,38 @@ class AkuaClient:
                 f"- Status: {response.status_code}\n"
                 f"- URL: {url}\n"
                 f"- Idempotency-Key: {idempotency_key}\n"
-                f"- Request JSON: {json_body}\n"
+                f"- Request JSON: {body.decode()}\n"
                 f"- Response Body: {response.text}"
             )
 
-        return {"mode": "REAL", "akua_response": response.json()}
+        return {"mode": settings.akua_mode, "akua_response": AkuaBody.from_response(response)}
     
     ### Reembolso de pagos ###
 
-    async def refund_payment(self, payment_id: str, payload: RefundRequest) -> dict:
+    async def refund_payment(self, payment_id: str, payload: RefundRequest, idempotency_key: str | None = None) -> dict:
         """
         Reembolso de un pago
         Llama Akua /v1/payments/{payment_id}/refund
         """
-        return await self._real_refund(payment_id, payload)
-
-    async def _real_refund(self, payment_id: str, payload: RefundRequest) -> dict:
-        if not self.access_token:
-            raise RuntimeError("AKUA_MODE=REAL requiere AKUA_ACCESS_TOKEN o (AKUA_CLIENT_ID + AKUA_CLIENT_SECRET)")
+        req_hash = request_hash("refund", payment_id, payload.model_dump(exclude_none=True))
+        key = idempotency_key or f"refund-{payment_id}-{req_hash[:24]}"
+        return await self._idempotent(
+            "refund", key, req_hash, lambda: self._real_refund(payment_id, payload, key),
+            payment_id, _amount_value(payload.amount),
+        )
 
+    async def _real_refund(self, payment_id: str, payload: RefundRequest, idem_key: str) -> dict:
         url = f"{self.base_url.rstrip('/')}/v1/payments/{payment_id}/refund"
-        idem_key = f"refund-{payment_id}-{uuid.uuid4()}"
 
-        json_body = payload.model_dump(exclude_none=True)
+        body = payload.model_dump_json(exclude_none=True).encode()
 
         headers = {
             "accept": "application/json",
             "content-type": "application/json",
             "Idempotency-Key": idem_key,
-            "authorization": f"Bearer {self.access_token}",
         }
 
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.post(url, json=json_body, headers=headers)
+        response = await self._send("POST", url, "refund", headers, content=body)
 
         if response.status_code >= 400:
             raise RuntimeError(
@@ -145,46 +309,44 @@ class AkuaClient:
                 f"- Status: {response.status_code}\n"
                 f"- URL: {url}\n"
                 f"- Idempotency-Key: {idem_key}\n"
-                f"- Request JSON: {json_body}\n"
+                f"- Request JSON: {body.decode()}\n"
                 f"- Response Body: {response.text}"
             )
 
         return {
-            "mode": "REAL",
-            "akua_response": response.json(),
+            "mode": settings.akua_mode,
+            "akua_response": AkuaBody.from_response(response),
         }
     
     ### Captura de pagos ###
     
-    async def capture_payment(self, payment_id: str, payload: CaptureRequest) -> dict:
+    async def capture_payment(self, payment_id: str, payload: CaptureRequest, idempotency_key: str | None = None) -> dict:
         """
         Captura de un pago con captura manual
         Llama a Akua /v1/payments/{payment_id}/captures
-        """
-        return await self._real_capture(payment_id, payload)
 
-    async def _real_capture(self, payment_id: str, payload: CaptureRequest) -> dict:
-        if not self.access_token:
-            raise RuntimeError("AKUA_MODE=REAL requiere AKUA_ACCESS_TOKEN o (AKUA_CLIENT_ID + AKUA_CLIENT_SECRET)")
+        Dos capturas parciales por el mismo monto deben enviar Idempotency-Key
+        distintas; sin key se consideran el mismo request.
+        """
+        req_hash = request_hash("capture", payment_id, payload.model_dump(exclude_none=True))
+        key = idempotency_key or f"capture-{payment_id}-{req_hash[:24]}"
+        return await self._idempotent(
+            "capture", key, req_hash, lambda: self._real_capture(payment_id, payload, key),
+            payment_id, _amount_value(payload.amount),
+        )
 
+    async def _real_capture(self, payment_id: str, payload: CaptureRequest, idem_key: str) -> dict:
         url = f"{self.base_url.rstrip('/')}/v1/payments/{payment_id}/captures"
 
-        if payload.amount:
-            idem_key = f"capture-{payment_id}-{uuid.uuid4()}"
-        else:
-            idem_key = f"capture-{payment_id}-{uuid.uuid4()}"
-
         headers = {
             "accept": "application/json",
             "content-type": "application/json",
             "Idempotency-Key": idem_key,
-            "authorization": f"Bearer {self.access_token}",
         }
 
-        json_body = payload.model_dump(exclude_none=True)
+        body = payload.model_dump_json(exclude_none=True).encode()
 
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.post(url, json=json_body, headers=headers)
+        response = await self._send("POST", url, "capture", headers, content=body)
 
         if response.status_code >= 400:
             raise RuntimeError(
@@ -192,39 +354,65 @@ class AkuaClient:
                 f"- Status: {response.status_code}\n"
                 f"- URL: {url}\n"
                 f"- Idempotency-Key: {idem_key}\n"
-                f"- Request JSON: {json_body}\n"
+                f"- Request JSON: {body.decode()}\n"
+                f"- Response Body: {response.text}"
+            )
+
+        return {
+            "mode": settings.akua_mode,
+            "akua_response": AkuaBody.from_response(response),
+        }
+
+    ### Consulta de pagos ###
+
+    async def get_payment(self, payment_id: str) -> dict | None:
+        """
+        Estado actual de un pago en Akua (sin cache)
+        Llama a Akua GET /v1/payments/{payment_id}; None si Akua no lo conoce
+        """
+        url = f"{self.base_url.rstrip('/')}/v1/payments/{payment_id}"
+
+        headers = {
+            "accept": "application/json",
+        }
+
+        response = await self._send("GET", url, "get_payment", headers)
+
+        if response.status_code == 404:
+            return None
+        if response.status_code >= 400:
+            raise RuntimeError(
+                "ERROR desde Akua Payment:\n"
+                f"- Status: {response.status_code}\n"
+                f"- URL: {url}\n"
                 f"- Response Body: {response.text}"
             )
 
         return {
-            "mode": "REAL",
-            "akua_response": response.json(),
+            "mode": settings.akua_mode,
+            "akua_response": AkuaBody.from_response(response),
         }
 
     async def list_organizations(self) -> dict:
         """
         Obtiene el listado de organizaciones desde Akua
 
-        Llama al endpoint /v1/organizations de Akua
+        Llama al endpoint /v1/organizations de Akua (cacheado, ver CACHE_TTL_ORGANIZATIONS)
         """
-        return await self._real_list_organizations()
+        return await self.cache.get_or_load(
+            ("organizations", self.tokens.identity()),
+            settings.cache_ttl_organizations,
+            self._real_list_organizations,
+        )
 
     async def _real_list_organizations(self) -> dict:
-        if not self.access_token:
-            raise RuntimeError(
-                "AKUA_MODE=REAL requiere un access token de Akua "
-                "o configuración de client_credentials"
-            )
-
         url = f"{self.base_url.rstrip('/')}/v1/organizations"
 
         headers = {
             "accept": "application/json",
-            "authorization": f"Bearer {self.access_token}",
         }
 
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.get(url, headers=headers)
+        response = await self._send("GET", url, "list_organizations", headers)
 
         if response.status_code >= 400:
             raise RuntimeError(
@@ -235,23 +423,47 @@ class AkuaClient:
             )
 
         return {
-            "mode": "REAL",
-            "akua_response": response.json(),
+            "mode": settings.akua_mode,
+            "akua_response": AkuaBody.from_response(response),
         }
 
     async def list_merchants(self, organization_id: str, page: int = 1, page_size: int = 20) -> dict:
         """
         Lista comerciantes (merchants) asociados a una organización en Akua
-        Llama a /v1/merchants usando filtros de query
+        Llama a /v1/merchants usando filtros de query (cacheado, ver CACHE_TTL_MERCHANTS)
         """
-        return await self._real_list_merchants(organization_id, page, page_size)
+        return await self.cache.get_or_load(
+            ("merchants", self.tokens.identity(), organization_id, page, page_size),
+            settings.cache_ttl_merchants,
+            lambda: self._real_list_merchants(organization_id, page, page_size),
+        )
 
-    async def _real_list_merchants(self, organization_id: str, page: int, page_size: int) -> dict:
-        if not self.access_token:
-            raise RuntimeError(
-                "AKUA_MODE=REAL requiere AKUA_ACCESS_TOKEN o (AKUA_CLIENT_ID + AKUA_CLIENT_SECRET)"
-            )
+    async def iter_merchants(self, organization_id: str, page_size: int = 100) -> AsyncIterator[dict]:
+        """
+        Recorre todas las páginas de merchants de una organización.
 
+        Mientras se consume una página ya se está pidiendo la siguiente, y nunca
+        hay más de dos páginas en memoria. No usa el cache de listados.
+        """
+        page = 1
+        pending = asyncio.create_task(self._real_list_merchants(organization_id, page, page_size))
+        try:
+            while pending is not None:
+                result = await pending
+                items = _page_items(result["akua_response"].data)
+
+                pending = None
+                if len(items) >= page_size:
+                    page += 1
+                    pending = asyncio.create_task(self._real_list_merchants(organization_id, page, page_size))
+
+                for item in items:
+                    yield item
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+
+    async def _real_list_merchants(self, organization_id: str, page: int, page_size: int) -> dict:
         url = (
             f"{self.base_url.rstrip('/')}/v1/merchants"
             f"?page={page}&page_size={page_size}"
@@ -260,11 +472,9 @@ class AkuaClient:
 
         headers = {
             "accept": "application/json",
-            "authorization": f"Bearer {self.access_token}",
         }
 
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.get(url, headers=headers)
+        response = await self._send("GET", url, "list_merchants", headers)
 
         if response.status_code >= 400:
             raise RuntimeError(
@@ -275,6 +485,26 @@ class AkuaClient:
             )
 
         return {
-            "mode": "REAL",
-            "akua_response": response.json(),
-        }
\ No newline at end of file
+            "mode": settings.akua_mode,
+            "akua_response": AkuaBody.from_response(response),
+        }
+
+
+def _amount_value(amount) -> float | None:
+    """
+    Valor de un monto del request (modelo o dict); None si no viene
+    """
+    value = amount.get("value") if isinstance(amount, dict) else getattr(amount, "value", None)
+    return float(value) if isinstance(value, (int, float)) else None
+
+
+def _page_items(body) -> list:
+    """
+    Elementos de una página de listado de Akua (lista directa o bajo data/items)
+    """
+    if isinstance(body, list):
+        return body
+    for key in ("data", "items", "results", "merchants"):
+        if isinstance(body.get(key), list):
+            return body[key]
+    return []
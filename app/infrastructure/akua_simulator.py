@@ -0,0 +1,324 @@
+"""
+Simulador en proceso de la API de Akua.
+
+Implementa /oauth/token, /v1/authorizations, /v1/payments/{id}[/captures|/cancel|/refund],
+/v1/organizations y /v1/merchants con transiciones de estado de pago realistas,
+latencia configurable (lognormal), tasa de errores y rate limiting.
+
+Se usa de dos formas (ver AKUA_MODE):
+- MOCK: como transporte de httpx dentro del mismo proceso (sin red)
+- SIMULATOR: como servidor local independiente
+
+    python -m app.infrastructure.akua_simulator --port 9000
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from urllib.parse import parse_qs
+
+import httpx
+
+from app.config import settings
+
+DECLINED_CARDS = {"4000000000000002", "5100000000000511"}
+
+
+@dataclass
+class SimulatorConfig:
+    latency_median_ms: float = settings.sim_latency_median_ms
+    latency_sigma: float = settings.sim_latency_sigma
+    error_rate: float = settings.sim_error_rate
+    rate_limit_rps: float = settings.sim_rate_limit_rps
+    rate_limit_burst: int = settings.sim_rate_limit_burst
+    organizations: int = settings.sim_organizations
+    merchants_per_org: int = settings.sim_merchants_per_org
+    seed: int | None = settings.sim_seed
+
+
+class SimulatorError(Exception):
+    def __init__(self, status_code: int, message: str, headers: dict | None = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class AkuaSimulator:
+    def __init__(self, config: SimulatorConfig | None = None) -> None:
+        self.config = config or SimulatorConfig()
+        self.random = random.Random(self.config.seed)
+        self.payments: dict[str, dict] = {}
+        self.idempotent_responses: dict[str, tuple[int, dict]] = {}
+        self.requests = 0
+        self._tokens = float(self.config.rate_limit_burst)
+        self._tokens_at = time.monotonic()
+
+    # --- Infraestructura: latencia, errores y rate limit ---
+
+    def latency(self) -> float:
+        if self.config.latency_median_ms <= 0:
+            return 0.0
+        median = self.config.latency_median_ms / 1000
+        return median * math.exp(self.random.gauss(0, self.config.latency_sigma))
+
+    def _take_rate_token(self) -> None:
+        if self.config.rate_limit_rps <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(
+            self.config.rate_limit_burst,
+            self._tokens + (now - self._tokens_at) * self.config.rate_limit_rps,
+        )
+        self._tokens_at = now
+        if self._tokens < 1:
+            wait = (1 - self._tokens) / self.config.rate_limit_rps
+            raise SimulatorError(429, "Rate limit excedido", {"Retry-After": f"{wait:.3f}"})
+        self._tokens -= 1
+
+    async def handle(self, method: str, path: str, query: dict[str, str], headers: dict[str, str], body: bytes) -> tuple[int, dict, bytes]:
+        self.requests += 1
+        await asyncio.sleep(self.latency())
+        try:
+            status, payload = self._dispatch(method, path, query, headers, body)
+            response_headers = {}
+        except SimulatorError as e:
+            status, payload, response_headers = e.status_code, {"error": str(e)}, e.headers
+        return status, {"content-type": "application/json", **response_headers}, json.dumps(payload).encode()
+
+    def _dispatch(self, method: str, path: str, query: dict, headers: dict, body: bytes) -> tuple[int, dict]:
+        if method == "POST" and path == "/oauth/token":
+            return self._token(_json(body))
+
+        if not headers.get("authorization", "").startswith("Bearer "):
+            raise SimulatorError(401, "Unauthorized")
+        self._take_rate_token()
+        if self.config.error_rate and self.random.random() < self.config.error_rate:
+            raise SimulatorError(self.random.choice([500, 502, 503]), "Error interno simulado")
+
+        key = headers.get("idempotency-key")
+        if method == "POST" and key and key in self.idempotent_responses:
+            return self.idempotent_responses[key]
+
+        parts = path.strip("/").split("/")
+        if method == "POST" and parts == ["v1", "authorizations"]:
+            result = self._authorize(_json(body))
+        elif method == "POST" and len(parts) == 4 and parts[:2] == ["v1", "payments"]:
+            handler = {"captures": self._capture, "cancel": self._cancel, "refund": self._refund}.get(parts[3])
+            if handler is None:
+                raise SimulatorError(404, f"Ruta no encontrada: {path}")
+            result = handler(self._payment(parts[2]), _json(body))
+        elif method == "GET" and len(parts) == 3 and parts[:2] == ["v1", "payments"]:
+            result = (200, self._payment_view(self._payment(parts[2])))
+        elif method == "GET" and parts == ["v1", "organizations"]:
+            result = (200, {"data": [self._organization(i) for i in range(self.config.organizations)]})
+        elif method == "GET" and parts == ["v1", "merchants"]:
+            result = (200, self._merchants(query))
+        else:
+            raise SimulatorError(404, f"Ruta no encontrada: {method} {path}")
+
+        if method == "POST" and key:
+            self.idempotent_responses[key] = result
+        return result
+
+    # --- Recursos ---
+
+    def _token(self, body: dict) -> tuple[int, dict]:
+        if body.get("grant_type") != "client_credentials" or not body.get("client_id"):
+            raise SimulatorError(401, "Credenciales inválidas")
+        return 200, {"access_token": f"sim-{uuid.uuid4().hex}", "token_type": "Bearer", "expires_in": 3600}
+
+    def _payment(self, payment_id: str) -> dict:
+        payment = self.payments.get(payment_id)
+        if payment is None:
+            raise SimulatorError(404, f"Pago {payment_id} no existe")
+        return payment
+
+    def _transaction(self, payment: dict, tx_type: str, status: str, amount: dict) -> dict:
+        transaction = {
+            "id": f"trx-{uuid.uuid4().hex[:20]}",
+            "type": tx_type,
+            "status": status,
+            "amount": amount,
+            "created_at": _now(),
+        }
+        payment["transactions"].append(transaction)
+        payment["updated_at"] = transaction["created_at"]
+        return transaction
+
+    def _payment_view(self, payment: dict) -> dict:
+        return {key: value for key, value in payment.items() if key != "transactions"} | {
+            "transactions": list(payment["transactions"]),
+        }
+
+    def _result(self, payment: dict, transaction: dict) -> tuple[int, dict]:
+        return 200, {
+            "payment_id": payment["id"],
+            "merchant_id": payment["merchant_id"],
+            "status": payment["status"],
+            "transaction": transaction,
+        }
+
+    def _authorize(self, body: dict) -> tuple[int, dict]:
+        amount = body.get("amount") or {}
+        card = (body.get("instrument") or {}).get("card") or {}
+        if not body.get("merchant_id") or amount.get("value") is None or not card.get("number"):
+            raise SimulatorError(400, "merchant_id, amount e instrument.card son requeridos")
+
+        payment = {
+            "id": f"pay-{uuid.uuid4().hex[:20]}",
+            "merchant_id": body["merchant_id"],
+            "intent": body.get("intent", "authorization"),
+            "amount": {"value": amount["value"], "currency": amount.get("currency", "USD")},
+            "captured_amount": 0,
+            "refunded_amount": 0,
+            "status": "AUTHORIZED",
+            "created_at": _now(),
+            "transactions": [],
+        }
+        self.payments[payment["id"]] = payment
+
+        if card["number"] in DECLINED_CARDS:
+            payment["status"] = "DECLINED"
+            transaction = self._transaction(payment, "AUTHORIZATION", "DECLINED", payment["amount"])
+            return self._result(payment, transaction)
+
+        transaction = self._transaction(payment, "AUTHORIZATION", "APPROVED", payment["amount"])
+        capture_mode = (body.get("capture") or {}).get("mode", "AUTOMATIC")
+        if capture_mode == "AUTOMATIC" and payment["intent"] == "authorization":
+            payment["captured_amount"] = amount["value"]
+            payment["status"] = "CAPTURED"
+        return self._result(payment, transaction)
+
+    def _capture(self, payment: dict, body: dict) -> tuple[int, dict]:
+        if payment["status"] not in ("AUTHORIZED", "PARTIALLY_CAPTURED"):
+            raise SimulatorError(409, f"No se puede capturar un pago en estado {payment['status']}")
+        remaining = payment["amount"]["value"] - payment["captured_amount"]
+        value = (body.get("amount") or {}).get("value", remaining)
+        if value <= 0 or value > remaining + 1e-9:
+            raise SimulatorError(422, f"Monto a capturar inválido: {value} (disponible {remaining})")
+
+        payment["captured_amount"] += value
+        payment["status"] = "CAPTURED" if value >= remaining - 1e-9 else "PARTIALLY_CAPTURED"
+        amount = {"value": value, "currency": payment["amount"]["currency"]}
+        return self._result(payment, self._transaction(payment, "CAPTURE", "APPROVED", amount))
+
+    def _cancel(self, payment: dict, body: dict) -> tuple[int, dict]:
+        if payment["status"] != "AUTHORIZED":
+            raise SimulatorError(409, f"No se puede cancelar un pago en estado {payment['status']}")
+        payment["status"] = "CANCELLED"
+        return self._result(payment, self._transaction(payment, "CANCEL", "APPROVED", payment["amount"]))
+
+    def _refund(self, payment: dict, body: dict) -> tuple[int, dict]:
+        if payment["status"] not in ("CAPTURED", "PARTIALLY_CAPTURED", "PARTIALLY_REFUNDED"):
+            raise SimulatorError(409, f"No se puede reembolsar un pago en estado {payment['status']}")
+        available = payment["captured_amount"] - payment["refunded_amount"]
+        value = (body.get("amount") or {}).get("value", available)
+        if value <= 0 or value > available + 1e-9:
+            raise SimulatorError(422, f"Monto a reembolsar inválido: {value} (disponible {available})")
+
+        payment["refunded_amount"] += value
+        payment["status"] = "REFUNDED" if value >= available - 1e-9 else "PARTIALLY_REFUNDED"
+        amount = {"value": value, "currency": payment["amount"]["currency"]}
+        return self._result(payment, self._transaction(payment, "REFUND", "APPROVED", amount))
+
+    def _organization(self, index: int) -> dict:
+        return {"id": f"org-sim-{index:04d}", "name": f"Organización simulada {index}"}
+
+    def _merchants(self, query: dict) -> dict:
+        organization_id = query.get("organization_id", "")
+        page = max(1, int(query.get("page", 1)))
+        page_size = max(1, int(query.get("page_size", 20)))
+        total = self.config.merchants_per_org
+        start = (page - 1) * page_size
+        data = [
+            {
+                "id": f"mer-{organization_id}-{i:06d}",
+                "organization_id": organization_id,
+                "name": f"Comercio simulado {i}",
+                "status": "ACTIVE",
+            }
+            for i in range(start, min(total, start + page_size))
+        ]
+        return {"data": data, "pagination": {"page": page, "page_size": page_size, "total": total}}
+
+
+def _json(body: bytes) -> dict:
+    if not body:
+        return {}
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise SimulatorError(400, "JSON inválido")
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+class SimulatorTransport(httpx.AsyncBaseTransport):
+    """
+    Transporte de httpx que responde desde el simulador, sin abrir sockets
+    """
+
+    def __init__(self, simulator: AkuaSimulator) -> None:
+        self.simulator = simulator
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        query = {key: value for key, value in request.url.params.items()}
+        status, headers, content = await self.simulator.handle(
+            request.method, request.url.path, query, {k.lower(): v for k, v in request.headers.items()}, body
+        )
+        return httpx.Response(status, headers=headers, content=content, request=request)
+
+
+def create_asgi_app(simulator: AkuaSimulator | None = None):
+    """
+    App ASGI mínima para levantar el simulador como servidor independiente
+    """
+    simulator = simulator or AkuaSimulator()
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        more = True
+        while more:
+            message = await receive()
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+
+        query = {key: values[-1] for key, values in parse_qs(scope["query_string"].decode()).items()}
+        headers = {key.decode().lower(): value.decode() for key, value in scope["headers"]}
+        status, response_headers, content = await simulator.handle(scope["method"], scope["path"], query, headers, body)
+
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(k.encode(), v.encode()) for k, v in response_headers.items()],
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    app.simulator = simulator
+    return app
+
+
+simulator = AkuaSimulator()
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Simulador local de la API de Akua")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    uvicorn.run(create_asgi_app(simulator), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import pickle
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+
+from app.config import settings
+from app.infrastructure.shared_state import SharedStateStore, shared_state
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    value: Any
+    fresh_until: float
+    stale_until: float
+    # Con cache compartido: hasta cuándo la copia local se usa sin releer el compartido
+    local_until: float = float("inf")
+
+
+class TTLCache:
+    """
+    Cache en memoria con TTL, LRU acotado y stale-while-revalidate.
+
+    - Dentro del TTL se responde desde cache
+    - Vencido pero dentro de `stale_seconds` se responde el valor viejo y se
+      refresca en segundo plano
+    - Los fallos concurrentes de una misma clave producen una sola carga
+    - Con `shared` (varios workers) lo cargado se publica en el estado
+      compartido; cada worker guarda una copia local por `local_seconds` y
+      después relee la compartida antes de ir a Akua
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        stale_seconds: float,
+        shared: SharedStateStore | None = None,
+        local_seconds: float = 1.0,
+    ) -> None:
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self.shared = shared
+        self.local_seconds = local_seconds
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.shared_hits = 0
+
+    async def get_or_load(self, key: Hashable, ttl: float, loader: Callable[[], Awaitable[Any]]) -> Any:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if self.shared is not None and (entry is None or now >= entry.local_until):
+            # Lo que ya no está en el compartido (vencido o invalidado por otro worker) se descarta
+            entry = await self._read_shared(key)
+            if entry is None:
+                self._entries.pop(key, None)
+        if entry is not None:
+            if now < entry.fresh_until:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry.value
+            if now < entry.stale_until:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._load(key, ttl, loader, background=True)
+                return entry.value
+            self._entries.pop(key, None)
+
+        self.misses += 1
+        return await asyncio.shield(self._load(key, ttl, loader))
+
+    def invalidate(self, predicate: Callable[[Hashable], bool] | None = None) -> int:
+        """
+        Elimina las claves que cumplen `predicate` (todas si no se indica)
+        """
+        keys = [key for key in self._entries if predicate is None or predicate(key)]
+        for key in keys:
+            del self._entries[key]
+        if self.shared is not None:
+            # Los demás workers dejan de verlas al vencer su copia local
+            shared_keys = [key for key in self.shared.cache_keys() if predicate is None or predicate(key)]
+            self.shared.cache_delete(shared_keys)
+            return len(set(keys) | set(shared_keys))
+        return len(keys)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "shared_hits": self.shared_hits,
+            "inflight": len(self._inflight),
+        }
+
+    def _load(self, key: Hashable, ttl: float, loader: Callable[[], Awaitable[Any]], background: bool = False) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run_loader(key, ttl, loader, background))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._loaded(key, done, background))
+        return task
+
+    def _loaded(self, key: Hashable, task: asyncio.Task, background: bool) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        # La tarea propaga el error a quien la espera (un fallo de la misma
+        # clave que se sumó al refresco); acá solo se registra el del refresco
+        error = task.exception()
+        if error is not None and background:
+            self.refresh_errors += 1
+            logger.warning("Error refrescando %s en segundo plano", key, exc_info=error)
+
+    async def _run_loader(self, key: Hashable, ttl: float, loader: Callable[[], Awaitable[Any]], background: bool) -> Any:
+        value = await loader()
+
+        if background:
+            self.refreshes += 1
+        entry = self._store(key, value, ttl)
+        if self.shared is not None:
+            offset = time.time() - time.monotonic()
+            try:
+                await asyncio.to_thread(
+                    self.shared.cache_put, key, pickle.dumps(value),
+                    entry.fresh_until + offset, entry.stale_until + offset,
+                )
+            except Exception:
+                logger.warning("Error publicando %s en el cache compartido", key, exc_info=True)
+        return value
+
+    async def _read_shared(self, key: Hashable) -> _Entry | None:
+        try:
+            stored = await asyncio.to_thread(self.shared.cache_get, key)
+        except Exception:
+            logger.warning("Error leyendo %s del cache compartido", key, exc_info=True)
+            return None
+        if stored is None:
+            return None
+        # El archivo compartido solo lo escriben los workers de esta app
+        value, fresh_until, stale_until = stored
+        offset = time.monotonic() - time.time()
+        self.shared_hits += 1
+        return self._put(key, _Entry(
+            pickle.loads(value), fresh_until + offset, stale_until + offset, time.monotonic() + self.local_seconds
+        ))
+
+    def _store(self, key: Hashable, value: Any, ttl: float) -> _Entry:
+        now = time.monotonic()
+        local_until = now + self.local_seconds if self.shared is not None else float("inf")
+        return self._put(key, _Entry(value, now + ttl, now + ttl + self.stale_seconds, local_until))
+
+    def _put(self, key: Hashable, entry: _Entry) -> _Entry:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+
+listing_cache = TTLCache(
+    max_entries=settings.cache_max_entries,
+    stale_seconds=settings.cache_stale_seconds,
+    shared=shared_state,
+    local_seconds=settings.shared_cache_local_seconds,
+)
@@ -0,0 +1,303 @@
+import asyncio
+import heapq
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from app.config import settings
+from app.infrastructure.akua_client import AkuaClient
+from app.infrastructure.database import capture_record, get_connection
+from app.infrastructure.leases import WORKER_ID, LeaseTable
+from app.infrastructure.payment_state import InvalidTransition
+from app.infrastructure.write_behind import write_queue
+from app.schemas.capture import CaptureRequest
+
+logger = logging.getLogger(__name__)
+
+PENDING = "PENDING"
+CAPTURED = "CAPTURED"
+SKIPPED = "SKIPPED"
+FAILED = "FAILED"
+
+
+def parse_capture_after(value: str) -> datetime:
+    """
+    `capture_after` del request: segundos desde ahora o fecha ISO 8601 (UTC si
+    no trae zona). Devuelve la fecha en UTC sin zona, como el resto de la base.
+    ValueError si no es válido o cae a más de AUTO_CAPTURE_MAX_DAYS de ahora
+    """
+    value = value.strip()
+    now = datetime.utcnow()
+    limit = timedelta(days=settings.auto_capture_max_days)
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = None
+    if seconds is not None:
+        # Se compara antes de armar el timedelta: 1e20 o inf lo desbordan
+        if not math.isfinite(seconds) or abs(seconds) > limit.total_seconds():
+            raise ValueError(f"fuera de rango (a lo sumo {settings.auto_capture_max_days:g} días): {value}")
+        return now + timedelta(seconds=seconds)
+
+    due = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if due.tzinfo is not None:
+        due = due.astimezone(timezone.utc).replace(tzinfo=None)
+    if due - now > limit:
+        raise ValueError(f"fuera de rango (a lo sumo {settings.auto_capture_max_days:g} días): {value}")
+    return due
+
+
+def _timestamp(due: datetime) -> float:
+    return due.replace(tzinfo=timezone.utc).timestamp()
+
+
+_LEASES = LeaseTable("scheduled_captures", "payment_id", f"status = '{PENDING}'")
+
+
+def _save_schedule(payment_id: str, merchant_id: str | None, due: datetime) -> None:
+    """
+    Guarda la captura con el lease de este worker (reprogramarla se la quita al anterior)
+    """
+    now = datetime.utcnow().isoformat()
+    with get_connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO scheduled_captures (payment_id, merchant_id, capture_after, status, attempts,
+                created_at, updated_at, owner, lease_until)
+            VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)
+            ON CONFLICT(payment_id) DO UPDATE SET capture_after = excluded.capture_after,
+                status = excluded.status, attempts = 0, last_error = NULL, updated_at = excluded.updated_at,
+                owner = excluded.owner, lease_until = excluded.lease_until
+            """,
+            (payment_id, merchant_id, due.isoformat(), PENDING, now, now, WORKER_ID, _LEASES.expires()),
+        )
+
+
+def _save_outcome(payment_id: str, status: str, attempts: int, error: str | None, retry_at: datetime | None) -> None:
+    with get_connection() as conn:
+        conn.execute(
+            """
+            UPDATE scheduled_captures SET status = ?, attempts = ?, last_error = ?,
+                capture_after = COALESCE(?, capture_after), updated_at = ?
+            WHERE payment_id = ?
+            """,
+            (status, attempts, error, retry_at.isoformat() if retry_at else None, datetime.utcnow().isoformat(), payment_id),
+        )
+
+
+class CaptureScheduler:
+    """
+    Captura automática de pre-autorizaciones con `capture_after`.
+
+    Las capturas pendientes viven en un heap ordenado por fecha (y en la tabla
+    scheduled_captures). La tarea duerme hasta la más próxima o hasta que
+    `schedule` agregue una anterior; nunca recorre la tabla. Las vencidas se
+    capturan en lotes con concurrencia acotada y a lo sumo `rate` capturas por
+    segundo hacia Akua.
+
+    Con varios workers cada captura es del que la programó (lease en la
+    tabla); las de un worker caído o detenido las toma otro cuando su lease
+    vence, y antes de capturar se confirma el lease para no hacerlo dos veces.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        rate: float,
+        batch_size: int,
+        max_attempts: int,
+        retry_delay: float,
+    ) -> None:
+        self.concurrency = concurrency
+        self.rate = rate
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._heap: list[tuple[float, str]] = []
+        # Fecha vigente de cada pago: las entradas del heap que no coinciden se descartan
+        self._due: dict[str, float] = {}
+        self._attempts: dict[str, int] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._lease_task: asyncio.Task | None = None
+        self._batch: asyncio.Future | None = None
+        self._client: AkuaClient | None = None
+        self._next_slot = 0.0
+
+        self.captured = 0
+        self.skipped = 0
+        self.failed = 0
+        self.retried = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, http_client: httpx.AsyncClient) -> None:
+        """
+        Arranca la tarea; las pendientes sin dueño vivo (lease vencido) se
+        toman de la tabla al arrancar y luego periódicamente
+        """
+        self._client = AkuaClient(http_client)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="capture-scheduler")
+        self._lease_task = asyncio.create_task(
+            _LEASES.keep("capture_after, attempts", self._take_over), name="capture-leases"
+        )
+
+    async def stop(self) -> None:
+        """
+        Detiene la tarea; un lote en curso termina antes (sus capturas ya salieron a Akua)
+        """
+        if not self.running:
+            return
+        self._lease_task.cancel()
+        self._task.cancel()
+        for task in (self._lease_task, self._task):
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._batch is not None and not self._batch.done():
+            await self._batch
+        self._task = self._lease_task = None
+        await asyncio.to_thread(_LEASES.release)
+
+    async def schedule(self, payment_id: str, due: datetime, merchant_id: str | None = None) -> None:
+        await asyncio.to_thread(_save_schedule, payment_id, merchant_id, due)
+        self._attempts.pop(payment_id, None)
+        self._push(payment_id, _timestamp(due))
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "pending": len(self._due),
+            "next_capture_at": (
+                datetime.utcfromtimestamp(min(self._due.values())).isoformat() if self._due else None
+            ),
+            "captured": self.captured,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+    def _take_over(self, rows: list[dict]) -> None:
+        for row in rows:
+            if row["attempts"]:
+                self._attempts[row["payment_id"]] = row["attempts"]
+            self._push(row["payment_id"], _timestamp(datetime.fromisoformat(row["capture_after"])))
+
+    def _push(self, payment_id: str, due: float) -> None:
+        self._due[payment_id] = due
+        heapq.heappush(self._heap, (due, payment_id))
+        # Solo hace falta despertar si la nueva es ahora la más próxima
+        if self._heap[0] == (due, payment_id):
+            self._wakeup.set()
+
+    def _pop_due(self) -> list[str]:
+        now = time.time()
+        batch = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            due, payment_id = heapq.heappop(self._heap)
+            if self._due.get(payment_id) == due:
+                del self._due[payment_id]
+                batch.append(payment_id)
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            # Entradas reprogramadas: se descartan sin esperar por ellas
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            batch = self._pop_due()
+            if batch:
+                # shield: si se detiene el scheduler, el lote en curso termina y persiste
+                self._batch = asyncio.ensure_future(self._run_batch(batch))
+                await asyncio.shield(self._batch)
+
+    async def _run_batch(self, batch: list[str]) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(payment_id: str) -> None:
+            async with semaphore:
+                await self._pace()
+                await self._capture(payment_id)
+
+        await asyncio.gather(*(run(payment_id) for payment_id in batch))
+
+    async def _pace(self) -> None:
+        """
+        Espacia el inicio de las capturas para no superar `rate` por segundo
+        """
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _capture(self, payment_id: str) -> None:
+        attempts = self._attempts.pop(payment_id, 0) + 1
+        if not await asyncio.to_thread(_LEASES.claim, payment_id):
+            # La tomó otro worker (nuestro lease venció) o ya no está pendiente
+            return
+        try:
+            result = await self._client.capture_payment(
+                payment_id, CaptureRequest(), idempotency_key=f"auto-capture-{payment_id}"
+            )
+        except InvalidTransition as e:
+            # Ya capturado o cancelado por otro camino: no hay nada que hacer
+            self.skipped += 1
+            await asyncio.to_thread(_save_outcome, payment_id, SKIPPED, attempts, str(e), None)
+            return
+        except Exception as e:
+            logger.warning("Captura automática de %s falló (intento %d): %s", payment_id, attempts, e)
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                await asyncio.to_thread(_save_outcome, payment_id, FAILED, attempts, str(e), None)
+                return
+            self.retried += 1
+            retry_at = datetime.utcnow() + timedelta(seconds=self.retry_delay * 2 ** (attempts - 1))
+            await asyncio.to_thread(_save_outcome, payment_id, PENDING, attempts, str(e), retry_at)
+            self._attempts[payment_id] = attempts
+            self._push(payment_id, _timestamp(retry_at))
+            return
+
+        akua = result["akua_response"]
+        transaction = akua.get("transaction") or {}
+        if not result.get("replayed"):
+            await write_queue.submit(capture_record(
+                payment_id=akua.get("payment_id") or payment_id,
+                transaction_id=transaction.get("id"),
+                amount=str(transaction.get("amount")) if transaction else None,
+                status=transaction.get("status", "UNKNOWN"),
+                raw_response=akua,
+            ))
+        self.captured += 1
+        await asyncio.to_thread(_save_outcome, payment_id, CAPTURED, attempts, None, None)
+
+
+capture_scheduler = CaptureScheduler(
+    concurrency=settings.auto_capture_concurrency,
+    rate=settings.auto_capture_rate,
+    batch_size=settings.auto_capture_batch_size,
+    max_attempts=settings.auto_capture_max_attempts,
+    retry_delay=settings.auto_capture_retry_seconds,
+)
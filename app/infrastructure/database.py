@@ -1,87 +1,252 @@
+import contextlib
 import sqlite3
-import json
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
 
-DB_PATH = Path(__file__).resolve().parent.parent / "data" / "akua_poc.db"
+from app.config import settings
+from app.infrastructure.metrics import sqlite_rows_per_commit, sqlite_write_duration, sqlite_write_errors
+from app.infrastructure.migrations import apply_migrations
+from app.infrastructure.passthrough import AkuaBody
+from app.infrastructure.raw_codec import encode_raw, extract_fields
+from app.infrastructure.rollups import rollup_rows, upsert_sql
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin locks de archivo
+    fcntl = None
+
+DB_PATH = Path(settings.database_path) if settings.database_path else (
+    Path(__file__).resolve().parent.parent / "data" / "akua_poc.db"
+)
 DB_PATH.parent.mkdir(exist_ok=True)
 
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+# Se incrementa en close_connections() para que cada hilo reabra la suya
+_generation = 0
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+
+def _open_connection(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    conn.execute(f"PRAGMA cache_size=-{settings.sqlite_cache_size_kb}")
+    conn.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size_mb * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Conexión persistente por hilo (el event loop y los hilos de asyncio.to_thread
+    tienen cada uno la suya). Se abre una vez con WAL y los PRAGMA de ajuste.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != DB_PATH or _local.generation != _generation:
+        conn = _open_connection(DB_PATH)
+        _local.conn = conn
+        _local.path = DB_PATH
+        _local.generation = _generation
+        with _connections_lock:
+            _connections.append(conn)
     return conn
 
 
+def open_read_connection() -> sqlite3.Connection:
+    """
+    Conexión nueva, fuera del pool por hilo, para lecturas largas por cursor
+    (exportaciones) que no deben ocupar la conexión del hilo
+    """
+    return _open_connection(DB_PATH)
+
+
+def close_connections() -> None:
+    global _generation
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+        _generation += 1
+
+
+@contextlib.contextmanager
+def _migration_lock():
+    """
+    Lock entre procesos: con varios workers, uno aplica las migraciones y los
+    demás esperan y encuentran el esquema al día
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(DB_PATH.with_name(DB_PATH.name + ".migrate.lock"), "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
 def init_db():
-    with get_connection() as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS payments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_id TEXT NOT NULL,
-                payment_id TEXT NOT NULL,
-                transaction_id TEXT NOT NULL,
-                status TEXT NOT NULL,
-                raw_response TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS authorizations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                merchant_id TEXT NOT NULL,
-                authorization_id TEXT NOT NULL,
-                payment_id TEXT,
-                transaction_id TEXT,
-                status TEXT NOT NULL,
-                type TEXT NOT NULL DEFAULT 'AUTHORIZATION',
-                raw_response TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS cancellations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                payment_id TEXT NOT NULL,
-                transaction_id TEXT NOT NULL,
-                status TEXT NOT NULL,
-                raw_response TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS captures (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                payment_id TEXT NOT NULL,
-                transaction_id TEXT NOT NULL,
-                amount TEXT,
-                status TEXT NOT NULL,
-                raw_response TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )
-            """
-        )
-        conn.commit()
-
-
-def save_payment(order_id: str, payment_id: str, transaction_id: str, status: str, raw_response: dict):
-    created_at = datetime.utcnow().isoformat()
-    with get_connection() as conn:
-        conn.execute(
-            """
-            INSERT INTO payments (order_id, payment_id, transaction_id, status, raw_response, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (order_id, payment_id, transaction_id, status, json.dumps(raw_response), created_at),
-        )
-        conn.commit()
+    with _migration_lock():
+        apply_migrations(get_connection())
+
+
+Record = tuple[str, dict]
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+def _raw_columns(raw_response: dict | AkuaBody, with_merchant: bool = True) -> dict:
+    """
+    raw_response comprimido más los campos promovidos a columnas. Con un
+    AkuaBody se comprimen los mismos bytes recibidos de Akua
+    """
+    if isinstance(raw_response, AkuaBody):
+        encoded, data = encode_raw(raw_response.raw), raw_response.data
+    else:
+        encoded, data = encode_raw(raw_response), raw_response
+    columns = {"raw_response": encoded, **extract_fields(data)}
+    if with_merchant:
+        columns["merchant_id"] = data.get("merchant_id")
+    return columns
+
+
+def payment_record(order_id: str, payment_id: str, transaction_id: str, status: str, raw_response: dict | AkuaBody) -> Record:
+    return "payments", {
+        "order_id": order_id,
+        "payment_id": payment_id,
+        "transaction_id": transaction_id,
+        "status": status,
+        **_raw_columns(raw_response),
+        "created_at": _now(),
+    }
+
+
+def authorization_record(
+    merchant_id: str,
+    authorization_id: str,
+    payment_id: str | None,
+    transaction_id: str | None,
+    status: str,
+    raw_response: dict | AkuaBody,
+    auth_type: str = "AUTHORIZATION",
+) -> Record:
+    return "authorizations", {
+        "merchant_id": merchant_id,
+        "authorization_id": authorization_id,
+        "payment_id": payment_id,
+        "transaction_id": transaction_id,
+        "status": status,
+        "type": auth_type,
+        **_raw_columns(raw_response, with_merchant=False),
+        "created_at": _now(),
+    }
+
+
+def cancellation_record(
+    payment_id: str,
+    transaction_id: str,
+    status: str,
+    raw_response: dict | AkuaBody,
+) -> Record:
+    return "cancellations", {
+        "payment_id": payment_id,
+        "transaction_id": transaction_id,
+        "status": status,
+        **_raw_columns(raw_response),
+        "created_at": _now(),
+    }
+
+
+def capture_record(
+    payment_id: str,
+    transaction_id: str,
+    amount: str | None,
+    status: str,
+    raw_response: dict | AkuaBody,
+) -> Record:
+    return "captures", {
+        "payment_id": payment_id,
+        "transaction_id": transaction_id,
+        "amount": amount,
+        "status": status,
+        **_raw_columns(raw_response),
+        "created_at": _now(),
+    }
+
+
+def refund_record(
+    payment_id: str,
+    transaction_id: str | None,
+    status: str,
+    raw_response: dict | AkuaBody,
+) -> Record:
+    return "refunds", {
+        "payment_id": payment_id,
+        "transaction_id": transaction_id,
+        "status": status,
+        **_raw_columns(raw_response),
+        "created_at": _now(),
+    }
+
+
+# Tablas de estado (una fila por clave) que se escriben como upsert: la fila
+# solo se reemplaza por una de versión mayor
+UPSERT_KEYS = {"payment_ledger": "payment_id"}
+
+
+def _insert_sql(table: str, columns: tuple[str, ...]) -> str:
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    key = UPSERT_KEYS.get(table)
+    if key:
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column != key)
+        sql += f" ON CONFLICT({key}) DO UPDATE SET {updates} WHERE excluded.version > {table}.version"
+    return sql
+
+
+def group_records(records: list[Record]) -> dict[tuple[str, tuple[str, ...]], list[tuple]]:
+    """
+    Agrupa los registros por (tabla, columnas): una sentencia por grupo
+    """
+    by_statement: dict[tuple[str, tuple[str, ...]], list[tuple]] = {}
+    for table, values in records:
+        key = (table, tuple(values))
+        by_statement.setdefault(key, []).append(tuple(values.values()))
+    return by_statement
+
+
+def write_records(records: list[Record]) -> None:
+    """
+    Inserta un lote de registros (de cualquier tabla) en una sola transacción,
+    junto con los deltas de los rollups de volumen
+    """
+    by_statement = group_records(records)
+
+    started = time.perf_counter()
+    try:
+        with get_connection() as conn:
+            for (table, columns), rows in by_statement.items():
+                conn.executemany(_insert_sql(table, columns), rows)
+            for granularity, deltas in rollup_rows(records).items():
+                if deltas:
+                    conn.executemany(upsert_sql(granularity), deltas)
+            conn.commit()
+    except Exception:
+        sqlite_write_errors.inc()
+        raise
+    sqlite_write_duration.observe(time.perf_counter() - started)
+    sqlite_rows_per_commit.observe(len(records))
+
+
+def save_payment(order_id: str, payment_id: str, transaction_id: str, status: str, raw_response: dict | AkuaBody):
+    write_records([payment_record(order_id, payment_id, transaction_id, status, raw_response)])
 
 
 def save_authorization(
@@ -90,73 +255,35 @@ def save_authorization(
     payment_id: str | None,
     transaction_id: str | None,
     status: str,
-    raw_response: dict,
+    raw_response: dict | AkuaBody,
     auth_type: str = "AUTHORIZATION",
 ):
-    created_at = datetime.utcnow().isoformat()
-    with get_connection() as conn:
-        conn.execute(
-            """
-            INSERT INTO authorizations (merchant_id, authorization_id, payment_id, transaction_id, status, type, raw_response, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                merchant_id,
-                authorization_id,
-                payment_id,
-                transaction_id,
-                status,
-                auth_type,
-                json.dumps(raw_response),
-                created_at,
-            ),
-        )
-        conn.commit()
+    write_records([
+        authorization_record(merchant_id, authorization_id, payment_id, transaction_id, status, raw_response, auth_type)
+    ])
 
 def save_cancellation(
     payment_id: str,
     transaction_id: str,
     status: str,
-    raw_response: dict,
+    raw_response: dict | AkuaBody,
 ):
-    created_at = datetime.utcnow().isoformat()
-    with get_connection() as conn:
-        conn.execute(
-            """
-            INSERT INTO cancellations (payment_id, transaction_id, status, raw_response, created_at)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (
-                payment_id,
-                transaction_id,
-                status,
-                json.dumps(raw_response),
-                created_at,
-            ),
-        )
-        conn.commit()
+    write_records([cancellation_record(payment_id, transaction_id, status, raw_response)])
 
 def save_capture(
     payment_id: str,
     transaction_id: str,
     amount: str | None,
     status: str,
-    raw_response: dict,
+    raw_response: dict | AkuaBody,
+):
+    write_records([capture_record(payment_id, transaction_id, amount, status, raw_response)])
+
+
+def save_refund(
+    payment_id: str,
+    transaction_id: str | None,
+    status: str,
+    raw_response: dict | AkuaBody,
 ):
-    created_at = datetime.utcnow().isoformat()
-    with get_connection() as conn:
-        conn.execute(
-            """
-            INSERT INTO captures (payment_id, transaction_id, amount, status, raw_response, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (
-                payment_id,
-                transaction_id,
-                amount,
-                status,
-                json.dumps(raw_response),
-                created_at,
-            ),
-        )
-        conn.commit()
\ No newline at end of file
+    write_records([refund_record(payment_id, transaction_id, status, raw_response)])
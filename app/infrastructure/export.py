@@ -0,0 +1,232 @@
+import csv
+import io
+import json
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator
+
+from app.infrastructure.storage import storage
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # opcional: pip install pyarrow
+    pyarrow = None
+    parquet = None
+
+FORMATS = ("csv", "parquet")
+MEDIA_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+# Columnas exportadas (las mismas de /v1/payments, sin raw_response)
+COLUMNS = (
+    "source", "id", "merchant_id", "authorization_id", "payment_id", "transaction_id",
+    "status", "type", "amount", "amount_value", "currency", "created_at",
+)
+_NUMERIC = {"id": "int64", "amount_value": "float64"}
+
+MANIFEST = "_export.json"
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def check_format(fmt: str) -> None:
+    if fmt not in FORMATS:
+        raise UnsupportedFormat(f"Formato no soportado: {fmt} (csv o parquet)")
+    if fmt == "parquet" and pyarrow is None:
+        raise UnsupportedFormat("El formato parquet requiere el paquete 'pyarrow' (pip install pyarrow)")
+
+
+async def _csv_stream(chunks: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    async for rows in chunks:
+        writer.writerows([row.get(column) for column in COLUMNS] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _StreamSink:
+    """
+    Destino de escritura para ParquetWriter que entrega los bytes a medida que
+    se escriben (Parquet solo escribe hacia adelante: no necesita seek)
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _parquet_schema():
+    return pyarrow.schema([(column, _NUMERIC.get(column, "string")) for column in COLUMNS])
+
+
+async def _parquet_stream(chunks: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    schema = _parquet_schema()
+    sink = _StreamSink()
+    writer = parquet.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        # Un row group por bloque: nunca hay más de un bloque en memoria
+        async for rows in chunks:
+            columns = {column: [row.get(column) for row in rows] for column in COLUMNS}
+            if columns["amount"]:
+                columns["amount"] = [None if value is None else str(value) for value in columns["amount"]]
+            writer.write_table(pyarrow.Table.from_pydict(columns, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def encode(fmt: str, chunks: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    check_format(fmt)
+    return _parquet_stream(chunks) if fmt == "parquet" else _csv_stream(chunks)
+
+
+def stream_export(
+    fmt: str,
+    chunk_size: int,
+    merchant_id: str | None = None,
+    created_from: str | None = None,
+    created_to: str | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Bytes del archivo exportado, generados bloque a bloque
+    """
+    return encode(fmt, storage.iter_transactions(chunk_size, merchant_id, created_from, created_to))
+
+
+def _partition_path(out_dir: Path, day: date, fmt: str) -> Path:
+    return out_dir / f"date={day.isoformat()}" / f"transactions.{fmt}"
+
+
+def _read_manifest(out_dir: Path, fmt: str, merchant_id: str | None) -> dict:
+    """
+    Una carpeta de exportación corresponde a un formato y un filtro de merchant
+    (si no, las particiones no serían comparables) y guarda hasta qué día se exportó
+    """
+    path = out_dir / MANIFEST
+    if not path.exists():
+        return {"format": fmt, "merchant_id": merchant_id, "exported_through": None}
+    manifest = json.loads(path.read_text())
+    if (manifest.get("format"), manifest.get("merchant_id")) != (fmt, merchant_id):
+        raise ValueError(
+            f"{out_dir} ya tiene una exportación con otros parámetros: "
+            f"format={manifest.get('format')} merchant_id={manifest.get('merchant_id')}"
+        )
+    return manifest
+
+
+def _write_manifest(out_dir: Path, manifest: dict) -> None:
+    path = out_dir / MANIFEST
+    partial = path.with_name(path.name + ".partial")
+    partial.write_text(json.dumps(manifest))
+    os.replace(partial, path)
+
+
+async def _write_partition(path: Path, fmt: str, chunks: AsyncIterator[list[dict]]) -> int:
+    """
+    Escribe la partición y devuelve sus filas; sin filas no deja archivo. Se
+    escribe aparte y se renombra al terminar: si el archivo existe, está completo
+    """
+    rows = 0
+
+    async def counted():
+        nonlocal rows
+        async for chunk in chunks:
+            rows += len(chunk)
+            yield chunk
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".partial")
+    with partial.open("wb") as handle:
+        async for data in encode(fmt, counted()):
+            handle.write(data)
+    if rows:
+        os.replace(partial, path)
+    else:
+        partial.unlink()
+        path.parent.rmdir()
+    return rows
+
+
+async def export_partitions(
+    out_dir: Path,
+    fmt: str,
+    chunk_size: int,
+    merchant_id: str | None = None,
+    start: date | None = None,
+    end: date | None = None,
+) -> dict:
+    """
+    Exporta una partición por día (date=YYYY-MM-DD) entre `start` y `end`
+    (exclusivo; por defecto hasta hoy, es decir, solo días completos).
+
+    Incremental: sin `start` sigue desde el último día exportado según el
+    manifiesto de la carpeta, y las particiones que ya existen se saltan.
+    """
+    check_format(fmt)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _read_manifest(out_dir, fmt, merchant_id)
+    if start is None and manifest["exported_through"]:
+        start = date.fromisoformat(manifest["exported_through"]) + timedelta(days=1)
+    if start is None:
+        first = await storage.first_created_at()
+        start = datetime.fromisoformat(first).date() if first else None
+    end = end or datetime.utcnow().date()
+
+    written, skipped, empty = [], 0, 0
+    day = start
+    while day is not None and day < end:
+        path = _partition_path(out_dir, day, fmt)
+        if path.exists():
+            skipped += 1
+        else:
+            chunks = storage.iter_transactions(
+                chunk_size, merchant_id, day.isoformat(), (day + timedelta(days=1)).isoformat()
+            )
+            rows = await _write_partition(path, fmt, chunks)
+            if rows:
+                written.append({"date": day.isoformat(), "rows": rows, "path": str(path)})
+            else:
+                empty += 1
+        if manifest["exported_through"] is None or day.isoformat() > manifest["exported_through"]:
+            manifest["exported_through"] = day.isoformat()
+            _write_manifest(out_dir, manifest)
+        day += timedelta(days=1)
+
+    return {
+        "written": written,
+        "skipped": skipped,
+        "empty_days": empty,
+        "exported_through": manifest["exported_through"],
+    }
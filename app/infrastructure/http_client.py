@@ -0,0 +1,69 @@
+import logging
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_enabled() -> bool:
+    """
+    HTTP/2 requiere el paquete opcional `h2` (pip install httpx[http2])
+    """
+    if not settings.akua_http2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("AKUA_HTTP2=true pero el paquete 'h2' no está instalado, se usa HTTP/1.1")
+        return False
+    return True
+
+
+SIMULATOR_BASE_URL = "http://akua-simulator"
+
+
+def akua_base_url() -> str:
+    """
+    URL base de Akua según AKUA_MODE (REAL, SIMULATOR o MOCK en proceso)
+    """
+    mode = settings.akua_mode.upper()
+    if mode == "MOCK":
+        return SIMULATOR_BASE_URL
+    if mode == "SIMULATOR":
+        return settings.akua_simulator_url.rstrip("/")
+    return (settings.akua_base_url or "").rstrip("/")
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """
+    Cliente HTTP de larga vida hacia Akua, compartido por toda la aplicación.
+    Reutiliza conexiones (keep-alive) para no pagar TCP+TLS en cada llamada.
+
+    En AKUA_MODE=MOCK las peticiones las responde el simulador en proceso.
+    """
+    transport = None
+    if settings.akua_mode.upper() == "MOCK":
+        from app.infrastructure.akua_simulator import SimulatorTransport, simulator
+        transport = SimulatorTransport(simulator)
+
+    limits = httpx.Limits(
+        max_connections=settings.akua_http_max_connections,
+        max_keepalive_connections=settings.akua_http_max_keepalive,
+        keepalive_expiry=settings.akua_http_keepalive_expiry,
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=operation_timeout("default"),
+        http2=_http2_enabled(),
+        transport=transport,
+    )
+
+
+def operation_timeout(operation: str) -> httpx.Timeout:
+    """
+    Timeout para una operación de Akua (authorization, capture, list_merchants, ...)
+    """
+    total = settings.akua_operation_timeouts.get(operation, settings.akua_default_timeout)
+    return httpx.Timeout(total, connect=min(settings.akua_connect_timeout, total))
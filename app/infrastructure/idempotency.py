@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from app.config import settings
+from app.infrastructure.database import DB_PATH, get_connection
+from app.infrastructure.passthrough import AkuaBody
+from app.infrastructure.timing import stage
+
+IN_FLIGHT = "IN_FLIGHT"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+
+
+class IdempotencyConflict(Exception):
+    """
+    La key ya se usó con otro cuerpo (422) o sigue en curso en otro proceso (409)
+    """
+
+    def __init__(self, message: str, status_code: int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+SECRET_PATH = DB_PATH.with_name(DB_PATH.name + ".idempotency-secret")
+_secret: bytes | None = None
+
+
+def _load_or_create_secret() -> bytes:
+    """
+    Secreto aleatorio guardado junto a la base: sobrevive reinicios y lo
+    comparten los workers (el primero que lo crea gana, los demás lo leen)
+    """
+    try:
+        fd = os.open(SECRET_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Otro worker pudo haberlo creado y aún no escrito
+        for _ in range(50):
+            secret = SECRET_PATH.read_bytes().strip()
+            if secret:
+                return secret
+            time.sleep(0.01)
+        raise RuntimeError(f"{SECRET_PATH} está vacío")
+    secret = secrets.token_hex(32).encode()
+    with os.fdopen(fd, "wb") as handle:
+        handle.write(secret)
+    return secret
+
+
+def hash_secret() -> bytes:
+    """
+    Clave del HMAC de las huellas. En modo REAL es obligatorio IDEMPOTENCY_SECRET
+    (las huellas incluyen datos de tarjeta); en MOCK, sin él se usa uno aleatorio
+    """
+    global _secret
+    if _secret is None:
+        if settings.idempotency_secret:
+            _secret = settings.idempotency_secret.encode()
+        elif settings.akua_mode.upper() == "REAL":
+            raise RuntimeError("AKUA_MODE=REAL requiere IDEMPOTENCY_SECRET")
+        else:
+            _secret = _load_or_create_secret()
+    return _secret
+
+
+def request_hash(operation: str, *parts: object) -> str:
+    """
+    Huella del request (HMAC, para no guardar un hash de datos de tarjeta
+    reversible por fuerza bruta)
+    """
+    canonical = json.dumps([operation, *parts], sort_keys=True, separators=(",", ":"), default=str)
+    return hmac.new(hash_secret(), canonical.encode(), hashlib.sha256).hexdigest()
+
+
+def _claim(key: str, operation: str, req_hash: str) -> tuple[str, AkuaBody | None]:
+    """
+    Reserva la key de forma atómica. Devuelve ("claimed", None), ("completed", respuesta)
+    o lanza IdempotencyConflict
+    """
+    now = datetime.utcnow()
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT request_hash, status, response, updated_at FROM idempotency_keys WHERE key = ?",
+            (key,),
+        ).fetchone()
+
+        if row is not None:
+            if row["request_hash"] != req_hash:
+                raise IdempotencyConflict(
+                    f"Idempotency-Key {key} ya fue usada con un request distinto", 422
+                )
+            if row["status"] == COMPLETED:
+                conn.rollback()
+                return "completed", AkuaBody(row["response"].encode())
+            stale_before = now - timedelta(seconds=settings.idempotency_inflight_timeout)
+            if row["status"] == IN_FLIGHT and datetime.fromisoformat(row["updated_at"]) > stale_before:
+                raise IdempotencyConflict(f"Hay un request en curso con Idempotency-Key {key}", 409)
+
+        conn.execute(
+            """
+            INSERT INTO idempotency_keys (key, operation, request_hash, status, response, created_at, updated_at)
+            VALUES (?, ?, ?, ?, NULL, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET status = excluded.status, response = NULL, updated_at = excluded.updated_at
+            """,
+            (key, operation, req_hash, IN_FLIGHT, now.isoformat(), now.isoformat()),
+        )
+        conn.commit()
+        return "claimed", None
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def _finish(key: str, status: str, response: AkuaBody | None) -> None:
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE idempotency_keys SET status = ?, response = ?, updated_at = ? WHERE key = ?",
+            (status, response.raw.decode() if response is not None else None, datetime.utcnow().isoformat(), key),
+        )
+
+
+def _is_completed(key: str, req_hash: str) -> bool:
+    row = get_connection().execute(
+        "SELECT request_hash, status FROM idempotency_keys WHERE key = ?", (key,)
+    ).fetchone()
+    return row is not None and row["status"] == COMPLETED and row["request_hash"] == req_hash
+
+
+def completed_response(key: str) -> AkuaBody | None:
+    """
+    Respuesta guardada de una key completada, sin comparar la huella del request
+    """
+    row = get_connection().execute(
+        "SELECT response FROM idempotency_keys WHERE key = ? AND status = ?", (key, COMPLETED)
+    ).fetchone()
+    return AkuaBody(row["response"].encode()) if row else None
+
+
+def purge_expired() -> int:
+    cutoff = (datetime.utcnow() - timedelta(hours=settings.idempotency_ttl_hours)).isoformat()
+    with get_connection() as conn:
+        return conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (cutoff,)).rowcount
+
+
+class IdempotencyStore:
+    """
+    Registro de operaciones por Idempotency-Key.
+
+    - Si la key ya se completó, devuelve la respuesta guardada sin ir a Akua
+    - Si está en curso en este proceso con el mismo request, espera ese mismo
+      resultado (con otro request, 422 como en el registro)
+    - Los fallos no se guardan como resultado: un reintento vuelve a Akua
+      con la misma key
+    """
+
+    def __init__(self) -> None:
+        # key -> (huella del request, resultado en curso)
+        self._inflight: dict[str, tuple[str, asyncio.Future]] = {}
+
+    async def is_completed(self, key: str, req_hash: str) -> bool:
+        """
+        La key ya se completó con este mismo request
+        """
+        return await asyncio.to_thread(_is_completed, key, req_hash)
+
+    async def run(
+        self,
+        key: str,
+        operation: str,
+        req_hash: str,
+        call: Callable[[], Awaitable[AkuaBody]],
+    ) -> tuple[AkuaBody, bool]:
+        """
+        Devuelve (respuesta de Akua, replayed)
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            inflight_hash, inflight_future = inflight
+            if inflight_hash != req_hash:
+                raise IdempotencyConflict(f"Idempotency-Key {key} ya fue usada con un request distinto", 422)
+            return await asyncio.shield(inflight_future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (req_hash, future)
+        try:
+            with stage("idempotency"):
+                state, stored = await asyncio.to_thread(_claim, key, operation, req_hash)
+            if state == "completed":
+                future.set_result(stored)
+                return stored, True
+
+            try:
+                response = await call()
+            except BaseException:
+                with stage("idempotency"):
+                    await asyncio.to_thread(_finish, key, FAILED, None)
+                raise
+            with stage("idempotency"):
+                await asyncio.to_thread(_finish, key, COMPLETED, response)
+            future.set_result(response)
+            return response, False
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Evita el warning de "exception never retrieved" si nadie esperaba
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,516 @@
+import asyncio
+import ipaddress
+import json
+import logging
+import socket
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi.responses import Response
+
+from app.config import settings
+from app.infrastructure.akua_client import AkuaClient
+from app.infrastructure.database import (
+    authorization_record,
+    cancellation_record,
+    capture_record,
+    get_connection,
+    refund_record,
+)
+from app.infrastructure.idempotency import IdempotencyConflict, completed_response
+from app.infrastructure.leases import WORKER_ID, LeaseTable
+from app.infrastructure.passthrough import AkuaBody, envelope_bytes, envelope_response
+from app.infrastructure.payment_state import InvalidTransition
+from app.infrastructure.write_behind import write_queue
+from app.schemas.authorization import AuthorizationRequest
+from app.schemas.cancel import CancelRequest
+from app.schemas.capture import CaptureRequest
+from app.schemas.refund import RefundRequest
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+
+JOB_COLUMNS = (
+    "id", "operation", "payment_id", "status", "attempts", "status_code", "error",
+    "response", "callback_url", "callback_status", "created_at", "updated_at",
+)
+
+
+@dataclass
+class JobOptions:
+    """
+    Modo asíncrono pedido por el cliente (header `Prefer: respond-async`)
+    """
+
+    requested: bool = False
+    callback_url: str | None = None
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+class InvalidCallbackUrl(ValueError):
+    pass
+
+
+_CALLBACK_ALLOWED_HOSTS = {
+    host.strip().lower() for host in settings.jobs_callback_allowed_hosts.split(",") if host.strip()
+}
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global
+
+
+async def check_callback_url(url: str) -> None:
+    """
+    Evita que Callback-Url haga que el servicio envíe requests a direcciones
+    internas (SSRF): solo http/https y, sin JOBS_CALLBACK_ALLOWED_HOSTS, solo
+    hosts cuyas direcciones resueltas son todas públicas
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise InvalidCallbackUrl("Callback-Url debe ser una URL http o https")
+    host = parts.hostname.lower()
+    if _CALLBACK_ALLOWED_HOSTS:
+        if host not in _CALLBACK_ALLOWED_HOSTS:
+            raise InvalidCallbackUrl(f"Callback-Url: host no permitido ({host})")
+        return
+
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        addresses = [info[4][0] for info in await asyncio.get_running_loop().getaddrinfo(
+            host, port, type=socket.SOCK_STREAM
+        )]
+    except (OSError, ValueError):
+        raise InvalidCallbackUrl(f"Callback-Url: no se pudo resolver {host}")
+    if not addresses or not all(_is_public(address) for address in addresses):
+        raise InvalidCallbackUrl(f"Callback-Url: {host} no es una dirección pública")
+
+
+# Pendientes: por ejecutar o con el callback sin entregar
+_LEASES = LeaseTable("jobs", "id", f"status IN ('{QUEUED}', '{RUNNING}') OR callback_status = 'PENDING'")
+
+
+def _without_cvv(payload: dict) -> tuple[dict, str | None]:
+    """
+    Copia del payload sin instrument.card.cvv (no se guarda en disco) y el CVV
+    """
+    card = (payload.get("instrument") or {}).get("card")
+    if not isinstance(card, dict) or "cvv" not in card:
+        return payload, None
+    card = dict(card)
+    cvv = card.pop("cvv")
+    return {**payload, "instrument": {**payload["instrument"], "card": card}}, cvv
+
+
+def _insert_job(job: dict) -> None:
+    with get_connection() as conn:
+        conn.execute(
+            f"INSERT INTO jobs ({', '.join(job)}) VALUES ({', '.join('?' for _ in job)})",
+            tuple(job.values()),
+        )
+
+
+def get_job(job_id: str, with_request: bool = False) -> dict | None:
+    """
+    Estado del job; el request (sin CVV) solo lo leen los workers que lo ejecutan
+    """
+    columns = ", ".join(JOB_COLUMNS) + (", request, idempotency_key" if with_request else "")
+    row = get_connection().execute(f"SELECT {columns} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def _update_job(job_id: str, **fields) -> None:
+    fields["updated_at"] = _now()
+    with get_connection() as conn:
+        conn.execute(
+            f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+            (*fields.values(), job_id),
+        )
+
+
+def purge_finished() -> int:
+    """
+    Borra los jobs terminados hace más de JOBS_RETENTION_HOURS (con el callback
+    ya entregado o descartado)
+    """
+    cutoff = (datetime.utcnow() - timedelta(hours=settings.jobs_retention_hours)).isoformat()
+    with get_connection() as conn:
+        return conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ? "
+            "AND (callback_status IS NULL OR callback_status <> 'PENDING')",
+            (SUCCEEDED, FAILED, cutoff),
+        ).rowcount
+
+
+def job_envelope(job: dict) -> dict:
+    envelope = {
+        "job_id": job["id"],
+        "operation": job["operation"],
+        "payment_id": job["payment_id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "status_url": f"/v1/jobs/{job['id']}",
+    }
+    if job["status"] in (SUCCEEDED, FAILED):
+        envelope["status_code"] = job["status_code"]
+    if job["error"]:
+        envelope["error"] = job["error"]
+    if job["response"]:
+        # El cuerpo de Akua se guardó tal como llegó y se devuelve sin re-serializar
+        envelope["result"] = AkuaBody(job["response"].encode())
+    if job["callback_url"]:
+        envelope["callback_status"] = job["callback_status"]
+    return envelope
+
+
+async def _execute(client: AkuaClient, operation: str, payment_id: str | None, payload: dict, key: str | None) -> dict:
+    """
+    Ejecuta la operación y persiste el resultado igual que el router síncrono
+    """
+    if operation == "authorization":
+        body = AuthorizationRequest.model_validate(payload)
+        result = await client.create_authorization(body, key)
+        akua = result["akua_response"]
+        record = authorization_record(
+            merchant_id=body.merchant_id,
+            authorization_id=body.id or "auto-generated",
+            payment_id=akua.get("payment_id"),
+            transaction_id=akua.get("transaction", {}).get("id"),
+            status=akua.get("transaction", {}).get("status", "UNKNOWN"),
+            raw_response=akua,
+            auth_type="PRE_AUTHORIZATION" if body.intent == "pre-authorization" else "AUTHORIZATION",
+        )
+    elif operation == "capture":
+        result = await client.capture_payment(payment_id, CaptureRequest.model_validate(payload), key)
+        akua = result["akua_response"]
+        record = capture_record(
+            payment_id=akua.get("payment_id") or payment_id,
+            transaction_id=akua.get("transaction", {}).get("id"),
+            amount=str(akua.get("transaction", {}).get("amount")) if akua.get("transaction") else None,
+            status=akua.get("transaction", {}).get("status", "UNKNOWN"),
+            raw_response=akua,
+        )
+    elif operation == "cancel":
+        result = await client.cancel_payment(payment_id, CancelRequest.model_validate(payload), key)
+        akua = result["akua_response"]
+        record = cancellation_record(
+            payment_id=akua.get("payment_id") or payment_id,
+            transaction_id=akua.get("transaction", {}).get("id"),
+            status=akua.get("transaction", {}).get("status", "UNKNOWN"),
+            raw_response=akua,
+        )
+    elif operation == "refund":
+        result = await client.refund_payment(payment_id, RefundRequest.model_validate(payload), key)
+        akua = result["akua_response"]
+        record = refund_record(
+            payment_id=akua.get("payment_id") or payment_id,
+            transaction_id=akua.get("transaction", {}).get("id"),
+            status=akua.get("transaction", {}).get("status", "UNKNOWN"),
+            raw_response=akua,
+        )
+    else:
+        raise ValueError(f"Operación desconocida: {operation}")
+
+    # Un duplicado respondido desde el registro de idempotencia ya fue persistido
+    if not result.get("replayed"):
+        await write_queue.submit(record)
+    return result
+
+
+class JobQueue:
+    """
+    Modo asíncrono de las operaciones de pago (outbox en la tabla jobs).
+
+    `enqueue` confirma el job en SQLite y responde de inmediato (202); un pool
+    de `workers` tareas lo ejecuta contra Akua. Los jobs de un mismo pago van
+    siempre al mismo worker, así una captura y su reembolso no se adelantan
+    entre sí. Al terminar se notifica `callback_url` si se indicó.
+
+    Con varios workers cada job es del que lo encoló (lease en la tabla). Los
+    de un worker caído o detenido, encolados o a medio ejecutar (se reenvían
+    con la misma Idempotency-Key) o con el callback sin entregar, los toma
+    otro cuando su lease vence; antes de ejecutar se confirma el lease.
+
+    El CVV de una autorización no se guarda en la tabla: queda en memoria hasta
+    que el job se ejecuta, y el request se borra cuando el job termina.
+    """
+
+    def __init__(self, workers: int, callback_timeout: float, callback_attempts: int) -> None:
+        self.workers = workers
+        self.callback_timeout = callback_timeout
+        self.callback_attempts = callback_attempts
+        self._queues: list[asyncio.Queue] = []
+        self._tasks: list[asyncio.Task] = []
+        self._busy: set[asyncio.Task] = set()
+        self._callbacks: set[asyncio.Task] = set()
+        # job_id -> CVV de las autorizaciones encoladas por este proceso
+        self._cvvs: dict[str, str] = {}
+        self._purge_task: asyncio.Task | None = None
+        self._lease_task: asyncio.Task | None = None
+        self._client: AkuaClient | None = None
+        self._callback_http: httpx.AsyncClient | None = None
+        self._stopping = False
+
+        self.enqueued = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.callbacks_delivered = 0
+        self.callbacks_failed = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self, http_client: httpx.AsyncClient) -> None:
+        """
+        Arranca los workers; los jobs pendientes sin dueño vivo (lease vencido)
+        se toman de la tabla al arrancar y luego periódicamente
+        """
+        self._client = AkuaClient(http_client)
+        # Los callbacks van a URLs del cliente, no a Akua: cliente HTTP propio
+        self._callback_http = httpx.AsyncClient(timeout=self.callback_timeout)
+        self._stopping = False
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(queue), name=f"job-worker-{index}")
+            for index, queue in enumerate(self._queues)
+        ]
+
+        self._purge_task = asyncio.create_task(self._purge_loop(), name="job-purge")
+        self._lease_task = asyncio.create_task(
+            _LEASES.keep("payment_id, status, created_at", self._take_over), name="job-leases"
+        )
+
+    async def stop(self) -> None:
+        """
+        Los workers ociosos se detienen ya; los que ejecutan un job lo terminan.
+        Lo que quede encolado sigue en SQLite y se retoma al arrancar
+        """
+        if not self._tasks:
+            return
+        self._stopping = True
+        for task in (self._purge_task, self._lease_task):
+            if task is not None:
+                task.cancel()
+        for task in self._tasks:
+            if task not in self._busy:
+                task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for task in self._callbacks:
+            task.cancel()
+        await asyncio.gather(*self._callbacks, return_exceptions=True)
+        await self._callback_http.aclose()
+        self._tasks = []
+        self._queues = []
+        await asyncio.to_thread(_LEASES.release)
+
+    async def enqueue(
+        self,
+        operation: str,
+        payload: dict,
+        idempotency_key: str | None = None,
+        payment_id: str | None = None,
+        callback_url: str | None = None,
+    ) -> dict:
+        now = _now()
+        job_id = f"job-{uuid.uuid4().hex[:20]}"
+        if idempotency_key is None and operation == "authorization":
+            # Sin key ni id del cliente la autorización no se deduplica por contenido:
+            # la key del job hace que reanudarlo tras un reinicio no cobre dos veces
+            idempotency_key = f"{job_id}-authorization"
+        stored, cvv = _without_cvv(payload)
+        job = {
+            "id": job_id,
+            "operation": operation,
+            "payment_id": payment_id,
+            "request": json.dumps(stored, separators=(",", ":")),
+            "idempotency_key": idempotency_key,
+            "status": QUEUED,
+            "attempts": 0,
+            "status_code": None,
+            "error": None,
+            "response": None,
+            "callback_url": callback_url,
+            "callback_status": "PENDING" if callback_url else None,
+            "created_at": now,
+            "updated_at": now,
+            "owner": WORKER_ID,
+            # Sin workers (fuera del lifespan) queda libre para el primero que arranque
+            "lease_until": _LEASES.expires() if self._queues else 0,
+        }
+        # Se confirma en disco antes de responder: un 202 nunca se pierde
+        await asyncio.to_thread(_insert_job, job)
+        if cvv is not None:
+            self._cvvs[job_id] = cvv
+        self.enqueued += 1
+        # Sin workers (fuera del lifespan) el job queda en la tabla y se toma al arrancar
+        if self._queues:
+            self._dispatch(job["id"], payment_id)
+        return job
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queued": sum(queue.qsize() for queue in self._queues),
+            "busy_workers": len(self._busy),
+            "enqueued": self.enqueued,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "callbacks_delivered": self.callbacks_delivered,
+            "callbacks_failed": self.callbacks_failed,
+        }
+
+    def _take_over(self, rows: list[dict]) -> None:
+        for row in sorted(rows, key=lambda row: row["created_at"]):
+            if row["status"] in (QUEUED, RUNNING):
+                self._dispatch(row["id"], row["payment_id"])
+            else:
+                self._start_callback(row["id"])
+
+    def _dispatch(self, job_id: str, payment_id: str | None) -> None:
+        shard = hash(payment_id or job_id) % len(self._queues)
+        self._queues[shard].put_nowait(job_id)
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        task = asyncio.current_task()
+        while not self._stopping:
+            job_id = await queue.get()
+            self._busy.add(task)
+            try:
+                await self._process(job_id)
+            except Exception:
+                logger.exception("Error procesando job %s", job_id)
+            finally:
+                self._busy.discard(task)
+
+    async def _process(self, job_id: str) -> None:
+        cvv = self._cvvs.pop(job_id, None)
+        if not await asyncio.to_thread(_LEASES.claim, job_id):
+            # Lo tomó otro worker (nuestro lease venció), ya terminó o fue purgado
+            return
+        job = await asyncio.to_thread(get_job, job_id, True)
+        if job is None or job["status"] not in (QUEUED, RUNNING):
+            return
+        attempts = job["attempts"] + 1
+        await asyncio.to_thread(_update_job, job_id, status=RUNNING, attempts=attempts)
+
+        payload = json.loads(job["request"])
+        try:
+            if job["operation"] == "authorization" and cvv is None:
+                result = await self._resume_without_cvv(job)
+            else:
+                if cvv is not None:
+                    payload["instrument"]["card"]["cvv"] = cvv
+                result = await _execute(
+                    self._client, job["operation"], job["payment_id"], payload, job["idempotency_key"]
+                )
+        except (IdempotencyConflict, InvalidTransition) as e:
+            status, fields = FAILED, {"status_code": e.status_code, "error": str(e)}
+        except Exception as e:
+            status, fields = FAILED, {"status_code": 502, "error": str(e)}
+        else:
+            status, fields = SUCCEEDED, {"status_code": 200, "response": result["akua_response"].raw.decode()}
+
+        # El request (datos de tarjeta) ya no hace falta una vez terminado el job
+        await asyncio.to_thread(_update_job, job_id, status=status, request=None, **fields)
+        if status == SUCCEEDED:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        if job["callback_url"]:
+            self._start_callback(job_id)
+
+    async def _resume_without_cvv(self, job: dict) -> dict:
+        """
+        Autorización retomada tras un reinicio: el CVV no se guardó, así que solo
+        se puede responder si Akua ya la había completado con la key del job
+        """
+        stored = await asyncio.to_thread(completed_response, job["idempotency_key"])
+        if stored is None:
+            raise IdempotencyConflict(
+                "La autorización no se completó antes del reinicio y el CVV no se guarda: "
+                "reenviarla con la misma Idempotency-Key",
+                422,
+            )
+        return {"akua_response": stored, "replayed": True}
+
+    async def _purge_loop(self) -> None:
+        while True:
+            try:
+                purged = await asyncio.to_thread(purge_finished)
+                if purged:
+                    logger.info("Jobs terminados purgados: %d", purged)
+            except Exception:
+                logger.exception("Error purgando jobs terminados")
+            await asyncio.sleep(3600)
+
+    def _start_callback(self, job_id: str) -> None:
+        task = asyncio.create_task(self._notify(job_id))
+        self._callbacks.add(task)
+        task.add_done_callback(self._callbacks.discard)
+
+    async def _notify(self, job_id: str) -> None:
+        """
+        POST del estado final del job a su callback_url, con reintentos y backoff
+        """
+        if not await asyncio.to_thread(_LEASES.claim, job_id):
+            return
+        job = await asyncio.to_thread(get_job, job_id)
+        body = envelope_bytes(job_envelope(job))
+        try:
+            # Se vuelve a validar al enviar: el DNS pudo cambiar desde que se encoló
+            await check_callback_url(job["callback_url"])
+        except InvalidCallbackUrl as e:
+            logger.warning("Callback de %s descartado: %s", job_id, e)
+            self.callbacks_failed += 1
+            await asyncio.to_thread(_update_job, job_id, callback_status="FAILED")
+            return
+        for attempt in range(self.callback_attempts):
+            try:
+                response = await self._callback_http.post(
+                    job["callback_url"], content=body, headers={"content-type": "application/json"}
+                )
+                if response.status_code < 400:
+                    self.callbacks_delivered += 1
+                    await asyncio.to_thread(_update_job, job_id, callback_status="DELIVERED")
+                    return
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = str(e) or type(e).__name__
+            logger.warning("Callback de %s falló (intento %d): %s", job_id, attempt + 1, error)
+            if attempt + 1 < self.callback_attempts:
+                await asyncio.sleep(2 ** attempt)
+        self.callbacks_failed += 1
+        await asyncio.to_thread(_update_job, job_id, callback_status="FAILED")
+
+
+def accepted_response(job: dict) -> Response:
+    """
+    202 con el id del job y la URL para consultar su estado
+    """
+    response = envelope_response(job_envelope(job), status_code=202)
+    response.headers["Location"] = f"/v1/jobs/{job['id']}"
+    return response
+
+
+job_queue = JobQueue(
+    workers=settings.jobs_workers,
+    callback_timeout=settings.jobs_callback_timeout,
+    callback_attempts=settings.jobs_callback_attempts,
+)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Callable
+
+from app.config import settings
+from app.infrastructure.database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Dueño de los leases de este proceso. El sufijo aleatorio evita que un
+# proceso nuevo que reutiliza el pid de uno caído herede sus filas
+WORKER_ID = f"pid-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class LeaseTable:
+    """
+    Reparto entre workers de las filas pendientes de una tabla (capturas
+    programadas, jobs). Cada fila tiene un dueño (`owner`) y un vencimiento
+    (`lease_until`, reloj de pared); el dueño lo renueva mientras viva y,
+    cuando vence, cualquier worker la toma con un UPDATE condicional: nunca la
+    ejecutan dos a la vez ni queda huérfana si su dueño muere.
+    """
+
+    def __init__(self, table: str, key: str, pending: str) -> None:
+        self.table = table
+        self.key = key
+        # Filtro SQL de las filas que todavía necesitan un dueño
+        self.pending = pending
+
+    def expires(self) -> float:
+        return time.time() + settings.work_lease_seconds
+
+    def claim(self, key: str) -> bool:
+        """
+        Confirma (o toma, si venció) el lease de una fila justo antes de
+        ejecutarla. False si ahora es de otro worker o ya no está pendiente
+        """
+        with get_connection() as conn:
+            return conn.execute(
+                f"UPDATE {self.table} SET owner = ?, lease_until = ? "
+                f"WHERE {self.key} = ? AND ({self.pending}) AND (owner = ? OR lease_until < ?)",
+                (WORKER_ID, self.expires(), key, WORKER_ID, time.time()),
+            ).rowcount == 1
+
+    def renew_and_take_over(self, columns: str) -> list[dict]:
+        """
+        Renueva los leases propios y toma las filas pendientes cuyo lease
+        venció (su dueño murió o se detuvo). Devuelve las filas tomadas
+        """
+        now = time.time()
+        conn = get_connection()
+        with conn:
+            conn.execute(
+                f"UPDATE {self.table} SET lease_until = ? WHERE owner = ? AND ({self.pending})",
+                (self.expires(), WORKER_ID),
+            )
+            expired = conn.execute(
+                f"SELECT {self.key}, {columns} FROM {self.table} WHERE ({self.pending}) AND lease_until < ?",
+                (now,),
+            ).fetchall()
+            taken = []
+            for row in expired:
+                # Condicional: otro worker pudo tomarla entre el SELECT y el UPDATE
+                if conn.execute(
+                    f"UPDATE {self.table} SET owner = ?, lease_until = ? WHERE {self.key} = ? AND lease_until < ?",
+                    (WORKER_ID, self.expires(), row[self.key], now),
+                ).rowcount == 1:
+                    taken.append(dict(row))
+        return taken
+
+    def release(self) -> None:
+        """
+        Libera los leases propios al detenerse: otro worker los toma sin esperar a que venzan
+        """
+        with get_connection() as conn:
+            conn.execute(f"UPDATE {self.table} SET lease_until = 0 WHERE owner = ?", (WORKER_ID,))
+
+    async def keep(self, columns: str, on_taken: Callable[[list[dict]], None]) -> None:
+        """
+        Tarea de fondo: cada tercio de WORK_LEASE_SECONDS renueva los leases
+        propios y entrega a `on_taken` las filas huérfanas que tomó
+        """
+        while True:
+            try:
+                taken = await asyncio.to_thread(self.renew_and_take_over, columns)
+                if taken:
+                    logger.info("%s: %d filas pendientes tomadas por este worker", self.table, len(taken))
+                    on_taken(taken)
+            except Exception:
+                logger.exception("Error renovando leases de %s", self.table)
+            await asyncio.sleep(settings.work_lease_seconds / 3)
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+from app.config import settings
+from app.infrastructure.passthrough import AkuaBody
+from app.infrastructure.payment_state import apply_event, check_transition, new_entry
+from app.infrastructure.storage import storage
+from app.infrastructure.write_behind import write_queue
+
+LEDGER_COLUMNS = (
+    "payment_id", "merchant_id", "status", "currency", "authorized_amount",
+    "captured_amount", "refunded_amount", "version", "updated_at",
+)
+
+
+class PaymentLedger:
+    """
+    Estado consolidado de cada pago (tabla payment_ledger): estado y montos
+    autorizado, capturado y reembolsado, actualizado con cada respuesta exitosa
+    de Akua y consultado antes de capturar, cancelar o reembolsar para rechazar
+    localmente lo imposible.
+
+    Las escrituras van por la cola write-behind (upsert por versión). Mientras
+    no se vacía, este proceso responde con su copia en memoria de los pagos que
+    tocó recientemente; entre copia y fila gana la de mayor versión.
+    """
+
+    def __init__(self, max_entries: int = 10_000) -> None:
+        self.max_entries = max_entries
+        self._recent: OrderedDict[str, dict] = OrderedDict()
+        # Operaciones rechazadas localmente (las cuenta AkuaClient)
+        self.rejected = 0
+
+    async def get(self, payment_id: str) -> dict | None:
+        return self._newest(payment_id, await storage.get_ledger(payment_id))
+
+    def _newest(self, payment_id: str, stored: dict | None) -> dict | None:
+        local = self._recent.get(payment_id)
+        if local is None:
+            return stored
+        if stored is None or local["version"] >= stored["version"]:
+            return local
+        return stored
+
+    async def check(self, operation: str, payment_id: str, amount: float | None = None) -> None:
+        """
+        Lanza InvalidTransition si la operación es imposible según el registro local
+        """
+        if settings.ledger_fast_fail:
+            check_transition(await self.get(payment_id), operation, amount)
+
+    async def record(self, operation: str, response: AkuaBody | dict, payment_id: str | None = None) -> dict | None:
+        data = response.data if isinstance(response, AkuaBody) else response
+        payment_id = (data.get("payment_id") if isinstance(data, dict) else None) or payment_id
+        if not payment_id:
+            return None
+
+        stored = await storage.get_ledger(payment_id)
+        # Transición y copia en memoria sin await de por medio (sobre la copia
+        # más nueva): dos operaciones sobre el mismo pago en este proceso no se pisan
+        entry = apply_event(self._newest(payment_id, stored) or new_entry(payment_id), operation, data)
+        self._recent[payment_id] = entry
+        self._recent.move_to_end(payment_id)
+        while len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+
+        record = ("payment_ledger", {column: entry[column] for column in LEDGER_COLUMNS})
+        if settings.shared_state or storage.shared:
+            # Con varios workers o nodos el siguiente request de este pago puede
+            # caer en otro proceso, que no ve la copia en memoria: se escribe ya
+            await storage.write_records([record])
+        else:
+            await write_queue.submit(record)
+        return entry
+
+
+payment_ledger = PaymentLedger()
@@ -0,0 +1,212 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Buckets de latencia en segundos (mismos que el cliente oficial de Prometheus)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+ROWS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Registry:
+    """
+    Registro mínimo de métricas en formato de texto de Prometheus. Además de las
+    métricas propias admite collectors: funciones que devuelven muestras al
+    momento del scrape (para exponer contadores que ya viven en otros módulos).
+    """
+
+    def __init__(self) -> None:
+        self._metrics: list["_Metric"] = []
+        self._collectors: list = []
+
+    def register(self, metric: "_Metric") -> None:
+        self._metrics.append(metric)
+
+    def add_collector(self, collector) -> None:
+        """
+        `collector()` devuelve una lista de (nombre, tipo, ayuda, [(labels, valor)])
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_label_text(tuple(labels), tuple(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_label_text(self.labels, key)} {_number(value)}" for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1.0) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # Por combinación de labels: conteo por bucket (no acumulado; el último es +Inf), suma
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        lines = self._header()
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+# Métricas de la aplicación
+http_requests = Counter(
+    "http_requests_total", "Requests HTTP atendidos", ("method", "route", "status")
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Latencia de los requests HTTP", ("method", "route", "status")
+)
+http_in_flight = Gauge("http_requests_in_flight", "Requests HTTP en curso")
+
+upstream_duration = Histogram(
+    "akua_upstream_request_duration_seconds",
+    "Latencia de cada llamada HTTP a Akua (por intento)",
+    ("operation", "status"),
+)
+token_refreshes = Counter("akua_token_refresh_total", "Renovaciones del access token de Akua", ("result",))
+
+sqlite_write_duration = Histogram(
+    "sqlite_write_duration_seconds", "Duración de cada transacción de escritura en SQLite"
+)
+sqlite_rows_per_commit = Histogram(
+    "sqlite_rows_per_commit", "Filas insertadas por commit en SQLite", buckets=ROWS_BUCKETS
+)
+sqlite_write_errors = Counter("sqlite_write_errors_total", "Transacciones de escritura en SQLite fallidas")
+
+postgres_write_duration = Histogram(
+    "postgres_write_duration_seconds", "Duración de cada transacción de escritura en PostgreSQL"
+)
+postgres_rows_per_commit = Histogram(
+    "postgres_rows_per_commit", "Filas insertadas por commit en PostgreSQL", buckets=ROWS_BUCKETS
+)
+postgres_write_errors = Counter("postgres_write_errors_total", "Transacciones de escritura en PostgreSQL fallidas")
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que cuenta los requests por ruta (la plantilla, no el path
+    concreto, para no disparar la cardinalidad), status y latencia
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            status_text = str(status)
+            http_requests.inc(scope["method"], route_path, status_text)
+            http_request_duration.observe(elapsed, scope["method"], route_path, status_text)
+
+admission_rejections = Counter(
+    "admission_rejections_total", "Requests rechazados con 429 por el control de admisión", ("scope",)
+)
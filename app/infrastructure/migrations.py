@@ -0,0 +1,437 @@
+import sqlite3
+from typing import Callable
+
+from app.infrastructure.payment_state import OPEN_PAYMENT_FILTER, apply_event, new_entry
+from app.infrastructure.raw_codec import decode_raw, encode_raw, extract_fields
+from app.infrastructure.rollups import GRANULARITIES, SCHEMA as ROLLUP_SCHEMA, rebuild_sql
+
+RAW_TABLES = ("payments", "authorizations", "captures", "cancellations")
+_REWRITE_BATCH = 1000
+
+
+def _add_column(table: str, column: str) -> Callable[[sqlite3.Connection], None]:
+    """
+    ALTER TABLE ... ADD COLUMN que se saltea si la columna ya existe: bases que
+    quedaron con las columnas agregadas y user_version sin avanzar (antes de
+    que las migraciones corrieran en una transacción explícita)
+    """
+    def step(conn: sqlite3.Connection) -> None:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column.split()[0] not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+
+    return step
+
+
+def _compress_raw_responses(conn: sqlite3.Connection) -> None:
+    """
+    Reescribe las filas existentes: raw_response comprimido y columnas extraídas
+    """
+    for table in RAW_TABLES:
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                f"SELECT id, raw_response FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, _REWRITE_BATCH),
+            ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for row_id, value in rows:
+                if not isinstance(value, str):
+                    continue
+                raw = decode_raw(value)
+                fields = extract_fields(raw)
+                updates.append((
+                    encode_raw(raw), fields["amount_value"], fields["currency"], fields["akua_created_at"],
+                    raw.get("merchant_id"), row_id,
+                ))
+            conn.executemany(
+                f"UPDATE {table} SET raw_response = ?, amount_value = ?, currency = ?, akua_created_at = ?, "
+                f"merchant_id = COALESCE(merchant_id, ?) WHERE id = ?",
+                updates,
+            )
+            last_id = rows[-1][0]
+
+    # Captura/cancelación sin merchant en la respuesta: se toma de la autorización
+    for table in ("payments", "captures", "cancellations"):
+        conn.execute(
+            f"UPDATE {table} SET merchant_id = ("
+            f"SELECT a.merchant_id FROM authorizations a WHERE a.payment_id = {table}.payment_id LIMIT 1"
+            f") WHERE merchant_id IS NULL"
+        )
+
+
+_LEDGER_SOURCES = (("authorizations", "authorization"), ("captures", "capture"), ("cancellations", "cancel"))
+
+
+def _next_payment_ids(conn: sqlite3.Connection, after: str, limit: int) -> list[str]:
+    """
+    Los `limit` payment_id siguientes a `after` entre todas las tablas. Cada
+    tabla aporta a lo sumo `limit` por su índice de payment_id
+    """
+    payment_ids: set[str] = set()
+    for table, _operation in _LEDGER_SOURCES:
+        payment_ids.update(
+            row[0] for row in conn.execute(
+                f"SELECT DISTINCT payment_id FROM {table} WHERE payment_id > ? ORDER BY payment_id LIMIT ?",
+                (after, limit),
+            )
+        )
+    return sorted(payment_ids)[:limit]
+
+
+def _backfill_ledger(conn: sqlite3.Connection) -> None:
+    """
+    Reconstruye payment_ledger recorriendo los registros existentes, por bloques
+    de pagos en orden de payment_id (en memoria solo los eventos de un bloque)
+    """
+    last_payment_id = ""
+    while True:
+        payment_ids = _next_payment_ids(conn, last_payment_id, _REWRITE_BATCH)
+        if not payment_ids:
+            break
+        placeholders = ", ".join("?" for _ in payment_ids)
+        events = [
+            (created_at, operation, payment_id, raw_response)
+            for table, operation in _LEDGER_SOURCES
+            for payment_id, raw_response, created_at in conn.execute(
+                f"SELECT payment_id, raw_response, created_at FROM {table} WHERE payment_id IN ({placeholders})",
+                payment_ids,
+            )
+        ]
+        # Los eventos de cada pago se aplican en orden de llegada
+        events.sort(key=lambda event: event[0])
+
+        entries: dict[str, dict] = {}
+        for _created_at, operation, payment_id, raw_response in events:
+            entry = entries.get(payment_id) or new_entry(payment_id)
+            entries[payment_id] = apply_event(entry, operation, decode_raw(raw_response) or {})
+
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO payment_ledger (payment_id, merchant_id, status, currency, authorized_amount,
+                captured_amount, refunded_amount, version, updated_at)
+            VALUES (:payment_id, :merchant_id, :status, :currency, :authorized_amount,
+                :captured_amount, :refunded_amount, :version, :updated_at)
+            """,
+            list(entries.values()),
+        )
+        # Un commit por bloque libera el lock de escritura entre bloques. Si se
+        # corta, la migración se repite completa: INSERT OR REPLACE la hace idempotente
+        conn.commit()
+        last_payment_id = payment_ids[-1]
+
+
+def _backfill_rollups(conn: sqlite3.Connection) -> None:
+    """
+    Llena los rollups de volumen con los registros existentes
+    """
+    for granularity in GRANULARITIES:
+        for statement in rebuild_sql(granularity):
+            conn.execute(statement)
+
+
+# Migraciones versionadas del esquema SQLite. La versión aplicada se guarda en
+# PRAGMA user_version; cada migración corre una sola vez y en orden. Un paso
+# puede ser SQL o una función que recibe la conexión (reescritura de datos).
+MIGRATIONS: list[tuple[int, str, list[str | Callable[[sqlite3.Connection], None]]]] = [
+    (
+        1,
+        "Tablas iniciales",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS payments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id TEXT NOT NULL,
+                payment_id TEXT NOT NULL,
+                transaction_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                raw_response TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS authorizations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                merchant_id TEXT NOT NULL,
+                authorization_id TEXT NOT NULL,
+                payment_id TEXT,
+                transaction_id TEXT,
+                status TEXT NOT NULL,
+                type TEXT NOT NULL DEFAULT 'AUTHORIZATION',
+                raw_response TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS cancellations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payment_id TEXT NOT NULL,
+                transaction_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                raw_response TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS captures (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payment_id TEXT NOT NULL,
+                transaction_id TEXT NOT NULL,
+                amount TEXT,
+                status TEXT NOT NULL,
+                raw_response TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "Índices por columnas de búsqueda y created_at",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_payments_payment_id ON payments (payment_id)",
+            "CREATE INDEX IF NOT EXISTS ix_payments_transaction_id ON payments (transaction_id)",
+            "CREATE INDEX IF NOT EXISTS ix_payments_created_at ON payments (created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_authorizations_payment_id ON authorizations (payment_id)",
+            "CREATE INDEX IF NOT EXISTS ix_authorizations_transaction_id ON authorizations (transaction_id)",
+            "CREATE INDEX IF NOT EXISTS ix_authorizations_merchant_created ON authorizations (merchant_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_authorizations_created_at ON authorizations (created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_cancellations_payment_id ON cancellations (payment_id)",
+            "CREATE INDEX IF NOT EXISTS ix_cancellations_transaction_id ON cancellations (transaction_id)",
+            "CREATE INDEX IF NOT EXISTS ix_cancellations_created_at ON cancellations (created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_captures_payment_id ON captures (payment_id)",
+            "CREATE INDEX IF NOT EXISTS ix_captures_transaction_id ON captures (transaction_id)",
+            "CREATE INDEX IF NOT EXISTS ix_captures_created_at ON captures (created_at)",
+        ],
+    ),
+    (
+        3,
+        "Registro local de idempotency keys",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                operation TEXT NOT NULL,
+                request_hash TEXT NOT NULL,
+                status TEXT NOT NULL,
+                response TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_idempotency_keys_created_at ON idempotency_keys (created_at)",
+        ],
+    ),
+    (
+        4,
+        "raw_response comprimido y columnas extraídas (monto, moneda, merchant, fecha de Akua)",
+        [
+            *(
+                _add_column(table, column)
+                for table in RAW_TABLES
+                for column in ("amount_value REAL", "currency TEXT", "akua_created_at TEXT")
+            ),
+            _add_column("payments", "merchant_id TEXT"),
+            _add_column("captures", "merchant_id TEXT"),
+            _add_column("cancellations", "merchant_id TEXT"),
+            _compress_raw_responses,
+        ],
+    ),
+    (
+        5,
+        "Ledger de pagos y tabla de reembolsos",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS payment_ledger (
+                payment_id TEXT PRIMARY KEY,
+                merchant_id TEXT,
+                status TEXT,
+                currency TEXT,
+                authorized_amount REAL,
+                captured_amount REAL NOT NULL DEFAULT 0,
+                refunded_amount REAL NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS refunds (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payment_id TEXT NOT NULL,
+                transaction_id TEXT,
+                status TEXT NOT NULL,
+                raw_response BLOB NOT NULL,
+                amount_value REAL,
+                currency TEXT,
+                akua_created_at TEXT,
+                merchant_id TEXT,
+                created_at TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_refunds_payment_id ON refunds (payment_id)",
+            "CREATE INDEX IF NOT EXISTS ix_refunds_transaction_id ON refunds (transaction_id)",
+            "CREATE INDEX IF NOT EXISTS ix_refunds_created_at ON refunds (created_at)",
+            _backfill_ledger,
+        ],
+    ),
+    (
+        6,
+        "Capturas automáticas programadas",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS scheduled_captures (
+                payment_id TEXT PRIMARY KEY,
+                merchant_id TEXT,
+                capture_after TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """,
+            # Parcial: al arrancar solo se leen las pendientes
+            "CREATE INDEX IF NOT EXISTS ix_scheduled_captures_pending ON scheduled_captures (capture_after) "
+            "WHERE status = 'PENDING'",
+        ],
+    ),
+    (
+        7,
+        "Outbox de jobs del modo asíncrono",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                operation TEXT NOT NULL,
+                payment_id TEXT,
+                request TEXT NOT NULL,
+                idempotency_key TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                status_code INTEGER,
+                error TEXT,
+                response TEXT,
+                callback_url TEXT,
+                callback_status TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_jobs_unfinished ON jobs (created_at) WHERE status IN ('QUEUED', 'RUNNING')",
+            "CREATE INDEX IF NOT EXISTS ix_jobs_payment_id ON jobs (payment_id)",
+        ],
+    ),
+    (
+        8,
+        "Conciliación con Akua: pagos abiertos y checkpoints de cada corrida",
+        [
+            f"CREATE INDEX IF NOT EXISTS ix_payment_ledger_open ON payment_ledger (payment_id) WHERE {OPEN_PAYMENT_FILTER}",
+            """
+            CREATE TABLE IF NOT EXISTS reconciliation_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT NOT NULL,
+                dry_run INTEGER NOT NULL DEFAULT 0,
+                cursor TEXT,
+                scanned INTEGER NOT NULL DEFAULT 0,
+                drifted INTEGER NOT NULL DEFAULT 0,
+                corrected INTEGER NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                report_path TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                finished_at TEXT
+            )
+            """,
+        ],
+    ),
+    (
+        9,
+        "Rollups de volumen por comercio, por hora y por día",
+        [*ROLLUP_SCHEMA, _backfill_rollups],
+    ),
+    (
+        10,
+        "jobs.request opcional: sin CVV y borrado al terminar el job",
+        [
+            # SQLite no cambia el NOT NULL de una columna: se recrea la tabla
+            """
+            CREATE TABLE jobs_new (
+                id TEXT PRIMARY KEY,
+                operation TEXT NOT NULL,
+                payment_id TEXT,
+                request TEXT,
+                idempotency_key TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                status_code INTEGER,
+                error TEXT,
+                response TEXT,
+                callback_url TEXT,
+                callback_status TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """,
+            # Los terminados ya no necesitan el request; los pendientes pierden el CVV
+            """
+            INSERT INTO jobs_new (id, operation, payment_id, request, idempotency_key, status, attempts,
+                status_code, error, response, callback_url, callback_status, created_at, updated_at)
+            SELECT id, operation, payment_id,
+                CASE WHEN status IN ('SUCCEEDED', 'FAILED') THEN NULL
+                     ELSE json_remove(request, '$.instrument.card.cvv') END,
+                idempotency_key, status, attempts, status_code, error, response, callback_url,
+                callback_status, created_at, updated_at
+            FROM jobs
+            """,
+            "DROP TABLE jobs",
+            "ALTER TABLE jobs_new RENAME TO jobs",
+            "CREATE INDEX ix_jobs_unfinished ON jobs (created_at) WHERE status IN ('QUEUED', 'RUNNING')",
+            "CREATE INDEX ix_jobs_payment_id ON jobs (payment_id)",
+        ],
+    ),
+    (
+        11,
+        "Leases por worker sobre capturas programadas y jobs",
+        [
+            _add_column("scheduled_captures", "owner TEXT"),
+            _add_column("scheduled_captures", "lease_until REAL NOT NULL DEFAULT 0"),
+            _add_column("jobs", "owner TEXT"),
+            _add_column("jobs", "lease_until REAL NOT NULL DEFAULT 0"),
+            # Parciales: cada worker busca periódicamente los leases vencidos de lo pendiente
+            "CREATE INDEX IF NOT EXISTS ix_scheduled_captures_lease ON scheduled_captures (lease_until) "
+            "WHERE status = 'PENDING'",
+            "CREATE INDEX IF NOT EXISTS ix_jobs_lease ON jobs (lease_until) "
+            "WHERE status IN ('QUEUED', 'RUNNING') OR callback_status = 'PENDING'",
+        ],
+    ),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection, target: int | None = None) -> int:
+    """
+    Aplica las migraciones pendientes (hasta `target` si se indica).
+    Devuelve la versión final del esquema
+    """
+    current = schema_version(conn)
+    for version, _description, statements in MIGRATIONS:
+        if version <= current or (target is not None and version > target):
+            continue
+        with conn:
+            # sqlite3 no abre transacción para el DDL (ALTER/CREATE quedarían
+            # confirmados aunque la migración se corte): se abre a mano
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+        current = version
+    return current
@@ -0,0 +1,67 @@
+import json
+from typing import Any
+
+import httpx
+from fastapi.responses import Response
+
+_MISSING = object()
+
+
+class AkuaBody:
+    """
+    Cuerpo de una respuesta de Akua tal como llegó (bytes). Se reenvía al
+    cliente y se persiste sin volver a serializarlo; solo se parsea (una vez)
+    si alguien lee un campo, p. ej. el payment_id que necesitan los routers.
+    Los listados grandes de organizaciones y merchants nunca se parsean.
+    """
+
+    __slots__ = ("raw", "_data")
+
+    def __init__(self, raw: bytes) -> None:
+        self.raw = raw or b"null"
+        self._data = _MISSING
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> "AkuaBody":
+        body = cls(response.content)
+        # Sin content-type JSON se valida ahora, para fallar como antes con response.json()
+        if "json" not in response.headers.get("content-type", ""):
+            body._data = json.loads(body.raw)
+        return body
+
+    @property
+    def data(self) -> Any:
+        if self._data is _MISSING:
+            self._data = json.loads(self.raw)
+        return self._data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        data = self.data
+        return data.get(key, default) if isinstance(data, dict) else default
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __reduce__(self):
+        # Solo los bytes: el centinela _MISSING no sobrevive a pickle (cache compartido)
+        return (AkuaBody, (self.raw,))
+
+    def __repr__(self) -> str:
+        return f"AkuaBody({self.raw[:80]!r}{'...' if len(self.raw) > 80 else ''})"
+
+
+def _encode(value: Any) -> bytes:
+    if isinstance(value, AkuaBody):
+        return value.raw
+    return json.dumps(value, separators=(",", ":"), default=str).encode()
+
+
+def envelope_bytes(envelope: dict) -> bytes:
+    """
+    Serializa el sobre de respuesta insertando los cuerpos de Akua como vienen
+    """
+    return b"{" + b",".join(_encode(key) + b":" + _encode(value) for key, value in envelope.items()) + b"}"
+
+
+def envelope_response(envelope: dict, status_code: int = 200) -> Response:
+    return Response(content=envelope_bytes(envelope), status_code=status_code, media_type="application/json")
@@ -0,0 +1,125 @@
+from datetime import datetime
+
+# Máquina de estados de un pago en Akua. Solo se rechaza localmente cuando el
+# estado registrado es conocido y la operación no está permitida desde él; un
+# estado desconocido (o un pago sin registro local) se deja decidir a Akua.
+AUTHORIZED = "AUTHORIZED"
+PARTIALLY_CAPTURED = "PARTIALLY_CAPTURED"
+CAPTURED = "CAPTURED"
+PARTIALLY_REFUNDED = "PARTIALLY_REFUNDED"
+REFUNDED = "REFUNDED"
+CANCELLED = "CANCELLED"
+DECLINED = "DECLINED"
+
+KNOWN_STATES = {AUTHORIZED, PARTIALLY_CAPTURED, CAPTURED, PARTIALLY_REFUNDED, REFUNDED, CANCELLED, DECLINED}
+# Estados sin operaciones posibles: la conciliación no los vuelve a consultar
+FINAL_STATES = (CANCELLED, DECLINED, REFUNDED)
+# Condición SQL de los pagos que pueden seguir cambiando (misma expresión en el
+# índice parcial y en la consulta, para que SQLite lo use)
+OPEN_PAYMENT_FILTER = f"(status IS NULL OR status NOT IN ({', '.join(repr(state) for state in FINAL_STATES)}))"
+ALLOWED_FROM = {
+    "capture": {AUTHORIZED, PARTIALLY_CAPTURED},
+    "cancel": {AUTHORIZED},
+    "refund": {CAPTURED, PARTIALLY_CAPTURED, PARTIALLY_REFUNDED},
+}
+# Tolerancia para comparar montos en punto flotante
+_EPSILON = 1e-9
+
+
+class InvalidTransition(Exception):
+    """
+    La operación es imposible según el registro local del pago: estado no
+    permitido (409) o monto mayor al disponible (422)
+    """
+
+    def __init__(self, message: str, status_code: int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def new_entry(payment_id: str) -> dict:
+    return {
+        "payment_id": payment_id,
+        "merchant_id": None,
+        "status": None,
+        "currency": None,
+        "authorized_amount": None,
+        "captured_amount": 0.0,
+        "refunded_amount": 0.0,
+        "version": 0,
+        "updated_at": None,
+    }
+
+
+def check_transition(entry: dict | None, operation: str, amount: float | None = None) -> None:
+    """
+    Lanza InvalidTransition si `operation` (capture, cancel o refund) es imposible
+    con el estado registrado. `amount` None significa el monto completo.
+    """
+    if entry is None or entry["status"] not in KNOWN_STATES:
+        return
+
+    payment_id, status = entry["payment_id"], entry["status"]
+    if status not in ALLOWED_FROM[operation]:
+        raise InvalidTransition(f"No se puede hacer {operation} de un pago en estado {status} ({payment_id})", 409)
+
+    if amount is None:
+        return
+    if amount <= 0:
+        raise InvalidTransition(f"Monto inválido: {amount}", 422)
+    if operation == "capture" and entry["authorized_amount"] is not None:
+        available = entry["authorized_amount"] - entry["captured_amount"]
+    elif operation == "refund":
+        available = entry["captured_amount"] - entry["refunded_amount"]
+    else:
+        return
+    if amount > available + _EPSILON:
+        raise InvalidTransition(
+            f"Monto de {operation} {amount} mayor al disponible {available} ({payment_id})", 422
+        )
+
+
+def apply_event(entry: dict, operation: str, response: dict) -> dict:
+    """
+    Nuevo estado del pago tras una respuesta exitosa de Akua para `operation`
+    (authorization, capture, cancel o refund). Si Akua informa el estado del
+    pago se usa ese; si no, se deriva de la transacción.
+    """
+    entry = dict(entry)
+    transaction = response.get("transaction") or {}
+    approved = transaction.get("status", "APPROVED") == "APPROVED"
+    amount = transaction.get("amount") or {}
+    value = amount.get("value") if isinstance(amount, dict) else None
+    value = float(value) if isinstance(value, (int, float)) else None
+
+    entry["merchant_id"] = response.get("merchant_id") or entry["merchant_id"]
+    if isinstance(amount, dict) and amount.get("currency"):
+        entry["currency"] = amount["currency"]
+
+    status = None
+    if operation == "authorization":
+        entry["authorized_amount"] = value
+        status = AUTHORIZED if approved else DECLINED
+    elif approved and operation == "capture":
+        if value is None and entry["authorized_amount"] is not None:
+            value = entry["authorized_amount"] - entry["captured_amount"]
+        entry["captured_amount"] += value or 0.0
+        fully = entry["authorized_amount"] is not None and entry["captured_amount"] >= entry["authorized_amount"] - _EPSILON
+        status = CAPTURED if fully else PARTIALLY_CAPTURED
+    elif approved and operation == "cancel":
+        status = CANCELLED
+    elif approved and operation == "refund":
+        if value is None:
+            value = entry["captured_amount"] - entry["refunded_amount"]
+        entry["refunded_amount"] += value
+        fully = entry["refunded_amount"] >= entry["captured_amount"] - _EPSILON
+        status = REFUNDED if fully else PARTIALLY_REFUNDED
+
+    entry["status"] = response.get("status") or status or entry["status"]
+    # Autorización con captura automática: el pago ya queda capturado completo
+    if operation == "authorization" and entry["status"] == CAPTURED and value is not None:
+        entry["captured_amount"] = value
+
+    entry["version"] += 1
+    entry["updated_at"] = datetime.utcnow().isoformat()
+    return entry
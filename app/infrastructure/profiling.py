@@ -0,0 +1,130 @@
+import asyncio
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from app.config import settings
+
+PROFILE_DIR = Path(settings.profile_dir) if settings.profile_dir else (
+    Path(__file__).resolve().parent.parent / "data" / "profiles"
+)
+_ROOT = str(Path(__file__).resolve().parent.parent.parent)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_ROOT):
+        filename = filename[len(_ROOT) + 1:]
+    elif "site-packages/" in filename:
+        filename = filename.rsplit("site-packages/", 1)[1]
+    return f"{code.co_qualname} ({filename})"
+
+
+class _Session:
+    def __init__(self, task: asyncio.Task, thread_id: int) -> None:
+        self.task = task
+        self.thread_id = thread_id
+        self.stacks: Counter[str] = Counter()
+
+
+class RequestProfiler:
+    """
+    Profiler por muestreo de requests individuales. Un hilo toma una muestra
+    cada `interval` segundos de la tarea asyncio de cada request perfilado:
+
+    - si la tarea está corriendo, el stack del hilo del event loop desde la
+      corrutina raíz del request (tiempo en CPU)
+    - si está suspendida, el stack de awaits donde espera, con una hoja
+      `[await]` (tiempo esperando a Akua, SQLite en un hilo, etc.)
+
+    El resultado son stacks colapsados (`frame;frame;frame cuenta`), el formato
+    que consumen flamegraph.pl y speedscope.
+    """
+
+    def __init__(self, sample_rate: float, interval: float, output_dir: Path) -> None:
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.output_dir = output_dir
+        self._sessions: dict[int, _Session] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def should_profile(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self) -> _Session:
+        session = _Session(asyncio.current_task(), threading.get_ident())
+        with self._lock:
+            self._sessions[id(session)] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: _Session) -> None:
+        with self._lock:
+            self._sessions.pop(id(session), None)
+
+    def write(self, session: _Session, name: str) -> Path | None:
+        if not session.stacks:
+            return None
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        path = self.output_dir / f"{name}.folded"
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in session.stacks.most_common()))
+        return path
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                sessions = list(self._sessions.values())
+                if not sessions:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for session in sessions:
+                try:
+                    stack = self._sample(session, frames.get(session.thread_id))
+                except Exception:
+                    # La tarea puede cambiar de estado mientras se recorre
+                    continue
+                if stack:
+                    session.stacks[stack] += 1
+
+    @staticmethod
+    def _sample(session: _Session, thread_frame) -> str | None:
+        root = session.task.get_coro().cr_frame
+        if root is None:
+            return None
+
+        running: list = []
+        frame = thread_frame
+        while frame is not None:
+            running.append(frame)
+            if frame is root:
+                return ";".join(_frame_label(f) for f in reversed(running))
+            frame = frame.f_back
+
+        # Suspendida: se sigue la cadena de awaits desde la corrutina raíz
+        waiting = []
+        awaitable = session.task.get_coro()
+        while awaitable is not None:
+            frame = next((getattr(awaitable, a) for a in ("cr_frame", "ag_frame", "gi_frame") if hasattr(awaitable, a)), None)
+            if frame is None:
+                break
+            waiting.append(frame)
+            awaitable = next(
+                (getattr(awaitable, a) for a in ("cr_await", "ag_await", "gi_yieldfrom") if hasattr(awaitable, a)), None
+            )
+        return ";".join([*(_frame_label(f) for f in waiting), "[await]"])
+
+
+profiler = RequestProfiler(
+    sample_rate=settings.profile_sample_rate,
+    interval=settings.profile_interval_ms / 1000,
+    output_dir=PROFILE_DIR,
+)
@@ -0,0 +1,316 @@
+import base64
+import heapq
+import json
+
+from app.infrastructure import rollups
+from app.infrastructure.database import get_connection
+from app.infrastructure.payment_state import OPEN_PAYMENT_FILTER
+from app.infrastructure.raw_codec import decode_raw
+
+# Tablas consultables. El rango desempata registros con el mismo created_at
+# entre tablas para que el orden (created_at, rango, id) sea total.
+_MERCHANT_OF_PAYMENT = (
+    "(SELECT a.merchant_id FROM authorizations a WHERE a.payment_id = t.payment_id LIMIT 1)"
+)
+SOURCES: dict[str, dict] = {
+    "authorizations": {
+        "rank": 0,
+        "types": ("AUTHORIZATION", "PRE_AUTHORIZATION"),
+        "columns": "t.id, t.merchant_id, t.authorization_id, t.payment_id, t.transaction_id, "
+                   "t.status, t.type, NULL AS amount, t.amount_value, t.currency, t.created_at",
+        "merchant_filter": "t.merchant_id = ?",
+        "type_filter": "t.type = ?",
+    },
+    "captures": {
+        "rank": 1,
+        "types": ("CAPTURE",),
+        "columns": f"t.id, COALESCE(t.merchant_id, {_MERCHANT_OF_PAYMENT}) AS merchant_id, NULL AS authorization_id, "
+                   "t.payment_id, t.transaction_id, t.status, 'CAPTURE' AS type, t.amount, "
+                   "t.amount_value, t.currency, t.created_at",
+        "merchant_filter": "t.payment_id IN (SELECT payment_id FROM authorizations WHERE merchant_id = ?)",
+        "type_filter": None,
+    },
+    "cancellations": {
+        "rank": 2,
+        "types": ("CANCELLATION",),
+        "columns": f"t.id, COALESCE(t.merchant_id, {_MERCHANT_OF_PAYMENT}) AS merchant_id, NULL AS authorization_id, "
+                   "t.payment_id, t.transaction_id, t.status, 'CANCELLATION' AS type, NULL AS amount, "
+                   "t.amount_value, t.currency, t.created_at",
+        "merchant_filter": "t.payment_id IN (SELECT payment_id FROM authorizations WHERE merchant_id = ?)",
+        "type_filter": None,
+    },
+    "refunds": {
+        "rank": 3,
+        "types": ("REFUND",),
+        "columns": f"t.id, COALESCE(t.merchant_id, {_MERCHANT_OF_PAYMENT}) AS merchant_id, NULL AS authorization_id, "
+                   "t.payment_id, t.transaction_id, t.status, 'REFUND' AS type, NULL AS amount, "
+                   "t.amount_value, t.currency, t.created_at",
+        "merchant_filter": "t.payment_id IN (SELECT payment_id FROM authorizations WHERE merchant_id = ?)",
+        "type_filter": None,
+    },
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: str, rank: int, row_id: int) -> str:
+    raw = json.dumps([created_at, rank, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, rank, row_id = json.loads(raw)
+        return str(created_at), int(rank), int(row_id)
+    except Exception as e:
+        raise InvalidCursor(f"Cursor inválido: {cursor}") from e
+
+
+def _to_item(row, source: str, include_raw: bool) -> dict:
+    item = {key: row[key] for key in row.keys() if key != "raw_response"}
+    item["source"] = source
+    if include_raw:
+        item["raw_response"] = decode_raw(row["raw_response"])
+    return item
+
+
+def payment_queries(payment_id: str, include_raw: bool = False) -> list[tuple[str, str, list]]:
+    """
+    Consultas (tabla, sql, params) de todos los registros de un pago
+    """
+    queries = []
+    for source, spec in SOURCES.items():
+        columns = spec["columns"] + (", t.raw_response" if include_raw else "")
+        queries.append((
+            source,
+            f"SELECT {columns} FROM {source} t WHERE t.payment_id = ? ORDER BY t.created_at, t.id",
+            [payment_id],
+        ))
+    return queries
+
+
+def payment_result(payment_id: str, rows_by_source: dict[str, list], ledger, include_raw: bool) -> dict | None:
+    result: dict = {"payment_id": payment_id}
+    for source, rows in rows_by_source.items():
+        result[source] = [_to_item(row, source, include_raw) for row in rows]
+    result["ledger"] = dict(ledger) if ledger else None
+    found = any(rows_by_source.values())
+    return result if found or ledger else None
+
+
+def get_payment(payment_id: str, include_raw: bool = False) -> dict | None:
+    """
+    Todos los registros locales de un pago, agrupados por tabla
+    """
+    conn = get_connection()
+    rows_by_source = {
+        source: conn.execute(sql, params).fetchall()
+        for source, sql, params in payment_queries(payment_id, include_raw)
+    }
+    ledger = conn.execute("SELECT * FROM payment_ledger WHERE payment_id = ?", (payment_id,)).fetchone()
+    return payment_result(payment_id, rows_by_source, ledger, include_raw)
+
+
+def transaction_queries(
+    merchant_id: str | None = None,
+    status: str | None = None,
+    tx_type: str | None = None,
+    created_from: str | None = None,
+    created_to: str | None = None,
+    cursor: str | None = None,
+    limit: int = 50,
+    include_raw: bool = False,
+) -> list[tuple[str, int, str, list]]:
+    """
+    Una consulta (tabla, rango, sql, params) por tabla que puede aportar a la
+    página: cada una se recorre por su índice de created_at y lee `limit + 1` filas
+    """
+    after = decode_cursor(cursor) if cursor else None
+    queries = []
+
+    for source, spec in SOURCES.items():
+        if tx_type and tx_type not in spec["types"]:
+            continue
+
+        where: list[str] = []
+        params: list = []
+        if merchant_id:
+            where.append(spec["merchant_filter"])
+            params.append(merchant_id)
+        if tx_type and spec["type_filter"]:
+            where.append(spec["type_filter"])
+            params.append(tx_type)
+        if status:
+            where.append("t.status = ?")
+            params.append(status)
+        if created_from:
+            where.append("t.created_at >= ?")
+            params.append(created_from)
+        if created_to:
+            where.append("t.created_at < ?")
+            params.append(created_to)
+        if after:
+            after_created, after_rank, after_id = after
+            if spec["rank"] < after_rank:
+                where.append("t.created_at <= ?")
+                params.append(after_created)
+            elif spec["rank"] == after_rank:
+                where.append("(t.created_at, t.id) < (?, ?)")
+                params.extend([after_created, after_id])
+            else:
+                where.append("t.created_at < ?")
+                params.append(after_created)
+
+        columns = spec["columns"] + (", t.raw_response" if include_raw else "")
+        sql = f"SELECT {columns} FROM {source} t"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY t.created_at DESC, t.id DESC LIMIT ?"
+        params.append(limit + 1)
+        queries.append((source, spec["rank"], sql, params))
+
+    return queries
+
+
+def merge_page(
+    rows_by_query: list[tuple[str, int, list]], limit: int, include_raw: bool = False
+) -> tuple[list[dict], str | None]:
+    """
+    Mezcla las filas de cada tabla (ya ordenadas) en una página de `limit`
+    elementos y calcula el cursor de la siguiente
+    """
+    per_source = [
+        [(row["created_at"], rank, row["id"], source, row) for row in rows]
+        for source, rank, rows in rows_by_query
+    ]
+    merged = heapq.merge(*per_source, key=lambda entry: entry[:3], reverse=True)
+    page = []
+    for entry in merged:
+        page.append(entry)
+        if len(page) > limit:
+            break
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        created_at, rank, row_id, _, _ = page[-1]
+        next_cursor = encode_cursor(created_at, rank, row_id)
+
+    items = [_to_item(row, source, include_raw) for _, _, _, source, row in page]
+    return items, next_cursor
+
+
+def list_transactions(
+    merchant_id: str | None = None,
+    status: str | None = None,
+    tx_type: str | None = None,
+    created_from: str | None = None,
+    created_to: str | None = None,
+    cursor: str | None = None,
+    limit: int = 50,
+    include_raw: bool = False,
+) -> tuple[list[dict], str | None]:
+    """
+    Listado de transacciones locales, del más reciente al más antiguo, con
+    paginación por cursor (keyset) sobre (created_at, tabla, id). Cada tabla se
+    recorre por su índice de created_at y solo se leen `limit + 1` filas.
+    """
+    queries = transaction_queries(
+        merchant_id, status, tx_type, created_from, created_to, cursor, limit, include_raw
+    )
+    conn = get_connection()
+    rows_by_query = [(source, rank, conn.execute(sql, params).fetchall()) for source, rank, sql, params in queries]
+    return merge_page(rows_by_query, limit, include_raw)
+
+
+def export_queries(
+    merchant_id: str | None = None,
+    created_from: str | None = None,
+    created_to: str | None = None,
+) -> list[tuple[str, str, list]]:
+    """
+    Una consulta (tabla, sql, params) por tabla, sin límite y en orden de
+    created_at: se recorren con un cursor por bloques, no se cargan enteras
+    """
+    queries = []
+    for source, spec in SOURCES.items():
+        where: list[str] = []
+        params: list = []
+        if merchant_id:
+            where.append(spec["merchant_filter"])
+            params.append(merchant_id)
+        if created_from:
+            where.append("t.created_at >= ?")
+            params.append(created_from)
+        if created_to:
+            where.append("t.created_at < ?")
+            params.append(created_to)
+        sql = f"SELECT {spec['columns']} FROM {source} t"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY t.created_at, t.id"
+        queries.append((source, sql, params))
+    return queries
+
+
+FIRST_CREATED_SQL = "SELECT MIN(first) FROM (" + " UNION ALL ".join(
+    f"SELECT MIN(created_at) AS first FROM {source}" for source in SOURCES
+) + ") AS firsts"
+
+
+def open_payments_query(after: str | None, limit: int) -> tuple[str, list]:
+    """
+    Entradas del ledger que aún pueden cambiar, por payment_id a partir de
+    `after` (recorre el índice parcial ix_payment_ledger_open)
+    """
+    sql = f"SELECT * FROM payment_ledger WHERE {OPEN_PAYMENT_FILTER}"
+    params: list = []
+    if after is not None:
+        sql += " AND payment_id > ?"
+        params.append(after)
+    sql += " ORDER BY payment_id LIMIT ?"
+    params.append(limit)
+    return sql, params
+
+
+def status_update_sql(table: str) -> str:
+    if table not in SOURCES:
+        raise ValueError(f"Tabla no consultable: {table}")
+    return f"UPDATE {table} SET status = ? WHERE transaction_id = ?"
+
+
+def first_created_at() -> str | None:
+    return get_connection().execute(FIRST_CREATED_SQL).fetchone()[0]
+
+
+def open_payments(after: str | None, limit: int) -> list[dict]:
+    sql, params = open_payments_query(after, limit)
+    return [dict(row) for row in get_connection().execute(sql, params).fetchall()]
+
+
+def update_statuses(updates: list[tuple[str, str, str]]) -> None:
+    with get_connection() as conn:
+        for table, transaction_id, status in updates:
+            sql = status_update_sql(table)
+            rows = [dict(row) for row in conn.execute(rollups.status_rows_sql(table), (transaction_id,))]
+            conn.execute(sql, (status, transaction_id))
+            for granularity, deltas in rollups.status_change_rows(table, rows, status).items():
+                if deltas:
+                    conn.executemany(rollups.upsert_sql(granularity), deltas)
+
+
+def volume_stats(granularity: str, merchant_id: str | None, start: str, end: str) -> list[dict]:
+    sql, params = rollups.stats_query(granularity, merchant_id, start, end)
+    return rollups.stats_result(get_connection().execute(sql, params).fetchall())
+
+
+def rebuild_rollups() -> None:
+    # El DELETE toma el lock de escritura: los lotes que llegan mientras tanto
+    # esperan (busy_timeout) y suman sus deltas sobre el resultado ya recalculado
+    with get_connection() as conn:
+        for granularity in rollups.GRANULARITIES:
+            for statement in rollups.rebuild_sql(granularity):
+                conn.execute(statement)
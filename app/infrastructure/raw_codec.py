@@ -0,0 +1,143 @@
+import json
+import logging
+import threading
+import zlib
+
+from app.config import settings
+
+try:
+    import zstandard
+except ImportError:  # opcional: pip install zstandard
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Diccionario prefijado con la forma de las respuestas de Akua. Las respuestas
+# son pequeñas y casi idénticas entre sí (mismas claves, estados y formatos de
+# id), así que comprimir contra este contenido ahorra mucho más que comprimir
+# cada JSON por separado. zlib usa mejor lo que está al final: lo más frecuente
+# va último. Cambiar el contenido exige una versión nueva (DICTIONARY_VERSION)
+# para poder seguir leyendo las filas ya escritas.
+_DICTIONARY_SAMPLES = [
+    {"payment_id": "pay-", "merchant_id": "mer-", "status": "DECLINED",
+     "transaction": {"id": "trx-", "type": "AUTHORIZATION", "status": "DECLINED",
+                     "amount": {"value": 0, "currency": "USD"}, "created_at": "2025-01-01T00:00:00Z"}},
+    {"payment_id": "pay-", "merchant_id": "mer-", "status": "CANCELLED",
+     "transaction": {"id": "trx-", "type": "CANCEL", "status": "APPROVED",
+                     "amount": {"value": 0, "currency": "USD"}, "created_at": "2025-01-01T00:00:00Z"}},
+    {"payment_id": "pay-", "merchant_id": "mer-", "status": "REFUNDED",
+     "transaction": {"id": "trx-", "type": "REFUND", "status": "APPROVED",
+                     "amount": {"value": 0, "currency": "USD"}, "created_at": "2025-01-01T00:00:00Z"}},
+    {"payment_id": "pay-", "merchant_id": "mer-", "status": "PARTIALLY_CAPTURED",
+     "transaction": {"id": "trx-", "type": "CAPTURE", "status": "APPROVED",
+                     "amount": {"value": 0, "currency": "USD"}, "created_at": "2025-01-01T00:00:00Z"}},
+    {"payment_id": "pay-", "merchant_id": "mer-", "status": "CAPTURED",
+     "transaction": {"id": "trx-", "type": "CAPTURE", "status": "APPROVED",
+                     "amount": {"value": 0, "currency": "USD"}, "created_at": "2025-01-01T00:00:00Z"}},
+    {"payment_id": "pay-", "merchant_id": "mer-", "status": "AUTHORIZED",
+     "transaction": {"id": "trx-", "type": "AUTHORIZATION", "status": "APPROVED",
+                     "amount": {"value": 0, "currency": "USD"}, "created_at": "2025-01-01T00:00:00Z"}},
+]
+DICTIONARY = "".join(json.dumps(sample) for sample in _DICTIONARY_SAMPLES).encode()
+DICTIONARY_VERSION = 1
+
+# Primer byte de cada valor guardado: códec; segundo: versión del diccionario.
+# Las filas anteriores a la compresión son TEXT con el JSON plano.
+ZSTD = b"Z"
+ZLIB = b"D"
+PLAIN = b"J"
+
+_local = threading.local()
+
+
+def _zstd_dictionary():
+    dictionary = getattr(_local, "zstd_dictionary", None)
+    if dictionary is None:
+        dictionary = zstandard.ZstdCompressionDict(DICTIONARY, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        _local.zstd_dictionary = dictionary
+    return dictionary
+
+
+def _zstd_compressor():
+    # Los compresores de zstandard no se comparten entre hilos
+    compressor = getattr(_local, "zstd_compressor", None)
+    if compressor is None:
+        compressor = zstandard.ZstdCompressor(level=3, dict_data=_zstd_dictionary())
+        _local.zstd_compressor = compressor
+    return compressor
+
+
+def _zstd_decompressor():
+    decompressor = getattr(_local, "zstd_decompressor", None)
+    if decompressor is None:
+        decompressor = zstandard.ZstdDecompressor(dict_data=_zstd_dictionary())
+        _local.zstd_decompressor = decompressor
+    return decompressor
+
+
+def default_codec() -> bytes:
+    """
+    Códec configurado en RAW_RESPONSE_CODEC: auto (zstd si está instalado,
+    si no zlib), zstd, zlib o json (sin comprimir)
+    """
+    name = settings.raw_response_codec.lower()
+    if name == "json":
+        return PLAIN
+    if name == "zlib" or zstandard is None:
+        if name == "zstd":
+            logger.warning("RAW_RESPONSE_CODEC=zstd pero el paquete 'zstandard' no está instalado, se usa zlib")
+        return ZLIB
+    return ZSTD
+
+
+_CODEC = default_codec()
+
+
+def encode_raw(raw: dict | bytes, codec: bytes | None = None) -> bytes:
+    """
+    `raw` puede venir ya serializado (los bytes tal como los envió Akua)
+    """
+    codec = codec or _CODEC
+    data = raw if isinstance(raw, bytes) else json.dumps(raw, separators=(",", ":")).encode()
+    header = codec + bytes([DICTIONARY_VERSION])
+    if codec == ZSTD:
+        return header + _zstd_compressor().compress(data)
+    if codec == ZLIB:
+        compressor = zlib.compressobj(level=6, wbits=-15, zdict=DICTIONARY)
+        return header + compressor.compress(data) + compressor.flush()
+    return header + data
+
+
+def decode_raw(value: bytes | str | None) -> dict | None:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+
+    codec, version, payload = value[:1], value[1], value[2:]
+    if version != DICTIONARY_VERSION:
+        raise ValueError(f"Versión de diccionario desconocida: {version}")
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("raw_response comprimido con zstd: instalar el paquete 'zstandard' para leerlo")
+        return json.loads(_zstd_decompressor().decompress(payload))
+    if codec == ZLIB:
+        decompressor = zlib.decompressobj(wbits=-15, zdict=DICTIONARY)
+        return json.loads(decompressor.decompress(payload) + decompressor.flush())
+    if codec == PLAIN:
+        return json.loads(payload)
+    raise ValueError(f"Códec de raw_response desconocido: {codec!r}")
+
+
+def extract_fields(raw: dict) -> dict:
+    """
+    Campos de la respuesta de Akua promovidos a columnas tipadas
+    """
+    transaction = raw.get("transaction") or {}
+    amount = transaction.get("amount") or raw.get("amount") or {}
+    value = amount.get("value") if isinstance(amount, dict) else None
+    return {
+        "amount_value": float(value) if isinstance(value, (int, float)) else None,
+        "currency": amount.get("currency") if isinstance(amount, dict) else None,
+        "akua_created_at": transaction.get("created_at") or raw.get("created_at"),
+    }
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from app.config import settings
+from app.infrastructure.akua_client import AkuaClient
+from app.infrastructure.database import get_connection
+from app.infrastructure.ledger import LEDGER_COLUMNS
+from app.infrastructure.storage import storage
+
+logger = logging.getLogger(__name__)
+
+REPORT_DIR = Path(settings.reconcile_report_dir) if settings.reconcile_report_dir else (
+    Path(__file__).resolve().parent.parent / "data" / "reconciliation"
+)
+
+RUNNING = "RUNNING"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+
+# Tipo de transacción de Akua -> tabla local
+TRANSACTION_TABLES = {
+    "AUTHORIZATION": "authorizations",
+    "CAPTURE": "captures",
+    "CANCEL": "cancellations",
+    "REFUND": "refunds",
+}
+# Campos del ledger que se comparan con el pago en Akua (campo local, campo de Akua)
+_COMPARED_FIELDS = (
+    ("status", "status"),
+    ("captured_amount", "captured_amount"),
+    ("refunded_amount", "refunded_amount"),
+)
+_AMOUNT_TOLERANCE = 1e-6
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+# --- Checkpoints (tabla reconciliation_runs del SQLite local) ---
+
+def _resumable_run(dry_run: bool) -> dict | None:
+    """
+    La última corrida del mismo modo, si quedó sin terminar (interrumpida o con error)
+    """
+    row = get_connection().execute(
+        "SELECT * FROM reconciliation_runs WHERE dry_run = ? ORDER BY id DESC LIMIT 1", (int(dry_run),)
+    ).fetchone()
+    return dict(row) if row and row["status"] != COMPLETED else None
+
+
+def _create_run(dry_run: bool) -> dict:
+    now = _now()
+    with get_connection() as conn:
+        run_id = conn.execute(
+            "INSERT INTO reconciliation_runs (status, dry_run, report_path, started_at, updated_at) "
+            "VALUES (?, ?, '', ?, ?)",
+            (RUNNING, int(dry_run), now, now),
+        ).lastrowid
+        report_path = str(REPORT_DIR / f"reconciliation-{run_id:06d}.jsonl")
+        conn.execute("UPDATE reconciliation_runs SET report_path = ? WHERE id = ?", (report_path, run_id))
+    return dict(get_connection().execute("SELECT * FROM reconciliation_runs WHERE id = ?", (run_id,)).fetchone())
+
+
+def _checkpoint(run: dict, status: str = RUNNING) -> None:
+    now = _now()
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE reconciliation_runs SET status = ?, cursor = ?, scanned = ?, drifted = ?, corrected = ?, "
+            "errors = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+            (
+                status, run["cursor"], run["scanned"], run["drifted"], run["corrected"], run["errors"], now,
+                now if status == COMPLETED else None, run["id"],
+            ),
+        )
+
+
+def _differs(local, upstream) -> bool:
+    if isinstance(local, (int, float)) and isinstance(upstream, (int, float)):
+        return abs(local - upstream) > _AMOUNT_TOLERANCE
+    return local != upstream
+
+
+def compare_payment(entry: dict, local: dict | None, upstream: dict) -> tuple[list[dict], dict | None, list[tuple]]:
+    """
+    Diferencias entre el registro local de un pago y su estado en Akua.
+    Devuelve (diferencias, entrada del ledger corregida o None, estados de
+    transacciones a corregir como (tabla, transaction_id, estado))
+    """
+    payment_id = entry["payment_id"]
+    diffs: list[dict] = []
+    corrected = dict(entry)
+
+    amount = upstream.get("amount") if isinstance(upstream.get("amount"), dict) else {}
+    compared = [*_COMPARED_FIELDS]
+    if isinstance(amount.get("value"), (int, float)):
+        upstream = {**upstream, "authorized_amount": amount["value"]}
+        compared.append(("authorized_amount", "authorized_amount"))
+    for field, upstream_field in compared:
+        value = upstream.get(upstream_field)
+        # Solo se comparan los campos que Akua informa
+        if value is None or not _differs(entry.get(field), value):
+            continue
+        diffs.append({"payment_id": payment_id, "kind": "payment", "field": field, "local": entry.get(field), "upstream": value})
+        corrected[field] = float(value) if isinstance(value, (int, float)) and field != "status" else value
+
+    local_status = {}
+    for table in TRANSACTION_TABLES.values():
+        for row in (local or {}).get(table, []):
+            if row.get("transaction_id"):
+                local_status[row["transaction_id"]] = (table, row["status"])
+
+    status_updates = []
+    for transaction in upstream.get("transactions") or []:
+        transaction_id, status = transaction.get("id"), transaction.get("status")
+        table = TRANSACTION_TABLES.get(transaction.get("type"))
+        if not transaction_id or table is None:
+            continue
+        if transaction_id not in local_status:
+            diffs.append({
+                "payment_id": payment_id, "kind": "missing_local", "table": table,
+                "transaction_id": transaction_id, "upstream": status,
+            })
+            continue
+        local_table, stored_status = local_status[transaction_id]
+        if status and stored_status != status:
+            diffs.append({
+                "payment_id": payment_id, "kind": "transaction", "table": local_table,
+                "transaction_id": transaction_id, "local": stored_status, "upstream": status,
+            })
+            status_updates.append((local_table, transaction_id, status))
+
+    if corrected == entry:
+        return diffs, None, status_updates
+    corrected["merchant_id"] = corrected.get("merchant_id") or upstream.get("merchant_id")
+    corrected["version"] = (entry.get("version") or 0) + 1
+    corrected["updated_at"] = _now()
+    return diffs, corrected, status_updates
+
+
+class Reconciler:
+    """
+    Conciliación incremental entre el registro local y Akua.
+
+    Recorre por bloques (en orden de payment_id) los pagos del ledger que aún
+    pueden cambiar, consulta su estado en Akua con concurrencia acotada y
+    corrige ledger y estados de transacciones. Cada diferencia va a un reporte
+    JSONL. Después de cada bloque guarda un checkpoint: una corrida
+    interrumpida se retoma desde el último bloque completo.
+    """
+
+    def __init__(self, client: AkuaClient, chunk_size: int, concurrency: int, dry_run: bool = False) -> None:
+        self.client = client
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.dry_run = dry_run
+
+    async def run(self, restart: bool = False, max_payments: int | None = None) -> dict:
+        run = None if restart else await asyncio.to_thread(_resumable_run, self.dry_run)
+        if run is not None:
+            logger.info("Retomando conciliación %s desde %s", run["id"], run["cursor"])
+        else:
+            run = await asyncio.to_thread(_create_run, self.dry_run)
+
+        report_path = Path(run["report_path"])
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # Límite de pagos de esta invocación (una corrida retomada ya trae escaneados)
+        budget = None if max_payments is None else run["scanned"] + max_payments
+        status = FAILED
+        try:
+            with report_path.open("a") as report:
+                while budget is None or run["scanned"] < budget:
+                    limit = self.chunk_size if budget is None else min(self.chunk_size, budget - run["scanned"])
+                    chunk = await storage.open_payments(run["cursor"], limit)
+                    if not chunk:
+                        break
+                    results = await asyncio.gather(*(self._bounded(semaphore, entry) for entry in chunk))
+                    for diffs, corrected, errored in results:
+                        for diff in diffs:
+                            report.write(json.dumps({"run_id": run["id"], **diff, "corrected": corrected}, default=str) + "\n")
+                        run["drifted"] += bool(diffs) and not errored
+                        run["corrected"] += corrected
+                        run["errors"] += errored
+                    report.flush()
+                    run["scanned"] += len(chunk)
+                    run["cursor"] = chunk[-1]["payment_id"]
+                    await asyncio.to_thread(_checkpoint, run)
+                    if len(chunk) < limit:
+                        break
+            # Con --max-payments la corrida queda abierta y la siguiente sigue desde el cursor
+            status = COMPLETED if budget is None or run["scanned"] < budget else RUNNING
+        finally:
+            await asyncio.to_thread(_checkpoint, run, status)
+
+        return {key: run[key] for key in ("id", "scanned", "drifted", "corrected", "errors", "report_path")} | {
+            "status": status,
+            "dry_run": self.dry_run,
+        }
+
+    async def _bounded(self, semaphore: asyncio.Semaphore, entry: dict) -> tuple[list[dict], bool, bool]:
+        async with semaphore:
+            return await self.reconcile_payment(entry)
+
+    async def reconcile_payment(self, entry: dict) -> tuple[list[dict], bool, bool]:
+        """
+        Devuelve (diferencias, se corrigió, hubo error consultando Akua)
+        """
+        payment_id = entry["payment_id"]
+        try:
+            result = await self.client.get_payment(payment_id)
+        except Exception as e:
+            return [{"payment_id": payment_id, "kind": "error", "error": str(e)}], False, True
+        if result is None:
+            return [{"payment_id": payment_id, "kind": "missing_upstream", "local": entry["status"]}], False, False
+
+        upstream = result["akua_response"].data
+        local = await storage.get_payment(payment_id)
+        diffs, ledger_entry, status_updates = compare_payment(entry, local, upstream)
+        if self.dry_run or (ledger_entry is None and not status_updates):
+            return diffs, False, False
+
+        if status_updates:
+            await storage.update_statuses(status_updates)
+        if ledger_entry is not None:
+            # Upsert por versión: si la API actualizó el pago mientras tanto, gana esa fila
+            await storage.write_records([("payment_ledger", {column: ledger_entry[column] for column in LEDGER_COLUMNS})])
+        return diffs, True, False
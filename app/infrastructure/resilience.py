@@ -0,0 +1,183 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable
+
+import httpx
+
+from app.config import settings
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Breaker por operación de Akua. Tras `failure_threshold` fallos seguidos
+    (5xx o error de red) se abre y rechaza llamadas durante `reset_timeout`;
+    luego deja pasar una llamada de prueba (HALF_OPEN) que decide si cierra.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def check(self) -> None:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(
+                    f"Circuito abierto para Akua {self.name}: se rechaza la llamada sin contactar a Akua"
+                )
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuito en prueba para Akua {self.name}")
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release(self) -> None:
+        """
+        La llamada terminó sin un resultado de Akua (error local, de token o
+        cancelación): no cuenta como éxito ni como fallo, pero libera la prueba
+        """
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class RetryPolicy:
+    """
+    Backoff exponencial con jitter completo; respeta Retry-After si viene
+    (nunca se reintenta antes de lo que pide el servidor)
+    """
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float, budget: float) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+    def delay(self, attempt: int, retry_after: str | None = None) -> float | None:
+        """
+        Espera antes del próximo intento; None si el Retry-After pide esperar
+        más que `max_delay` (se devuelve la respuesta en vez de reintentar)
+        """
+        hinted = _parse_retry_after(retry_after)
+        if hinted is not None:
+            return hinted if hinted <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+async def hedged(call: Callable[[], Awaitable[httpx.Response]], delay: float) -> tuple[httpx.Response, bool]:
+    """
+    Lanza `call`; si no responde en `delay` segundos lanza una segunda copia y
+    se queda con la primera que termine bien. Devuelve (respuesta, hubo_hedge)
+    """
+    first = asyncio.create_task(call())
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result(), False
+
+    pending = {first, asyncio.create_task(call())}
+    error: BaseException | None = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), True
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class UpstreamStats:
+    def __init__(self) -> None:
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.retries: dict[str, int] = defaultdict(int)
+        self.hedges: dict[str, int] = defaultdict(int)
+
+    def breaker(self, operation: str) -> CircuitBreaker:
+        breaker = self.breakers.get(operation)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                operation,
+                failure_threshold=settings.akua_breaker_failures,
+                reset_timeout=settings.akua_breaker_reset_seconds,
+            )
+            self.breakers[operation] = breaker
+        return breaker
+
+    def snapshot(self) -> dict:
+        operations = set(self.breakers) | set(self.retries) | set(self.hedges)
+        return {
+            operation: {
+                **(self.breakers[operation].stats() if operation in self.breakers else {}),
+                "retries": self.retries.get(operation, 0),
+                "hedged_requests": self.hedges.get(operation, 0),
+            }
+            for operation in sorted(operations)
+        }
+
+
+retry_policy = RetryPolicy(
+    max_attempts=settings.akua_retry_attempts,
+    base_delay=settings.akua_retry_base_delay_ms / 1000,
+    max_delay=settings.akua_retry_max_delay_ms / 1000,
+    budget=settings.akua_retry_budget_seconds,
+)
+upstream_stats = UpstreamStats()
@@ -0,0 +1,217 @@
+from datetime import datetime, timedelta, timezone
+
+# Rollups de volumen por comercio: una fila por (merchant, bucket, tipo de
+# transacción, estado, moneda) con cantidad y monto acumulados. Se actualizan
+# en la misma transacción que inserta los registros (y al corregir estados en
+# la conciliación), así /v1/stats no recorre las tablas de transacciones.
+GRANULARITIES = {
+    # granularidad: (tabla, largo del prefijo de created_at, sufijo del bucket)
+    "hour": ("merchant_volume_hourly", 13, ":00"),
+    "day": ("merchant_volume_daily", 10, ""),
+}
+_STEP = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+# Ventana por defecto de /v1/stats cuando no se indica `created_from`
+DEFAULT_WINDOW = {"hour": timedelta(hours=24), "day": timedelta(days=30)}
+
+# Tabla de registros -> tipo de transacción (los mismos tipos de /v1/payments)
+TRANSACTION_TYPES = {
+    "authorizations": None,  # columna type: AUTHORIZATION o PRE_AUTHORIZATION
+    "captures": "CAPTURE",
+    "cancellations": "CANCELLATION",
+    "refunds": "REFUND",
+}
+_KEY = "merchant_id, bucket, type, status, currency"
+
+SCHEMA = [
+    statement
+    for table, _length, _suffix in GRANULARITIES.values()
+    for statement in (
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            merchant_id TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            amount DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY ({_KEY})
+        )
+        """,
+        # Consultas sin merchant_id (totales de todos los comercios)
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_bucket ON {table} (bucket)",
+    )
+]
+
+
+def bucket_of(created_at: str, granularity: str) -> str:
+    _table, length, suffix = GRANULARITIES[granularity]
+    return created_at[:length] + suffix
+
+
+def upsert_sql(granularity: str) -> str:
+    """
+    Suma una fila de deltas (merchant, payment_id, bucket, tipo, estado, moneda,
+    cantidad, monto). Sin merchant en el registro se toma el de la autorización
+    del pago, que en un mismo lote ya se insertó antes en la transacción
+    """
+    table = GRANULARITIES[granularity][0]
+    return (
+        f"INSERT INTO {table} ({_KEY}, count, amount) VALUES ("
+        "COALESCE(?, (SELECT a.merchant_id FROM authorizations a WHERE a.payment_id = ? LIMIT 1), ''), "
+        "?, ?, ?, ?, ?, ?) "
+        f"ON CONFLICT ({_KEY}) DO UPDATE SET "
+        f"count = {table}.count + excluded.count, amount = {table}.amount + excluded.amount"
+    )
+
+
+def _delta(table: str, values: dict, granularity: str, sign: int) -> tuple:
+    tx_type = TRANSACTION_TYPES[table] or values.get("type") or "AUTHORIZATION"
+    return (
+        values.get("merchant_id"),
+        values.get("payment_id"),
+        bucket_of(values["created_at"], granularity),
+        tx_type,
+        values.get("status") or "UNKNOWN",
+        values.get("currency") or "",
+        sign,
+        sign * (values.get("amount_value") or 0.0),
+    )
+
+
+def rollup_rows(records: list[tuple[str, dict]]) -> dict[str, list[tuple]]:
+    """
+    Deltas de los rollups para un lote de registros, por granularidad
+    """
+    return {
+        granularity: [
+            _delta(table, values, granularity, 1)
+            for table, values in records
+            if table in TRANSACTION_TYPES
+        ]
+        for granularity in GRANULARITIES
+    }
+
+
+def status_change_rows(table: str, rows: list[dict], status: str) -> dict[str, list[tuple]]:
+    """
+    Deltas de los rollups al corregir el estado de registros ya guardados: se
+    descuentan del estado anterior y se suman al nuevo
+    """
+    changed = [row for row in rows if row["status"] != status]
+    return {
+        granularity: [
+            delta
+            for row in changed
+            for delta in (
+                _delta(table, row, granularity, -1),
+                _delta(table, {**row, "status": status}, granularity, 1),
+            )
+        ]
+        for granularity in GRANULARITIES
+    }
+
+
+def status_rows_sql(table: str) -> str:
+    """
+    Registros cuyo estado se va a corregir, con las columnas que usan los rollups
+    """
+    type_column = "type" if TRANSACTION_TYPES[table] is None else "NULL AS type"
+    return (
+        f"SELECT merchant_id, payment_id, {type_column}, status, currency, amount_value, created_at "
+        f"FROM {table} WHERE transaction_id = ?"
+    )
+
+
+def rebuild_sql(granularity: str) -> list[str]:
+    """
+    Recalcula una granularidad desde las tablas de registros (backfill)
+    """
+    table, length, suffix = GRANULARITIES[granularity]
+    statements = [f"DELETE FROM {table}"]
+    for source, tx_type in TRANSACTION_TYPES.items():
+        type_expr = "t.type" if tx_type is None else f"'{tx_type}'"
+        merchant = (
+            "t.merchant_id" if source == "authorizations" else
+            "COALESCE(t.merchant_id, (SELECT a.merchant_id FROM authorizations a WHERE a.payment_id = t.payment_id LIMIT 1), '')"
+        )
+        bucket = f"substr(t.created_at, 1, {length})" + (f" || '{suffix}'" if suffix else "")
+        statements.append(
+            f"INSERT INTO {table} ({_KEY}, count, amount) "
+            f"SELECT merchant_id, bucket, type, status, currency, COUNT(*), SUM(amount) FROM ("
+            f"SELECT {merchant} AS merchant_id, {bucket} AS bucket, {type_expr} AS type, t.status AS status, "
+            f"COALESCE(t.currency, '') AS currency, COALESCE(t.amount_value, 0) AS amount FROM {source} t"
+            f") r GROUP BY merchant_id, bucket, type, status, currency"
+        )
+    return statements
+
+
+class InvalidRange(ValueError):
+    pass
+
+
+def _parse(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    # created_at se guarda en UTC sin zona horaria
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def stats_window(granularity: str, created_from: str | None, created_to: str | None) -> tuple[str, str]:
+    """
+    Buckets [desde, hasta) que cubren el rango pedido: sin `created_to` hasta
+    ahora, sin `created_from` la ventana por defecto de la granularidad
+    """
+    if granularity not in GRANULARITIES:
+        raise InvalidRange(f"Granularidad no soportada: {granularity} (hour o day)")
+    try:
+        end = _parse(created_to) if created_to else datetime.utcnow()
+        start = _parse(created_from) if created_from else end - DEFAULT_WINDOW[granularity]
+    except ValueError:
+        raise InvalidRange("created_from y created_to deben ser fechas ISO 8601")
+    if start >= end:
+        raise InvalidRange("created_from debe ser anterior a created_to")
+    # Se incluye el bucket que contiene `start` y el que contiene `end` si este
+    # no cae justo en un borde (hasta es exclusivo)
+    end_bucket = bucket_of(end.isoformat(), granularity)
+    if _parse(end_bucket) < end:
+        end_bucket = bucket_of((_parse(end_bucket) + _STEP[granularity]).isoformat(), granularity)
+    return bucket_of(start.isoformat(), granularity), end_bucket
+
+
+def stats_query(granularity: str, merchant_id: str | None, start: str, end: str) -> tuple[str, list]:
+    """
+    Filas de los rollups en [start, end): por merchant recorre la clave
+    primaria; sin merchant suma todos los comercios de cada bucket
+    """
+    table = GRANULARITIES[granularity][0]
+    if merchant_id is not None:
+        return (
+            f"SELECT bucket, type, status, currency, count, amount FROM {table} "
+            f"WHERE merchant_id = ? AND bucket >= ? AND bucket < ? AND count <> 0 ORDER BY bucket",
+            [merchant_id, start, end],
+        )
+    return (
+        f"SELECT bucket, type, status, currency, SUM(count) AS count, SUM(amount) AS amount FROM {table} "
+        f"WHERE bucket >= ? AND bucket < ? GROUP BY bucket, type, status, currency "
+        f"HAVING SUM(count) <> 0 ORDER BY bucket",
+        [start, end],
+    )
+
+
+def stats_result(rows) -> list[dict]:
+    """
+    Una entrada por (bucket, moneda) con cantidad y monto por tipo y estado:
+    {"bucket", "currency", "AUTHORIZATION": {"APPROVED": {"count", "amount"}}, ...}
+    """
+    buckets: dict[tuple[str, str], dict] = {}
+    for row in rows:
+        entry = buckets.setdefault(
+            (row["bucket"], row["currency"]), {"bucket": row["bucket"], "currency": row["currency"] or None}
+        )
+        entry.setdefault(row["type"], {})[row["status"]] = {
+            "count": row["count"],
+            "amount": round(row["amount"], 6),
+        }
+    return list(buckets.values())
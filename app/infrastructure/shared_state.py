@@ -0,0 +1,174 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Hashable
+
+from app.config import settings
+from app.infrastructure.database import DB_PATH
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin locks de archivo, se asume un solo proceso
+    fcntl = None
+
+
+_leader_handle = None
+
+
+def is_leader(path: Path) -> bool:
+    """
+    True en un único proceso de los que comparten `path`: el primero que toma
+    el lock lo conserva mientras viva. Si muere, el siguiente que pregunte lo toma
+    """
+    global _leader_handle
+    if _leader_handle is not None or fcntl is None:
+        return True
+    handle = open(path, "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _leader_handle = handle
+    return True
+
+
+class SharedStateStore:
+    """
+    Estado compartido entre los workers de uvicorn de una máquina, en un
+    archivo SQLite propio (SHARED_STATE_PATH): el access token de Akua (con
+    un lease para que lo renueve un solo worker) y el cache de listados.
+    El contenido es reconstruible, así que se escribe sin fsync.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.owner = f"pid-{os.getpid()}"
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS shared_tokens (
+                    identity TEXT PRIMARY KEY,
+                    token TEXT,
+                    expires_in INTEGER,
+                    expires_at REAL,
+                    valid_until REAL,
+                    renew_from REAL,
+                    lease_owner TEXT,
+                    lease_until REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS shared_cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    fresh_until REAL NOT NULL,
+                    stale_until REAL NOT NULL
+                )
+                """
+            )
+            self._local.conn = conn
+        return conn
+
+    # --- Access token (tiempos en reloj de pared, comparables entre procesos) ---
+
+    def get_token(self, identity: str) -> dict | None:
+        row = self._connection().execute(
+            "SELECT token, expires_in, expires_at, valid_until, renew_from FROM shared_tokens "
+            "WHERE identity = ? AND token IS NOT NULL",
+            (identity,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def try_lease(self, identity: str, seconds: float) -> bool:
+        """
+        Reserva la renovación del token para este proceso durante `seconds`
+        """
+        now = time.time()
+        cursor = self._connection().execute(
+            """
+            INSERT INTO shared_tokens (identity, lease_owner, lease_until) VALUES (?, ?, ?)
+            ON CONFLICT(identity) DO UPDATE SET lease_owner = excluded.lease_owner, lease_until = excluded.lease_until
+            WHERE shared_tokens.lease_until < ? OR shared_tokens.lease_owner = excluded.lease_owner
+            """,
+            (identity, self.owner, now + seconds, now),
+        )
+        return cursor.rowcount == 1
+
+    def release_lease(self, identity: str) -> None:
+        self._connection().execute(
+            "UPDATE shared_tokens SET lease_until = 0 WHERE identity = ? AND lease_owner = ?",
+            (identity, self.owner),
+        )
+
+    def put_token(self, identity: str, token: str, expires_in: int, expires_at: float, valid_until: float, renew_from: float) -> None:
+        self._connection().execute(
+            """
+            INSERT INTO shared_tokens (identity, token, expires_in, expires_at, valid_until, renew_from, lease_until)
+            VALUES (?, ?, ?, ?, ?, ?, 0)
+            ON CONFLICT(identity) DO UPDATE SET token = excluded.token, expires_in = excluded.expires_in,
+                expires_at = excluded.expires_at, valid_until = excluded.valid_until,
+                renew_from = excluded.renew_from, lease_until = 0
+            """,
+            (identity, token, expires_in, expires_at, valid_until, renew_from),
+        )
+
+    def delete_token(self, identity: str, token: str) -> None:
+        self._connection().execute(
+            "UPDATE shared_tokens SET token = NULL WHERE identity = ? AND token = ?", (identity, token)
+        )
+
+    # --- Cache de listados ---
+
+    @staticmethod
+    def cache_key(key: Hashable) -> str:
+        return json.dumps(list(key) if isinstance(key, tuple) else key)
+
+    def cache_get(self, key: Hashable) -> tuple[bytes, float, float] | None:
+        row = self._connection().execute(
+            "SELECT value, fresh_until, stale_until FROM shared_cache WHERE key = ? AND stale_until > ?",
+            (self.cache_key(key), time.time()),
+        ).fetchone()
+        return (row["value"], row["fresh_until"], row["stale_until"]) if row else None
+
+    def cache_put(self, key: Hashable, value: bytes, fresh_until: float, stale_until: float) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO shared_cache (key, value, fresh_until, stale_until) VALUES (?, ?, ?, ?)",
+            (self.cache_key(key), value, fresh_until, stale_until),
+        )
+
+    def cache_keys(self) -> list[Hashable]:
+        keys = []
+        for (text,) in self._connection().execute("SELECT key FROM shared_cache").fetchall():
+            key = json.loads(text)
+            keys.append(tuple(key) if isinstance(key, list) else key)
+        return keys
+
+    def cache_delete(self, keys: list[Hashable]) -> None:
+        self._connection().executemany(
+            "DELETE FROM shared_cache WHERE key = ?", [(self.cache_key(key),) for key in keys]
+        )
+        # Entradas vencidas de paso, para que la tabla no crezca sin límite
+        self._connection().execute("DELETE FROM shared_cache WHERE stale_until < ?", (time.time(),))
+
+
+SHARED_STATE_PATH = Path(settings.shared_state_path) if settings.shared_state_path else (
+    DB_PATH.with_name("shared_state.db")
+)
+
+shared_state = SharedStateStore(SHARED_STATE_PATH) if settings.shared_state else None
@@ -0,0 +1,20 @@
+from app.config import settings
+from app.infrastructure.storage.base import Storage
+from app.infrastructure.storage.sqlite import SQLiteStorage
+
+
+def build_storage() -> Storage:
+    if settings.storage_backend.lower() == "postgres":
+        from app.infrastructure.storage.postgres import PostgresStorage
+
+        return PostgresStorage(
+            dsn=settings.postgres_dsn,
+            min_size=settings.postgres_pool_min,
+            max_size=settings.postgres_pool_max,
+            insert_batch=settings.postgres_insert_batch,
+            statement_cache_size=settings.postgres_statement_cache_size,
+        )
+    return SQLiteStorage()
+
+
+storage = build_storage()
@@ -0,0 +1,132 @@
+from abc import ABC, abstractmethod
+from typing import AsyncIterator
+
+from app.infrastructure.database import (
+    Record,
+    authorization_record,
+    cancellation_record,
+    capture_record,
+    payment_record,
+    refund_record,
+)
+from app.infrastructure.passthrough import AkuaBody
+
+
+class Storage(ABC):
+    """
+    Almacenamiento de los registros de pago (autorizaciones, capturas,
+    cancelaciones, reembolsos) y del payment_ledger.
+
+    Las implementaciones escriben lotes de registros (`write_records`) y
+    resuelven las lecturas del histórico y del ledger. El estado propio de cada
+    nodo (idempotency keys, jobs, capturas programadas) sigue en SQLite.
+    """
+
+    name = "base"
+    # True si varios nodos/procesos ven las mismas filas
+    shared = False
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def write_records(self, records: list[Record]) -> None:
+        ...
+
+    @abstractmethod
+    async def get_ledger(self, payment_id: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    async def get_payment(self, payment_id: str, include_raw: bool = False) -> dict | None:
+        ...
+
+    @abstractmethod
+    async def list_transactions(self, limit: int = 50, include_raw: bool = False, **filters) -> tuple[list[dict], str | None]:
+        ...
+
+    @abstractmethod
+    def iter_transactions(
+        self,
+        chunk_size: int,
+        merchant_id: str | None = None,
+        created_from: str | None = None,
+        created_to: str | None = None,
+    ) -> AsyncIterator[list[dict]]:
+        """
+        Registros de todas las tablas de pagos en bloques de `chunk_size` filas,
+        leídos con un cursor: la memoria no depende del tamaño de las tablas
+        """
+        ...
+
+    @abstractmethod
+    async def first_created_at(self) -> str | None:
+        """
+        created_at del registro más antiguo
+        """
+        ...
+
+    @abstractmethod
+    async def open_payments(self, after: str | None, limit: int) -> list[dict]:
+        """
+        Entradas del ledger de pagos en estado no final, ordenadas por payment_id
+        y a partir de `after` (recorrido por bloques de la conciliación)
+        """
+        ...
+
+    @abstractmethod
+    async def update_statuses(self, updates: list[tuple[str, str, str]]) -> None:
+        """
+        Corrige el estado de registros por transacción: (tabla, transaction_id, estado)
+        """
+        ...
+
+    @abstractmethod
+    async def volume_stats(self, granularity: str, merchant_id: str | None, start: str, end: str) -> list[dict]:
+        """
+        Rollups de volumen de los buckets [start, end) (ver rollups.stats_result)
+        """
+        ...
+
+    @abstractmethod
+    async def rebuild_rollups(self) -> None:
+        """
+        Recalcula los rollups de volumen desde las tablas de registros
+        """
+        ...
+
+    async def save_payment(self, order_id: str, payment_id: str, transaction_id: str, status: str, raw_response: dict | AkuaBody):
+        await self.write_records([payment_record(order_id, payment_id, transaction_id, status, raw_response)])
+
+    async def save_authorization(
+        self,
+        merchant_id: str,
+        authorization_id: str,
+        payment_id: str | None,
+        transaction_id: str | None,
+        status: str,
+        raw_response: dict | AkuaBody,
+        auth_type: str = "AUTHORIZATION",
+    ):
+        await self.write_records([
+            authorization_record(merchant_id, authorization_id, payment_id, transaction_id, status, raw_response, auth_type)
+        ])
+
+    async def save_cancellation(self, payment_id: str, transaction_id: str, status: str, raw_response: dict | AkuaBody):
+        await self.write_records([cancellation_record(payment_id, transaction_id, status, raw_response)])
+
+    async def save_capture(
+        self,
+        payment_id: str,
+        transaction_id: str,
+        amount: str | None,
+        status: str,
+        raw_response: dict | AkuaBody,
+    ):
+        await self.write_records([capture_record(payment_id, transaction_id, amount, status, raw_response)])
+
+    async def save_refund(self, payment_id: str, transaction_id: str | None, status: str, raw_response: dict | AkuaBody):
+        await self.write_records([refund_record(payment_id, transaction_id, status, raw_response)])
@@ -0,0 +1,308 @@
+import logging
+import time
+from typing import AsyncIterator
+
+from app.infrastructure.database import UPSERT_KEYS, Record, group_records
+from app.infrastructure.metrics import postgres_rows_per_commit, postgres_write_duration, postgres_write_errors
+from app.infrastructure.payment_state import OPEN_PAYMENT_FILTER
+from app.infrastructure.queries import (
+    FIRST_CREATED_SQL,
+    export_queries,
+    merge_page,
+    open_payments_query,
+    payment_queries,
+    payment_result,
+    status_update_sql,
+    transaction_queries,
+)
+from app.infrastructure import rollups
+from app.infrastructure.storage.base import Storage
+
+try:
+    import asyncpg
+except ImportError:  # opcional: pip install asyncpg
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+# Límite de parámetros por sentencia del protocolo de PostgreSQL
+_MAX_PARAMS = 32767
+# Clave del advisory lock con el que un solo nodo crea el esquema a la vez
+_SCHEMA_LOCK = 0x616B7561
+
+# Mismas tablas y columnas que el esquema SQLite (después de todas las
+# migraciones), para que los registros y las consultas sirvan en ambos.
+# created_at sigue siendo texto ISO 8601: el cursor de paginación lo compara tal cual.
+_RAW_COLUMNS = """
+    raw_response BYTEA NOT NULL,
+    amount_value DOUBLE PRECISION,
+    currency TEXT,
+    akua_created_at TEXT,
+    created_at TEXT NOT NULL
+"""
+SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS payments (
+        id BIGSERIAL PRIMARY KEY,
+        order_id TEXT NOT NULL,
+        payment_id TEXT NOT NULL,
+        transaction_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        merchant_id TEXT,
+        {_RAW_COLUMNS}
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS authorizations (
+        id BIGSERIAL PRIMARY KEY,
+        merchant_id TEXT NOT NULL,
+        authorization_id TEXT NOT NULL,
+        payment_id TEXT,
+        transaction_id TEXT,
+        status TEXT NOT NULL,
+        type TEXT NOT NULL DEFAULT 'AUTHORIZATION',
+        {_RAW_COLUMNS}
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS cancellations (
+        id BIGSERIAL PRIMARY KEY,
+        payment_id TEXT NOT NULL,
+        transaction_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        merchant_id TEXT,
+        {_RAW_COLUMNS}
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS captures (
+        id BIGSERIAL PRIMARY KEY,
+        payment_id TEXT NOT NULL,
+        transaction_id TEXT NOT NULL,
+        amount TEXT,
+        status TEXT NOT NULL,
+        merchant_id TEXT,
+        {_RAW_COLUMNS}
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS refunds (
+        id BIGSERIAL PRIMARY KEY,
+        payment_id TEXT NOT NULL,
+        transaction_id TEXT,
+        status TEXT NOT NULL,
+        merchant_id TEXT,
+        {_RAW_COLUMNS}
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS payment_ledger (
+        payment_id TEXT PRIMARY KEY,
+        merchant_id TEXT,
+        status TEXT,
+        currency TEXT,
+        authorized_amount DOUBLE PRECISION,
+        captured_amount DOUBLE PRECISION NOT NULL DEFAULT 0,
+        refunded_amount DOUBLE PRECISION NOT NULL DEFAULT 0,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )
+    """,
+    *(
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"
+        for table in ("payments", "authorizations", "cancellations", "captures", "refunds")
+        for column in ("payment_id", "transaction_id", "created_at")
+    ),
+    "CREATE INDEX IF NOT EXISTS ix_authorizations_merchant_created ON authorizations (merchant_id, created_at)",
+    f"CREATE INDEX IF NOT EXISTS ix_payment_ledger_open ON payment_ledger (payment_id) WHERE {OPEN_PAYMENT_FILTER}",
+    *rollups.SCHEMA,
+]
+_ROLLUP_TABLES = ", ".join(table for table, _length, _suffix in rollups.GRANULARITIES.values())
+
+
+def _numbered(sql: str) -> str:
+    """
+    Placeholders de SQLite (?) a los de PostgreSQL ($1, $2, ...)
+    """
+    parts = sql.split("?")
+    return parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], 1))
+
+
+def _insert_sql(table: str, columns: tuple[str, ...], row_count: int) -> str:
+    width = len(columns)
+    values = ", ".join(
+        "(" + ", ".join(f"${row * width + i}" for i in range(1, width + 1)) + ")"
+        for row in range(row_count)
+    )
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values}"
+    key = UPSERT_KEYS.get(table)
+    if key:
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column != key)
+        sql += f" ON CONFLICT ({key}) DO UPDATE SET {updates} WHERE excluded.version > {table}.version"
+    return sql
+
+
+def _chunk_sizes(total: int, max_rows: int) -> list[int]:
+    """
+    Parte `total` filas en bloques de potencias de 2 (hasta `max_rows`): cada
+    (tabla, columnas) usa a lo sumo log2(max_rows) sentencias preparadas distintas
+    """
+    sizes = []
+    while total > 0:
+        size = min(max_rows, 1 << (total.bit_length() - 1))
+        sizes.append(size)
+        total -= size
+    return sizes
+
+
+def _latest_versions(columns: tuple[str, ...], rows: list[tuple], key: str) -> list[tuple]:
+    """
+    Una fila por clave (la de mayor versión): un INSERT ... ON CONFLICT no
+    puede tocar dos veces la misma fila
+    """
+    key_index, version_index = columns.index(key), columns.index("version")
+    latest: dict = {}
+    for row in rows:
+        current = latest.get(row[key_index])
+        if current is None or row[version_index] > current[version_index]:
+            latest[row[key_index]] = row
+    return list(latest.values())
+
+
+async def _apply_rollups(conn, deltas_by_granularity: dict[str, list[tuple]]) -> None:
+    for granularity, deltas in deltas_by_granularity.items():
+        if deltas:
+            # Mismo orden de filas en todos los nodos: dos lotes que suman sobre
+            # los mismos buckets toman los locks en el mismo orden (sin deadlocks)
+            deltas = sorted(deltas, key=lambda delta: tuple("" if value is None else value for value in delta[:6]))
+            await conn.executemany(_numbered(rollups.upsert_sql(granularity)), deltas)
+
+
+class PostgresStorage(Storage):
+    """
+    PostgreSQL compartido por varios nodos de la API, con asyncpg: pool de
+    conexiones, sentencias preparadas (cache por conexión de asyncpg) e
+    INSERT multi-fila por lote del write-behind.
+    """
+
+    name = "postgres"
+    shared = True
+
+    def __init__(self, dsn: str, min_size: int, max_size: int, insert_batch: int, statement_cache_size: int) -> None:
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.insert_batch = insert_batch
+        self.statement_cache_size = statement_cache_size
+        self._pool = None
+
+    async def start(self) -> None:
+        if asyncpg is None:
+            raise RuntimeError("STORAGE_BACKEND=postgres requiere el paquete 'asyncpg' (pip install asyncpg)")
+        self._pool = await asyncpg.create_pool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            statement_cache_size=self.statement_cache_size,
+        )
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", _SCHEMA_LOCK)
+                for statement in SCHEMA:
+                    await conn.execute(statement)
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def write_records(self, records: list[Record]) -> None:
+        started = time.perf_counter()
+        try:
+            async with self._pool.acquire() as conn:
+                async with conn.transaction():
+                    for (table, columns), rows in group_records(records).items():
+                        key = UPSERT_KEYS.get(table)
+                        if key:
+                            rows = _latest_versions(columns, rows, key)
+                        max_rows = max(1, min(self.insert_batch, _MAX_PARAMS // len(columns)))
+                        offset = 0
+                        for size in _chunk_sizes(len(rows), max_rows):
+                            chunk = rows[offset:offset + size]
+                            offset += size
+                            await conn.execute(
+                                _insert_sql(table, columns, size), *(value for row in chunk for value in row)
+                            )
+                    await _apply_rollups(conn, rollups.rollup_rows(records))
+        except Exception:
+            postgres_write_errors.inc()
+            raise
+        postgres_write_duration.observe(time.perf_counter() - started)
+        postgres_rows_per_commit.observe(len(records))
+
+    async def get_ledger(self, payment_id: str) -> dict | None:
+        row = await self._pool.fetchrow("SELECT * FROM payment_ledger WHERE payment_id = $1", payment_id)
+        return dict(row) if row else None
+
+    async def get_payment(self, payment_id: str, include_raw: bool = False) -> dict | None:
+        async with self._pool.acquire() as conn:
+            rows_by_source = {
+                source: await conn.fetch(_numbered(sql), *params)
+                for source, sql, params in payment_queries(payment_id, include_raw)
+            }
+            ledger = await conn.fetchrow("SELECT * FROM payment_ledger WHERE payment_id = $1", payment_id)
+        return payment_result(payment_id, rows_by_source, ledger, include_raw)
+
+    async def list_transactions(self, limit: int = 50, include_raw: bool = False, **filters) -> tuple[list[dict], str | None]:
+        queries = transaction_queries(limit=limit, include_raw=include_raw, **filters)
+        async with self._pool.acquire() as conn:
+            rows_by_query = [
+                (source, rank, await conn.fetch(_numbered(sql), *params))
+                for source, rank, sql, params in queries
+            ]
+        return merge_page(rows_by_query, limit, include_raw)
+
+    async def open_payments(self, after: str | None, limit: int) -> list[dict]:
+        sql, params = open_payments_query(after, limit)
+        return [dict(row) for row in await self._pool.fetch(_numbered(sql), *params)]
+
+    async def update_statuses(self, updates: list[tuple[str, str, str]]) -> None:
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                for table, transaction_id, status in updates:
+                    sql = _numbered(status_update_sql(table))
+                    rows = [dict(row) for row in await conn.fetch(_numbered(rollups.status_rows_sql(table)), transaction_id)]
+                    await conn.execute(sql, status, transaction_id)
+                    await _apply_rollups(conn, rollups.status_change_rows(table, rows, status))
+
+    async def volume_stats(self, granularity: str, merchant_id: str | None, start: str, end: str) -> list[dict]:
+        sql, params = rollups.stats_query(granularity, merchant_id, start, end)
+        return rollups.stats_result(await self._pool.fetch(_numbered(sql), *params))
+
+    async def rebuild_rollups(self) -> None:
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                # Los lotes de los demás nodos esperan el lock para sumar sus
+                # deltas: sus registros no confirmados no entran en el recálculo
+                await conn.execute(f"LOCK TABLE {_ROLLUP_TABLES} IN EXCLUSIVE MODE")
+                for granularity in rollups.GRANULARITIES:
+                    for statement in rollups.rebuild_sql(granularity):
+                        await conn.execute(statement)
+
+    async def iter_transactions(
+        self,
+        chunk_size: int,
+        merchant_id: str | None = None,
+        created_from: str | None = None,
+        created_to: str | None = None,
+    ) -> AsyncIterator[list[dict]]:
+        async with self._pool.acquire() as conn:
+            # Cursor del lado del servidor: requiere una transacción abierta
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                for source, sql, params in export_queries(merchant_id, created_from, created_to):
+                    cursor = await conn.cursor(_numbered(sql), *params)
+                    while rows := await cursor.fetch(chunk_size):
+                        yield [{**dict(row), "source": source} for row in rows]
+
+    async def first_created_at(self) -> str | None:
+        return await self._pool.fetchval(FIRST_CREATED_SQL)
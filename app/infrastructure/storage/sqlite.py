@@ -0,0 +1,67 @@
+import asyncio
+from typing import AsyncIterator
+
+from app.infrastructure import queries
+from app.infrastructure.database import Record, get_connection, open_read_connection, write_records
+from app.infrastructure.storage.base import Storage
+
+
+class SQLiteStorage(Storage):
+    """
+    Archivo SQLite local (por defecto). Las escrituras y los listados van a un
+    hilo; la lectura del ledger por clave primaria se hace en el hilo del loop
+    """
+
+    name = "sqlite"
+
+    async def write_records(self, records: list[Record]) -> None:
+        await asyncio.to_thread(write_records, records)
+
+    async def get_ledger(self, payment_id: str) -> dict | None:
+        # Búsqueda por clave primaria en la conexión del hilo: microsegundos,
+        # no vale la pena pasarla a un hilo
+        row = get_connection().execute(
+            "SELECT * FROM payment_ledger WHERE payment_id = ?", (payment_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    async def get_payment(self, payment_id: str, include_raw: bool = False) -> dict | None:
+        return await asyncio.to_thread(queries.get_payment, payment_id, include_raw)
+
+    async def iter_transactions(
+        self,
+        chunk_size: int,
+        merchant_id: str | None = None,
+        created_from: str | None = None,
+        created_to: str | None = None,
+    ) -> AsyncIterator[list[dict]]:
+        # Conexión propia: el cursor se lee por bloques desde hilos distintos
+        # (uno a la vez) y con WAL ve una única foto de la base mientras dura
+        conn = await asyncio.to_thread(open_read_connection)
+        try:
+            await asyncio.to_thread(conn.execute, "BEGIN")
+            for source, sql, params in queries.export_queries(merchant_id, created_from, created_to):
+                cursor = await asyncio.to_thread(conn.execute, sql, params)
+                while rows := await asyncio.to_thread(cursor.fetchmany, chunk_size):
+                    yield [{**dict(row), "source": source} for row in rows]
+        finally:
+            await asyncio.to_thread(conn.close)
+
+    async def first_created_at(self) -> str | None:
+        # MIN sobre las tablas de transacciones: no es una búsqueda puntual
+        return await asyncio.to_thread(queries.first_created_at)
+
+    async def open_payments(self, after: str | None, limit: int) -> list[dict]:
+        return await asyncio.to_thread(queries.open_payments, after, limit)
+
+    async def update_statuses(self, updates: list[tuple[str, str, str]]) -> None:
+        await asyncio.to_thread(queries.update_statuses, updates)
+
+    async def volume_stats(self, granularity: str, merchant_id: str | None, start: str, end: str) -> list[dict]:
+        return await asyncio.to_thread(queries.volume_stats, granularity, merchant_id, start, end)
+
+    async def rebuild_rollups(self) -> None:
+        await asyncio.to_thread(queries.rebuild_rollups)
+
+    async def list_transactions(self, limit: int = 50, include_raw: bool = False, **filters) -> tuple[list[dict], str | None]:
+        return await asyncio.to_thread(queries.list_transactions, limit=limit, include_raw=include_raw, **filters)
@@ -0,0 +1,135 @@
+import asyncio
+import functools
+import json
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi.routing import APIRoute
+
+from app.config import settings
+from app.infrastructure.profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+# Spans del request en curso: nombre -> milisegundos acumulados
+_spans: ContextVar[dict[str, float] | None] = ContextVar("request_spans", default=None)
+_started: ContextVar[float] = ContextVar("request_started", default=0.0)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Acumula el tiempo del bloque en el span `name` del request actual
+    (sin request activo no registra nada)
+    """
+    spans = _spans.get()
+    if spans is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans[name] = spans.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+
+class TimedRoute(APIRoute):
+    """
+    Ruta que marca el span "validation": desde que llega el request hasta que
+    arranca el endpoint (lectura del cuerpo, parseo y validación Pydantic),
+    sin los spans ya medidos en ese tramo (admisión, dependencias)
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs) -> None:
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args, **kw):
+            spans = _spans.get()
+            if spans is not None:
+                elapsed = (time.perf_counter() - _started.get()) * 1000
+                # Así los spans no se solapan y suman a lo sumo `total`
+                spans["validation"] = max(0.0, elapsed - sum(spans.values()))
+            return await endpoint(*args, **kw)
+
+        super().__init__(path, timed_endpoint, **kwargs)
+
+
+def format_server_timing(spans: dict[str, float], total_ms: float) -> str:
+    measured = sum(spans.values())
+    parts = [f"{name};dur={duration:.2f}" for name, duration in spans.items()]
+    parts.append(f"app;dur={max(0.0, total_ms - measured):.2f}")
+    parts.append(f"total;dur={total_ms:.2f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI que abre los spans de cada request y:
+
+    - si SERVER_TIMING está activo, los devuelve en el header `Server-Timing`
+    - registra en el log (JSON) los requests más lentos que SLOW_REQUEST_MS
+    - perfila una fracción PROFILE_SAMPLE_RATE de los requests (ver app.infrastructure.profiling)
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        spans: dict[str, float] = {}
+        started = time.perf_counter()
+        spans_token = _spans.set(spans)
+        started_token = _started.set(started)
+        status = 500
+        session = profiler.start() if profiler.should_profile() else None
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if settings.server_timing:
+                    total_ms = (time.perf_counter() - started) * 1000
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", format_server_timing(spans, total_ms).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            total_ms = (time.perf_counter() - started) * 1000
+            _spans.reset(spans_token)
+            _started.reset(started_token)
+            profile = None
+            if session is not None:
+                profiler.stop(session)
+                name = f"{time.strftime('%Y%m%dT%H%M%S')}-{scope['method']}-{_slug(scope['path'])}-{uuid.uuid4().hex[:8]}"
+                profile = await asyncio.to_thread(profiler.write, session, name)
+            if settings.slow_request_ms > 0 and total_ms >= settings.slow_request_ms:
+                _log_slow_request(scope, status, total_ms, spans, profile)
+
+
+def _slug(path: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", path.strip("/"))[:80] or "root"
+
+
+def _log_slow_request(scope, status: int, total_ms: float, spans: dict[str, float], profile) -> None:
+    route = scope.get("route")
+    record = {
+        "event": "slow_request",
+        "method": scope["method"],
+        "path": scope["path"],
+        "route": getattr(route, "path", None),
+        "status": status,
+        "total_ms": round(total_ms, 2),
+        "spans_ms": {name: round(duration, 2) for name, duration in spans.items()},
+    }
+    if profile is not None:
+        record["profile"] = str(profile)
+    logger.warning(json.dumps(record))
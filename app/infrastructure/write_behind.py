@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from app.config import settings
+from app.infrastructure.database import Record
+from app.infrastructure.storage import storage
+from app.infrastructure.timing import stage
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Persistencia diferida de registros de pago.
+
+    Los routers encolan registros (`submit`) y una única tarea escritora los
+    vacía en lotes: una transacción por lote, de hasta `flush_size` registros o
+    lo acumulado durante `flush_interval` segundos. Si la cola está llena,
+    `submit` espera (backpressure). `stop` vacía la cola antes de terminar.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        flush_size: int,
+        flush_interval: float,
+        writer: Callable[[list[Record]], Awaitable[None]] = storage.write_records,
+    ) -> None:
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._writer = writer
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+        self.flushed_batches = 0
+        self.flushed_records = 0
+        self.failed_records = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._task = asyncio.create_task(self._run(), name="write-behind")
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def submit(self, record: Record) -> None:
+        with stage("persist"):
+            if not self.running:
+                # Sin escritor activo (ej: scripts fuera del lifespan) se escribe directo
+                await self._writer([record])
+                return
+            await self._queue.put(record)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_max_size": self.max_size,
+            "flush_size": self.flush_size,
+            "flush_interval_ms": self.flush_interval * 1000,
+            "flushed_batches": self.flushed_batches,
+            "flushed_records": self.flushed_records,
+            "failed_records": self.failed_records,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushed_batches, 3) if self.flushed_batches else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 3),
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.flush_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[Record]) -> None:
+        started = time.perf_counter()
+        try:
+            await self._writer(batch)
+        except Exception:
+            logger.exception("Error persistiendo lote de %d registros", len(batch))
+            if len(batch) > 1:
+                # Un registro inválido no debe tumbar el lote completo: se aísla
+                for record in batch:
+                    await self._flush([record])
+            else:
+                self.failed_records += 1
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushed_batches += 1
+        self.flushed_records += len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+
+
+write_queue = WriteBehindQueue(
+    max_size=settings.persist_queue_size,
+    flush_size=settings.persist_flush_size,
+    flush_interval=settings.persist_flush_interval_ms / 1000,
+)
@@ -1,10 +1,24 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from app.infrastructure.database import init_db
+from app.infrastructure.database import close_connections, init_db
+from app.infrastructure.http_client import build_http_client
+from app.infrastructure.akua_auth import token_manager
+from app.infrastructure.storage import storage
+from app.infrastructure.write_behind import write_queue
+from app.infrastructure.capture_scheduler import capture_scheduler
+from app.infrastructure.jobs import job_queue
+from app.infrastructure.idempotency import hash_secret, purge_expired
+from app.infrastructure.metrics import MetricsMiddleware
+from app.infrastructure.admission import AdmissionMiddleware
+from app.infrastructure.timing import ServerTimingMiddleware
 from .api.v1.hello import router as hello_router
 from .api.v1.authorization import router as authorization_router
+from .api.v1.authorization_batch import router as authorization_batch_router
 from .api.v1.cancel import router as cancel_router
 from .api.v1.refund import router as refund_router
 from .api.v1.capture import router as capture_router
@@ -12,10 +26,41 @@ from .api.v1.preauthorization import router as preauthorization_router
 from .api.v1.token_test import router as token_test_router
 from .api.v1.organization import router as organization_router
 from .api.v1.merchants import router as merchants_router
+from .api.v1.payments import router as payments_router
+from .api.v1.cache import router as cache_router
+from .api.v1.metrics import router as metrics_router
+from .api.v1.jobs import router as jobs_router
+from .api.v1.stats import router as stats_router
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un único cliente HTTP (pool de conexiones) hacia Akua para toda la app
+    app.state.http_client = build_http_client()
+    await storage.start()
+    await write_queue.start()
+    # Falla al arrancar (y no en el primer pago) si falta IDEMPOTENCY_SECRET en modo REAL
+    await asyncio.to_thread(hash_secret)
+    await asyncio.to_thread(purge_expired)
+    # Con varios workers cada uno retoma las capturas y jobs cuyo lease venció
+    await capture_scheduler.start(app.state.http_client)
+    await job_queue.start(app.state.http_client)
+    try:
+        yield
+    finally:
+        await job_queue.stop()
+        await capture_scheduler.stop()
+        # Garantiza que lo encolado quede persistido antes de salir
+        await write_queue.stop()
+        await storage.close()
+        await token_manager.aclose()
+        close_connections()
+        await app.state.http_client.aclose()
+
 
 def create_app() -> FastAPI:
     init_db()
     app = FastAPI(
+        lifespan=lifespan,
         title="Akua PoC",
         version="1.0.0",
         description=(
@@ -29,12 +74,18 @@ def create_app() -> FastAPI:
         ),
     )
 
+    # El último agregado es el más externo: la admisión corre dentro de métricas y Server-Timing
+    app.add_middleware(AdmissionMiddleware)
+    app.add_middleware(ServerTimingMiddleware)
+    app.add_middleware(MetricsMiddleware)
+
     @app.get("/", tags=["root"])
     async def root():
         return {"message": "Akua PoC - Hola Akua por favor ingresar a /docs para ver la documentación del API"}
 
     app.include_router(hello_router, prefix="/v1")
     app.include_router(authorization_router, prefix="/v1")
+    app.include_router(authorization_batch_router, prefix="/v1")
     app.include_router(cancel_router, prefix="/v1")
     app.include_router(refund_router, prefix="/v1")
     app.include_router(capture_router, prefix="/v1")
@@ -42,6 +93,11 @@ def create_app() -> FastAPI:
     app.include_router(token_test_router, prefix="/v1")
     app.include_router(organization_router, prefix="/v1")
     app.include_router(merchants_router, prefix="/v1")
+    app.include_router(payments_router, prefix="/v1")
+    app.include_router(cache_router, prefix="/v1")
+    app.include_router(jobs_router, prefix="/v1")
+    app.include_router(stats_router, prefix="/v1")
+    app.include_router(metrics_router)
 
     return app
 
@@ -0,0 +1,312 @@
+"""
+Benchmark de carga y latencia de todas las rutas de la API.
+
+Levanta un worker de uvicorn con `app.main:app` contra el simulador de Akua
+(como servidor local, o en proceso con --akua inprocess) con latencia inyectada,
+y mide por ruta: throughput, p50/p95/p99/max y el desglose por etapa que
+devuelve el header Server-Timing (validación, token, llamada a Akua,
+persistencia en SQLite y resto de la app).
+
+Uso:
+    python -m benchmarks.api_load --requests 500 --concurrency 32 --latency-ms 50 \\
+        --output bench-results.json --compare bench-anterior.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROUTES = ["authorization", "preauthorization", "capture", "cancel", "refund", "organizations", "merchants", "payments"]
+
+AUTHORIZATION_BODY = {
+    "amount": {"value": 60.25, "currency": "USD"},
+    "intent": "authorization",
+    "instrument": {
+        "type": "CARD",
+        "card": {
+            "number": "5200000000000007",
+            "cvv": "123",
+            "expiration_month": "12",
+            "expiration_year": "26",
+            "holder_name": "BENCHMARK",
+        },
+    },
+    "merchant_id": "mer-benchmark",
+    "capture": {"mode": "AUTOMATIC"},
+}
+
+# Etapas del header Server-Timing agrupadas para el reporte
+STAGE_GROUPS = {
+    "validation": ("validation",),
+    "upstream": ("token", "upstream", "retry_wait"),
+    "persistence": ("persist", "idempotency", "db"),
+    "app": ("app",),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _parse_server_timing(header: str | None) -> dict[str, float]:
+    spans = {}
+    for part in (header or "").split(","):
+        name, _, rest = part.strip().partition(";dur=")
+        if name and rest:
+            spans[name] = float(rest)
+    return spans
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+class Servers:
+    """
+    Procesos del simulador de Akua y del worker de uvicorn
+    """
+
+    def __init__(self, args: argparse.Namespace, workdir: Path) -> None:
+        self.args = args
+        self.workdir = workdir
+        self.processes: list[subprocess.Popen] = []
+        self.api_url = ""
+
+    def _env(self) -> dict:
+        env = {k: v for k, v in os.environ.items() if not k.startswith(("AKUA_", "SIM_"))}
+        env.update(
+            SIM_LATENCY_MEDIAN_MS=str(self.args.latency_ms),
+            SIM_LATENCY_SIGMA=str(self.args.latency_sigma),
+            SIM_ERROR_RATE=str(self.args.error_rate),
+            SERVER_TIMING="true",
+            AKUA_DB_PATH=str(self.workdir / "bench.db"),
+        )
+        return env
+
+    def start(self) -> None:
+        env = self._env()
+        if self.args.akua == "server":
+            sim_port = _free_port()
+            self.processes.append(subprocess.Popen(
+                [sys.executable, "-m", "app.infrastructure.akua_simulator", "--port", str(sim_port)], env=env,
+            ))
+            env.update(AKUA_MODE="SIMULATOR", AKUA_SIMULATOR_URL=f"http://127.0.0.1:{sim_port}")
+        else:
+            env.update(AKUA_MODE="MOCK")
+
+        api_port = _free_port()
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(api_port),
+             "--log-level", "warning", "--no-access-log", *self.args.uvicorn_arg],
+            env=env,
+        ))
+        self.api_url = f"http://127.0.0.1:{api_port}"
+
+    async def wait_ready(self, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                try:
+                    if (await client.get(f"{self.api_url}/v1/health")).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError("La API no arrancó a tiempo")
+
+    def stop(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait(timeout=10)
+
+
+def _request_for(route: str, i: int, pools: dict[str, list[str]]) -> tuple[str, str, dict]:
+    if route == "authorization":
+        return "POST", "/v1/authorization", {"json": {**AUTHORIZATION_BODY, "id": f"bench-{i}"}}
+    if route == "preauthorization":
+        return "POST", f"/v1/preauthorization?amount_value={10 + i / 100:.2f}", {}
+    if route == "capture":
+        return "POST", f"/v1/capture/{pools['capture'][i]}", {"json": {}}
+    if route == "cancel":
+        return "POST", f"/v1/cancel/{pools['cancel'][i]}", {"json": {}}
+    if route == "refund":
+        return "POST", f"/v1/refund/{pools['refund'][i]}", {"json": {"amount": {"value": 1, "currency": "USD"}}}
+    if route == "organizations":
+        return "GET", "/v1/v1/organizations", {}
+    if route == "merchants":
+        return "GET", f"/v1/v1/merchants?organization_id=org-sim-0000&page={i % 5 + 1}", {}
+    if route == "payments":
+        return "GET", "/v1/payments?limit=50", {}
+    raise ValueError(route)
+
+
+async def _prepare_pools(client: httpx.AsyncClient, routes: list[str], count: int, concurrency: int) -> dict:
+    """
+    Crea los pagos sobre los que se miden captura, cancelación y reembolso
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create(kind: str, i: int) -> str:
+        async with semaphore:
+            if kind == "refund":
+                body = {**AUTHORIZATION_BODY, "id": f"bench-setup-{i}"}
+                response = await client.post("/v1/authorization", json=body)
+            else:
+                offset = 1000 if kind == "capture" else 5000
+                response = await client.post(f"/v1/preauthorization?amount_value={offset + i / 100:.2f}")
+            response.raise_for_status()
+            return response.json()["akua_response"]["payment_id"]
+
+    pools = {}
+    for kind in ("capture", "cancel", "refund"):
+        if kind in routes:
+            pools[kind] = await asyncio.gather(*(create(kind, i) for i in range(count)))
+    return pools
+
+
+async def _run_route(client: httpx.AsyncClient, route: str, count: int, concurrency: int, pools: dict) -> dict:
+    latencies: list[float] = []
+    spans: list[dict[str, float]] = []
+    errors: dict[str, int] = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < count:
+            i = next_index
+            next_index += 1
+            method, url, kwargs = _request_for(route, i, pools)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                response, status = None, type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response is not None and response.status_code < 400:
+                spans.append(_parse_server_timing(response.headers.get("server-timing")))
+            else:
+                errors[status] = errors.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    stages = {}
+    for group, names in STAGE_GROUPS.items():
+        values = [sum(s.get(name, 0.0) for name in names) for s in spans]
+        stages[group] = round(statistics.mean(values), 3) if values else 0.0
+
+    return {
+        "requests": count,
+        "errors": errors,
+        "throughput_rps": round(count / elapsed, 1),
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50), 3),
+            "p95": round(_percentile(latencies, 95), 3),
+            "p99": round(_percentile(latencies, 99), 3),
+            "max": round(max(latencies), 3),
+        },
+        "stages_mean_ms": stages,
+    }
+
+
+def _compare(current: dict, previous: dict) -> None:
+    print(f"\nComparación contra {previous.get('commit')}:")
+    print(f"{'ruta':<18}{'rps':>16}{'p50 ms':>20}{'p99 ms':>20}")
+    for route, result in current["routes"].items():
+        before = previous.get("routes", {}).get(route)
+        if not before:
+            continue
+
+        def delta(now: float, then: float) -> str:
+            change = (now - then) / then * 100 if then else 0.0
+            return f"{now:.1f} ({change:+.1f}%)"
+
+        print(
+            f"{route:<18}{delta(result['throughput_rps'], before['throughput_rps']):>16}"
+            f"{delta(result['latency_ms']['p50'], before['latency_ms']['p50']):>20}"
+            f"{delta(result['latency_ms']['p99'], before['latency_ms']['p99']):>20}"
+        )
+
+
+async def _main(args: argparse.Namespace) -> dict:
+    routes = args.routes.split(",") if args.routes else ROUTES
+    workdir = Path(tempfile.mkdtemp(prefix="akua-api-bench-"))
+    servers = Servers(args, workdir)
+    servers.start()
+    try:
+        await servers.wait_ready()
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=servers.api_url, limits=limits, timeout=60) as client:
+            pools = await _prepare_pools(client, routes, args.requests, args.concurrency)
+            results = {}
+            for route in routes:
+                results[route] = await _run_route(client, route, args.requests, args.concurrency, pools)
+                print(f"{route:<18} {results[route]['throughput_rps']:>8} rps  "
+                      f"p50 {results[route]['latency_ms']['p50']:>8} ms  p99 {results[route]['latency_ms']['p99']:>8} ms")
+            persistence = (await client.get("/v1/health/persistence")).json()
+    finally:
+        servers.stop()
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "params": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+            "latency_sigma": args.latency_sigma,
+            "error_rate": args.error_rate,
+            "akua": args.akua,
+        },
+        "routes": results,
+        "persistence": persistence,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="Requests por ruta")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Latencia mediana inyectada en Akua")
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--akua", choices=["server", "inprocess"], default="server")
+    parser.add_argument("--routes", help=f"Rutas separadas por coma (por defecto: {','.join(ROUTES)})")
+    parser.add_argument("--uvicorn-arg", action="append", default=[], help="Argumento extra para uvicorn")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args()
+
+    results = asyncio.run(_main(args))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"\nResultados guardados en {args.output}")
+    if args.compare:
+        _compare(results, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark del almacenamiento de raw_response: bytes por fila, inserciones/seg
+y lecturas/seg (lectura + decodificación) para cada formato:
+
+- json:      TEXT con json.dumps (formato anterior)
+- zlib:      zlib sin diccionario
+- zlib+dict: zlib con el diccionario prefijado de app.infrastructure.raw_codec
+- zstd+dict: zstd con el mismo diccionario (solo si `zstandard` está instalado)
+
+Las respuestas se generan con el simulador de Akua (autorizaciones, capturas,
+cancelaciones y reembolsos).
+
+Uso:
+    python -m benchmarks.raw_storage --rows 100000
+"""
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+from app.infrastructure import raw_codec
+from app.infrastructure.akua_simulator import AkuaSimulator, SimulatorConfig
+
+HEADERS = {"authorization": "Bearer benchmark"}
+
+
+async def _responses(count: int) -> list[dict]:
+    simulator = AkuaSimulator(SimulatorConfig(latency_median_ms=0, error_rate=0, rate_limit_rps=0, seed=1))
+    rng = random.Random(1)
+    responses: list[dict] = []
+    while len(responses) < count:
+        body = {
+            "amount": {"value": round(rng.uniform(1, 500), 2), "currency": "USD"},
+            "intent": "pre-authorization" if rng.random() < 0.5 else "authorization",
+            "merchant_id": f"mer-{rng.randrange(500):06d}",
+            "instrument": {"type": "CARD", "card": {"number": "5200000000000007"}},
+            "capture": {"mode": "MANUAL"},
+        }
+        _, _, content = await simulator.handle("POST", "/v1/authorizations", {}, HEADERS, json.dumps(body).encode())
+        authorization = json.loads(content)
+        responses.append(authorization)
+        follow_up = rng.choice(["captures", "cancel", None])
+        if follow_up:
+            path = f"/v1/payments/{authorization['payment_id']}/{follow_up}"
+            _, _, content = await simulator.handle("POST", path, {}, HEADERS, b"{}")
+            responses.append(json.loads(content))
+            if follow_up == "captures" and rng.random() < 0.3:
+                path = f"/v1/payments/{authorization['payment_id']}/refund"
+                _, _, content = await simulator.handle("POST", path, {}, HEADERS, b"{}")
+                responses.append(json.loads(content))
+    return responses[:count]
+
+
+def _formats() -> dict:
+    formats = {
+        "json": (lambda raw: json.dumps(raw), raw_codec.decode_raw),
+        "zlib": (
+            lambda raw: zlib.compress(json.dumps(raw, separators=(",", ":")).encode()),
+            lambda value: json.loads(zlib.decompress(value)),
+        ),
+        "zlib+dict": (lambda raw: raw_codec.encode_raw(raw, raw_codec.ZLIB), raw_codec.decode_raw),
+    }
+    if raw_codec.zstandard is not None:
+        formats["zstd+dict"] = (lambda raw: raw_codec.encode_raw(raw, raw_codec.ZSTD), raw_codec.decode_raw)
+    return formats
+
+
+def _measure(workdir: Path, name: str, encode, decode, responses: list[dict], batch_size: int) -> dict:
+    path = workdir / f"{name.replace('+', '_')}.db"
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE raw (id INTEGER PRIMARY KEY, raw_response BLOB NOT NULL)")
+
+    started = time.perf_counter()
+    for i in range(0, len(responses), batch_size):
+        with conn:
+            conn.executemany(
+                "INSERT INTO raw (raw_response) VALUES (?)",
+                [(encode(raw),) for raw in responses[i:i + batch_size]],
+            )
+    insert_seconds = time.perf_counter() - started
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    started = time.perf_counter()
+    for (value,) in conn.execute("SELECT raw_response FROM raw"):
+        decode(value)
+    read_seconds = time.perf_counter() - started
+
+    stored = conn.execute("SELECT SUM(LENGTH(raw_response)) FROM raw").fetchone()[0]
+    conn.close()
+    return {
+        "bytes_per_row": round(stored / len(responses), 1),
+        "db_bytes_per_row": round(path.stat().st_size / len(responses), 1),
+        "inserts_per_sec": round(len(responses) / insert_seconds),
+        "reads_per_sec": round(len(responses) / read_seconds),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--output", help="Archivo JSON con los resultados")
+    args = parser.parse_args()
+
+    responses = asyncio.run(_responses(args.rows))
+    workdir = Path(tempfile.mkdtemp(prefix="akua-raw-bench-"))
+    results = {"rows": args.rows, "formats": {}}
+    for name, (encode, decode) in _formats().items():
+        results["formats"][name] = _measure(workdir, name, encode, decode, responses, args.batch_size)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark de la capa SQLite: inserciones/seg y latencia de búsqueda, antes
+(conexión nueva por escritura, journal por defecto, sin índices) y después
+(conexión persistente, WAL + PRAGMA, commits agrupados e índices).
+
+Uso:
+    python -m benchmarks.sqlite_tuning --rows 1000000 --insert-sample 5000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+RAW_RESPONSE = json.dumps({
+    "payment_id": "pay-xxxxxxxxxxxxxxxxxxxx",
+    "transaction": {
+        "id": "trx-xxxxxxxxxxxxxxxxxxxx",
+        "status": "APPROVED",
+        "amount": {"value": 60.25, "currency": "USD"},
+        "type": "AUTHORIZATION",
+    },
+    "merchant_id": "mer-xxxxxxxxxxxxxxxxxxxx",
+    "instrument": {"type": "CARD", "card": {"bin": "520000", "last4": "0007", "brand": "MASTERCARD"}},
+    "risk": {"score": 12, "decision": "ACCEPT", "rules": ["velocity", "country", "bin"] * 10},
+})
+
+
+def _row(i: int, merchants: int) -> tuple:
+    return (
+        f"mer-{i % merchants:06d}",
+        f"AB-{i:012d}",
+        f"pay-{i:012d}",
+        f"trx-{i:012d}",
+        "APPROVED",
+        "AUTHORIZATION",
+        RAW_RESPONSE,
+        f"2025-01-01T00:00:00.{i:09d}",
+    )
+
+
+INSERT_SQL = (
+    "INSERT INTO authorizations (merchant_id, authorization_id, payment_id, transaction_id, "
+    "status, type, raw_response, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _insert_before(path: Path, rows: list[tuple]) -> float:
+    """Comportamiento original: conexión nueva y commit por cada fila"""
+    started = time.perf_counter()
+    for row in rows:
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute(INSERT_SQL, row)
+        conn.close()
+    return len(rows) / (time.perf_counter() - started)
+
+
+def _insert_after(rows: list[tuple], batch_size: int) -> float:
+    """Conexión persistente con WAL y commits agrupados (write-behind)"""
+    from app.infrastructure.database import write_records
+
+    columns = ("merchant_id", "authorization_id", "payment_id", "transaction_id",
+               "status", "type", "raw_response", "created_at")
+    records = [("authorizations", dict(zip(columns, row))) for row in rows]
+    started = time.perf_counter()
+    for i in range(0, len(records), batch_size):
+        write_records(records[i:i + batch_size])
+    return len(rows) / (time.perf_counter() - started)
+
+
+def _bulk_load(conn: sqlite3.Connection, total: int, merchants: int) -> None:
+    chunk = 50_000
+    for start in range(0, total, chunk):
+        with conn:
+            conn.executemany(INSERT_SQL, (_row(i, merchants) for i in range(start, min(total, start + chunk))))
+
+
+def _lookups(conn: sqlite3.Connection, total: int, merchants: int, samples: int) -> dict:
+    queries = {
+        "payment_id": ("SELECT id, status FROM authorizations WHERE payment_id = ?",
+                       lambda: (f"pay-{random.randrange(total):012d}",)),
+        "transaction_id": ("SELECT id, status FROM authorizations WHERE transaction_id = ?",
+                           lambda: (f"trx-{random.randrange(total):012d}",)),
+        "merchant_recent": ("SELECT id, status FROM authorizations WHERE merchant_id = ? "
+                            "ORDER BY created_at DESC LIMIT 50",
+                            lambda: (f"mer-{random.randrange(merchants):06d}",)),
+    }
+    results = {}
+    for name, (sql, params) in queries.items():
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            conn.execute(sql, params()).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = {
+            "p50_ms": round(statistics.median(timings), 4),
+            "max_ms": round(max(timings), 4),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Filas para medir búsquedas")
+    parser.add_argument("--insert-sample", type=int, default=5_000, help="Filas para medir inserciones")
+    parser.add_argument("--merchants", type=int, default=500)
+    parser.add_argument("--lookup-samples", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--output", help="Archivo JSON con los resultados")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="akua-sqlite-bench-"))
+    os.environ["AKUA_DB_PATH"] = str(workdir / "after.db")
+
+    from app.infrastructure import database
+    from app.infrastructure.migrations import apply_migrations
+
+    # --- Antes: esquema sin índices, journal por defecto ---
+    before_path = workdir / "before.db"
+    before = sqlite3.connect(before_path)
+    apply_migrations(before, target=1)
+    sample = [_row(i, args.merchants) for i in range(args.insert_sample)]
+    before_inserts = _insert_before(before_path, sample)
+    _bulk_load(before, args.rows, args.merchants)
+    before_lookups = _lookups(before, args.rows, args.merchants, args.lookup_samples)
+    before.close()
+
+    # --- Después: conexión persistente, WAL, índices ---
+    database.init_db()
+    after_inserts = _insert_after(sample, args.batch_size)
+    conn = database.get_connection()
+    with conn:
+        conn.execute("DELETE FROM authorizations")
+    _bulk_load(conn, args.rows, args.merchants)
+    after_lookups = _lookups(conn, args.rows, args.merchants, args.lookup_samples)
+
+    results = {
+        "rows": args.rows,
+        "before": {"inserts_per_sec": round(before_inserts), "lookups": before_lookups},
+        "after": {"inserts_per_sec": round(after_inserts), "lookups": after_lookups},
+    }
+    database.close_connections()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Benchmark de escalamiento con varios workers de uvicorn.
+
+Para cada cantidad de workers levanta `python -m app.commands.serve --workers N`
+con el simulador de Akua en proceso (AKUA_MODE=MOCK: cada worker tiene el suyo,
+así Akua no es el cuello de botella) y mide el throughput de cada ruta con
+varios procesos generadores de carga. Reporta rps, p50/p99 y la eficiencia
+respecto de un worker: rps(N) / (N * rps(1)). Cerca de 1.0 es escalamiento
+lineal; los generadores de carga comparten los núcleos con la API, así que en
+la máquina que se mide conviene dejarles margen (--clients).
+
+Uso:
+    python -m benchmarks.worker_scaling --workers 1,2,4 --duration 10 \\
+        --routes organizations,authorization --output scaling.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import httpx
+
+from benchmarks.api_load import AUTHORIZATION_BODY, _free_port, _git_commit, _percentile
+
+ROUTES = ["organizations", "authorization"]
+
+
+def _request_for(route: str, client_id: int, i: int) -> tuple[str, str, dict]:
+    if route == "organizations":
+        return "GET", "/v1/v1/organizations", {}
+    if route == "authorization":
+        # id único por request: cada uno es una autorización nueva, no un replay
+        return "POST", "/v1/authorization", {"json": {**AUTHORIZATION_BODY, "id": f"scale-{client_id}-{i}"}}
+    return "GET", "/v1/health", {}
+
+
+def _drive(api_url: str, route: str, duration: float, concurrency: int, client_id: int) -> dict:
+    """
+    Proceso generador de carga: `concurrency` conexiones durante `duration` segundos
+    """
+
+    async def run() -> dict:
+        latencies: list[float] = []
+        errors: dict[str, int] = {}
+        counter = 0
+        deadline = time.perf_counter() + duration
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+        async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=60) as client:
+            async def worker():
+                nonlocal counter
+                while time.perf_counter() < deadline:
+                    counter += 1
+                    method, url, kwargs = _request_for(route, client_id, counter)
+                    started = time.perf_counter()
+                    try:
+                        response = await client.request(method, url, **kwargs)
+                        status = response.status_code
+                    except httpx.HTTPError as e:
+                        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                        continue
+                    if status >= 400:
+                        errors[str(status)] = errors.get(str(status), 0) + 1
+                    else:
+                        latencies.append((time.perf_counter() - started) * 1000)
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return {"latencies": latencies, "errors": errors}
+
+    return asyncio.run(run())
+
+
+class Server:
+    def __init__(self, workers: int, args: argparse.Namespace, workdir: Path) -> None:
+        self.workers = workers
+        self.args = args
+        self.workdir = workdir
+        self.process: subprocess.Popen | None = None
+        self.api_url = ""
+
+    def start(self) -> None:
+        env = {k: v for k, v in os.environ.items() if not k.startswith(("AKUA_", "SIM_", "SHARED_", "RATE_LIMIT_"))}
+        env.update(
+            AKUA_MODE="MOCK",
+            SIM_LATENCY_MEDIAN_MS=str(self.args.latency_ms),
+            SIM_LATENCY_SIGMA="0.2",
+            AKUA_DB_PATH=str(self.workdir / f"scaling-{self.workers}.db"),
+            SERVER_TIMING="false",
+        )
+        port = _free_port()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "app.commands.serve", "--workers", str(self.workers), "--host", "127.0.0.1",
+             "--port", str(port), "--log-level", "warning", "--no-access-log"],
+            env=env,
+        )
+        self.api_url = f"http://127.0.0.1:{port}"
+
+    def wait_ready(self, timeout: float = 60) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"{self.api_url}/v1/health").status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("La API no arrancó a tiempo")
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+
+
+def _measure(server: Server, route: str, args: argparse.Namespace) -> dict:
+    # Calentamiento: token, cache de listados y conexiones de cada worker
+    _drive(server.api_url, route, min(2.0, args.duration / 4), args.concurrency, -1)
+
+    with ProcessPoolExecutor(max_workers=args.clients) as pool:
+        futures = [
+            pool.submit(_drive, server.api_url, route, args.duration, args.concurrency, client_id)
+            for client_id in range(args.clients)
+        ]
+        results = [future.result() for future in futures]
+
+    latencies = [value for result in results for value in result["latencies"]]
+    errors: dict[str, int] = {}
+    for result in results:
+        for name, count in result["errors"].items():
+            errors[name] = errors.get(name, 0) + count
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / args.duration, 1),
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50), 3) if latencies else None,
+            "p99": round(_percentile(latencies, 99), 3) if latencies else None,
+        },
+    }
+
+
+def main() -> None:
+    cores = os.cpu_count() or 1
+    default_workers = sorted({1, *(n for n in (2, 4, 8, 16, 32) if n <= cores), cores})
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default=",".join(map(str, default_workers)),
+                        help="Cantidades de workers separadas por coma (por defecto potencias de 2 hasta los núcleos)")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="organizations, authorization o health")
+    parser.add_argument("--duration", type=float, default=10, help="Segundos de carga por ruta y cantidad de workers")
+    parser.add_argument("--clients", type=int, default=max(1, cores // 2), help="Procesos generadores de carga")
+    parser.add_argument("--concurrency", type=int, default=32, help="Conexiones por proceso generador")
+    parser.add_argument("--latency-ms", type=float, default=5, help="Latencia mediana del simulador en proceso")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    worker_counts = [int(value) for value in args.workers.split(",")]
+    routes = args.routes.split(",")
+    workdir = Path(tempfile.mkdtemp(prefix="akua-scaling-bench-"))
+    results: dict[str, dict[int, dict]] = {route: {} for route in routes}
+
+    for workers in worker_counts:
+        server = Server(workers, args, workdir)
+        server.start()
+        try:
+            server.wait_ready()
+            for route in routes:
+                results[route][workers] = _measure(server, route, args)
+        finally:
+            server.stop()
+
+    print(f"\n{'ruta':<16}{'workers':>8}{'rps':>12}{'p50 ms':>10}{'p99 ms':>10}{'eficiencia':>12}")
+    for route, by_workers in results.items():
+        base = by_workers.get(min(by_workers), {}).get("throughput_rps") or 0
+        base_workers = min(by_workers)
+        for workers, result in sorted(by_workers.items()):
+            rps = result["throughput_rps"]
+            efficiency = rps * base_workers / (workers * base) if base else 0.0
+            result["efficiency"] = round(efficiency, 3)
+            print(f"{route:<16}{workers:>8}{rps:>12}{result['latency_ms']['p50'] or 0:>10}"
+                  f"{result['latency_ms']['p99'] or 0:>10}{efficiency:>12.2f}"
+                  + (f"  errores: {result['errors']}" if result["errors"] else ""))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "cores": cores,
+            "params": {key: value for key, value in vars(args).items() if key != "output"},
+            "routes": results,
+        }, indent=2))
+        print(f"\nResultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+# La base SQLite se resuelve al importar app.infrastructure.database: se apunta
+# a un directorio temporal antes de importar cualquier módulo de la app
+os.environ.setdefault("AKUA_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="akua-tests-"), "akua_poc.db"))
+os.environ.setdefault("AKUA_MODE", "MOCK")
+
+import pytest  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.infrastructure.database import close_connections, init_db  # noqa: E402
+from app.infrastructure.storage.postgres import PostgresStorage, asyncpg  # noqa: E402
+from app.infrastructure.storage.sqlite import SQLiteStorage  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def sqlite_db():
+    init_db()
+    yield
+    close_connections()
+
+
+def _build(backend: str):
+    if backend == "sqlite":
+        return SQLiteStorage()
+    if asyncpg is None:
+        pytest.skip("asyncpg no está instalado")
+    return PostgresStorage(
+        dsn=os.getenv("TEST_POSTGRES_DSN", settings.postgres_dsn),
+        min_size=1,
+        max_size=2,
+        insert_batch=settings.postgres_insert_batch,
+        statement_cache_size=settings.postgres_statement_cache_size,
+    )
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+async def storage(request):
+    """
+    Cada backend de Storage; PostgreSQL se omite si no hay servidor
+    (TEST_POSTGRES_DSN o POSTGRES_DSN)
+    """
+    backend = _build(request.param)
+    try:
+        await backend.start()
+    except (OSError, asyncpg.PostgresError) as e:
+        pytest.skip(f"PostgreSQL no disponible: {e}")
+    try:
+        yield backend
+    finally:
+        await backend.close()
@@ -0,0 +1,67 @@
+import sqlite3
+
+import pytest
+
+from app.config import settings
+from app.infrastructure import admission
+from app.infrastructure.admission import AdmissionMiddleware, MemoryBuckets, SQLiteBuckets
+
+pytestmark = pytest.mark.anyio
+
+
+def test_memory_buckets_drop_refilled_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    buckets = MemoryBuckets()
+    for merchant in ("a", "b", "c"):
+        buckets.take([(f"merchant:{merchant}", 1.0, 2.0)])
+    assert len(buckets._buckets) == 3
+
+    # A 1 token/seg, un bucket de burst 2 con un token usado se llena en 1 segundo
+    now[0] += admission.SWEEP_INTERVAL
+    buckets.take([("merchant:d", 1.0, 2.0)])
+    assert list(buckets._buckets) == ["merchant:d"]
+
+
+def test_sqlite_buckets_drop_refilled_rows(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "time", lambda: now[0])
+    path = tmp_path / "rate_limit.db"
+    # Archivo de una versión sin full_at
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE token_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+        conn.execute("INSERT INTO token_buckets VALUES ('merchant:old', 5, 0)")
+    buckets = SQLiteBuckets(path)
+    buckets.take([("merchant:a", 1.0, 2.0)])
+    keys = {row[0] for row in sqlite3.connect(path).execute("SELECT key FROM token_buckets")}
+    assert keys == {"merchant:a"}
+
+    now[0] += admission.SWEEP_INTERVAL
+    assert buckets.take([("merchant:b", 1.0, 1.0)]) == (0.0, None)
+    keys = {row[0] for row in sqlite3.connect(path).execute("SELECT key FROM token_buckets")}
+    assert keys == {"merchant:b"}
+
+
+async def test_preauthorization_is_keyed_on_its_fixed_merchant(monkeypatch):
+    admitted = []
+
+    async def admit(merchant_id):
+        admitted.append(merchant_id)
+        return 0.0, None
+
+    async def app(scope, receive, send):
+        pass
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(admission.admission_controller, "admit", admit)
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/v1/preauthorization",
+        "headers": [(b"x-merchant-id", b"otro")],
+    }
+    await AdmissionMiddleware(app)(scope, receive, None)
+    assert admitted == [settings.preauthorization_merchant_id]
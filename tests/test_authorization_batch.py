@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from app.api.v1.authorization_batch import _json_items
+
+pytestmark = pytest.mark.anyio
+
+
+class _Request:
+    """
+    Cuerpo que llega de a `size` bytes
+    """
+
+    def __init__(self, body: bytes, size: int) -> None:
+        self.body, self.size = body, size
+
+    async def stream(self):
+        for start in range(0, len(self.body), self.size):
+            yield self.body[start:start + self.size]
+
+
+async def _items(body: bytes, size: int) -> list:
+    return [item async for _, item in _json_items(_Request(body, size))]
+
+
+@pytest.mark.parametrize("size", [1, 3, 1024])
+async def test_json_items_decodes_elements_across_chunks(size):
+    items = [{"merchant_id": "mañana", "n": 12345}, 678, [1.5e3, None, True], "fin"]
+    body = (" [ " + " ,\n".join(json.dumps(item, ensure_ascii=False) for item in items) + " ] ").encode()
+    assert await _items(body, size) == items
+    assert await _items(b"[]", size) == []
+
+
+@pytest.mark.parametrize("body", [b"{}", b"[1, 2", b"[1 2]", b"[1,]", b"[1] x", b""])
+async def test_json_items_rejects_invalid_bodies(body):
+    with pytest.raises(ValueError):
+        await _items(body, 2)
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from app.infrastructure.cache import TTLCache
+
+pytestmark = pytest.mark.anyio
+
+
+class _Failure(Exception):
+    pass
+
+
+async def test_miss_joining_failed_refresh_sees_the_error():
+    cache = TTLCache(max_entries=10, stale_seconds=60)
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise _Failure()
+
+    cache._store("key", ["old"], ttl=0)
+    # Vencido pero dentro de stale: responde el viejo y refresca en segundo plano
+    assert await cache.get_or_load("key", 0, failing) == ["old"]
+    cache._entries.clear()
+
+    miss = asyncio.create_task(cache.get_or_load("key", 10, failing))
+    await asyncio.sleep(0)
+    release.set()
+    with pytest.raises(_Failure):
+        await miss
+    assert cache.refresh_errors == 1
+    assert cache.stats()["inflight"] == 0
+
+
+async def test_failed_background_refresh_keeps_serving_stale():
+    cache = TTLCache(max_entries=10, stale_seconds=60)
+
+    async def failing():
+        raise _Failure()
+
+    cache._store("key", ["old"], ttl=0)
+    assert await cache.get_or_load("key", 0, failing) == ["old"]
+    while cache.stats()["inflight"]:
+        await asyncio.sleep(0)
+    assert cache.refresh_errors == 1
+    assert await cache.get_or_load("key", 0, failing) == ["old"]
@@ -0,0 +1,17 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.infrastructure.capture_scheduler import parse_capture_after
+
+
+def test_parse_capture_after_seconds_and_iso():
+    before = datetime.utcnow()
+    assert before + timedelta(seconds=59) <= parse_capture_after(" 60 ") <= datetime.utcnow() + timedelta(seconds=60)
+    assert parse_capture_after("2026-01-01T03:00:00+03:00") == datetime(2026, 1, 1)
+
+
+@pytest.mark.parametrize("value", ["1e20", "-1e20", "inf", "nan", "9999-01-01T00:00:00", "mañana"])
+def test_parse_capture_after_rejects_invalid_or_out_of_range(value):
+    with pytest.raises(ValueError):
+        parse_capture_after(value)
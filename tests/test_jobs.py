@@ -0,0 +1,27 @@
+import json
+
+import pytest
+
+from app.infrastructure.database import get_connection
+from app.infrastructure.jobs import JobQueue, get_job
+
+pytestmark = pytest.mark.anyio
+
+PAYLOAD = {
+    "merchant_id": "m1",
+    "intent": "authorization",
+    "amount": {"value": 10, "currency": "USD"},
+    "instrument": {"type": "CARD", "card": {"number": "4111111111111111", "cvv": "123"}},
+}
+
+
+async def test_enqueue_never_persists_the_cvv():
+    queue = JobQueue(workers=1, callback_timeout=1, callback_attempts=1)
+    job = await queue.enqueue("authorization", PAYLOAD)
+
+    request = get_connection().execute("SELECT request FROM jobs WHERE id = ?", (job["id"],)).fetchone()[0]
+    assert "cvv" not in json.loads(request)["instrument"]["card"]
+    assert queue._cvvs[job["id"]] == "123"
+    assert PAYLOAD["instrument"]["card"]["cvv"] == "123"
+    # La consulta de estado no lee el request
+    assert "request" not in get_job(job["id"])
@@ -0,0 +1,56 @@
+import time
+
+from app.infrastructure import leases
+from app.infrastructure.capture_scheduler import _LEASES
+from app.infrastructure.database import get_connection
+
+
+def _schedule(payment_id: str, owner: str, lease_until: float, status: str = "PENDING") -> None:
+    with get_connection() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO scheduled_captures (payment_id, capture_after, status, attempts,
+                created_at, updated_at, owner, lease_until)
+            VALUES (?, '2030-01-01T00:00:00', ?, 0, '2030-01-01', '2030-01-01', ?, ?)
+            """,
+            (payment_id, status, owner, lease_until),
+        )
+
+
+def _owner(payment_id: str) -> str:
+    return get_connection().execute(
+        "SELECT owner FROM scheduled_captures WHERE payment_id = ?", (payment_id,)
+    ).fetchone()[0]
+
+
+def test_only_expired_pending_rows_are_taken_over():
+    now = time.time()
+    _schedule("pay-dead", "pid-dead", now - 1)
+    _schedule("pay-alive", "pid-alive", now + 60)
+    _schedule("pay-done", "pid-dead", now - 1, status="CAPTURED")
+
+    taken = _LEASES.renew_and_take_over("capture_after, attempts")
+    assert [row["payment_id"] for row in taken] == ["pay-dead"]
+    assert _owner("pay-dead") == leases.WORKER_ID
+    assert _owner("pay-alive") == "pid-alive"
+    # Una captura viva de otro worker o ya terminada no se ejecuta
+    assert not _LEASES.claim("pay-alive")
+    assert not _LEASES.claim("pay-done")
+    assert _LEASES.claim("pay-dead")
+
+
+def test_claim_fails_once_another_worker_took_the_row(monkeypatch):
+    _schedule("pay-moved", leases.WORKER_ID, time.time() - 1)
+    monkeypatch.setattr(leases, "WORKER_ID", "pid-other")
+    assert [row["payment_id"] for row in _LEASES.renew_and_take_over("attempts")] == ["pay-moved"]
+    monkeypatch.undo()
+    # El lease renovado por el otro worker ya no es nuestro
+    assert not _LEASES.claim("pay-moved")
+
+
+def test_release_lets_others_take_over_immediately():
+    _schedule("pay-released", leases.WORKER_ID, time.time() + 60)
+    _LEASES.release()
+    assert get_connection().execute(
+        "SELECT lease_until FROM scheduled_captures WHERE payment_id = 'pay-released'"
+    ).fetchone()[0] == 0
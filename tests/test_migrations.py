@@ -0,0 +1,55 @@
+import json
+import sqlite3
+
+import pytest
+
+from app.infrastructure import migrations
+from app.infrastructure.migrations import MIGRATIONS, apply_migrations, schema_version
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "migrations.db")
+    apply_migrations(conn, target=3)
+    conn.execute(
+        "INSERT INTO authorizations (merchant_id, authorization_id, payment_id, transaction_id, status, "
+        "raw_response, created_at) VALUES ('m1', 'AB-1', 'pay-1', 'tx-1', 'APPROVED', ?, '2026-01-01T00:00:00')",
+        (json.dumps({"transaction": {"amount": {"value": 10, "currency": "USD"}}}),),
+    )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_interrupted_migration_leaves_no_ddl_behind(conn):
+    def interrupted(_conn):
+        raise KeyboardInterrupt
+
+    version, description, steps = MIGRATIONS[3]
+    assert version == 4
+    MIGRATIONS[3] = (version, description, [*steps[:-1], interrupted])
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            apply_migrations(conn)
+    finally:
+        MIGRATIONS[3] = (version, description, steps)
+
+    assert schema_version(conn) == 3
+    assert "amount_value" not in _columns(conn, "authorizations")
+
+    assert apply_migrations(conn) == MIGRATIONS[-1][0]
+    assert conn.execute("SELECT amount_value, currency FROM authorizations").fetchone() == (10.0, "USD")
+
+
+def test_migration_4_resumes_over_columns_already_added(conn):
+    # Estado de una corrida cortada antes de las migraciones transaccionales
+    for table in migrations.RAW_TABLES:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN amount_value REAL")
+    conn.commit()
+
+    assert apply_migrations(conn) == MIGRATIONS[-1][0]
+    assert "merchant_id" in _columns(conn, "captures")
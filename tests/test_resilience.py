@@ -0,0 +1,45 @@
+import httpx
+import pytest
+
+from app.infrastructure.akua_client import AkuaClient
+from app.infrastructure.resilience import RetryPolicy, retry_policy
+
+pytestmark = pytest.mark.anyio
+
+
+def test_retry_after_is_never_shortened():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, max_delay=2.0, budget=30.0)
+    assert policy.delay(0, "1.5") == 1.5
+    assert policy.delay(0, "120") is None
+    assert 0 <= policy.delay(5) <= 2.0
+
+
+class _Tokens:
+    has_credentials = False
+
+    async def get_token(self, http):
+        return "token"
+
+
+async def _send(status: int, retry_after: str) -> tuple[httpx.Response, int]:
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(status, headers={"Retry-After": retry_after})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+        client = AkuaClient(http, tokens=_Tokens())
+        response = await client._send("GET", "https://akua.test/v1/x", f"test-{status}-{retry_after}", {})
+    return response, calls
+
+
+async def test_long_retry_after_returns_the_response():
+    response, calls = await _send(429, "120")
+    assert response.status_code == 429 and calls == 1
+
+
+async def test_short_retry_after_is_retried():
+    response, calls = await _send(503, "0")
+    assert response.status_code == 503 and calls == retry_policy.max_attempts
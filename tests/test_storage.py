@@ -0,0 +1,141 @@
+import csv
+import io
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.infrastructure.database import authorization_record, capture_record, refund_record
+from app.infrastructure.export import encode
+from app.infrastructure.ledger import LEDGER_COLUMNS
+from app.infrastructure.payment_state import apply_event, new_entry
+from app.infrastructure.rollups import stats_window
+
+pytestmark = pytest.mark.anyio
+
+
+def _id(prefix: str) -> str:
+    # Ids únicos por test: la base (y el PostgreSQL de pruebas) se comparte
+    return f"{prefix}-{uuid.uuid4().hex[:12]}"
+
+
+def _response(merchant_id: str, payment_id: str, value: float, status: str = "APPROVED") -> dict:
+    return {
+        "merchant_id": merchant_id,
+        "payment_id": payment_id,
+        "transaction": {"id": _id("tx"), "status": status, "amount": {"value": value, "currency": "USD"}},
+    }
+
+
+def _ledger_record(entry: dict):
+    return "payment_ledger", {column: entry[column] for column in LEDGER_COLUMNS}
+
+
+def _payment(merchant_id: str, value: float = 100.0):
+    """
+    Autorización y captura de un pago nuevo del comercio
+    """
+    payment_id = _id("pay")
+    return payment_id, [
+        authorization_record(merchant_id, _id("AB"), payment_id, _id("tx"), "APPROVED", _response(merchant_id, payment_id, value)),
+        capture_record(payment_id, _id("tx"), str(value), "APPROVED", _response(merchant_id, payment_id, value)),
+    ]
+
+
+async def test_write_records_upserts_ledger_by_version(storage):
+    merchant_id, payment_id = _id("m"), _id("pay")
+    authorized = apply_event(new_entry(payment_id), "authorization", _response(merchant_id, payment_id, 100.0))
+    captured = apply_event(authorized, "capture", _response(merchant_id, payment_id, 40.0))
+
+    await storage.write_records([_ledger_record(authorized)])
+    await storage.write_records([_ledger_record(captured)])
+    # Una versión vieja que llega tarde no pisa la más nueva
+    await storage.write_records([_ledger_record(authorized)])
+
+    ledger = await storage.get_ledger(payment_id)
+    assert ledger["version"] == 2
+    assert ledger["status"] == "PARTIALLY_CAPTURED"
+    assert ledger["captured_amount"] == 40.0
+    assert await storage.get_ledger(_id("pay")) is None
+
+
+async def test_write_records_and_get_payment(storage):
+    merchant_id = _id("m")
+    payment_id, records = _payment(merchant_id, 25.0)
+    await storage.write_records(records)
+
+    payment = await storage.get_payment(payment_id)
+    assert [item["merchant_id"] for item in payment["authorizations"]] == [merchant_id]
+    assert [item["amount_value"] for item in payment["captures"]] == [25.0]
+    assert payment["refunds"] == [] and payment["ledger"] is None
+    assert await storage.get_payment(_id("pay")) is None
+
+
+async def test_list_transactions_keyset_pages(storage):
+    merchant_id = _id("m")
+    records = []
+    for _ in range(4):
+        records += _payment(merchant_id)[1]
+    await storage.write_records(records)
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = await storage.list_transactions(limit=3, merchant_id=merchant_id, cursor=cursor)
+        assert len(page) <= 3
+        seen += page
+        if cursor is None:
+            break
+
+    assert len(seen) == 8
+    assert len({(item["type"], item["id"]) for item in seen}) == 8
+    keys = [item["created_at"] for item in seen]
+    assert keys == sorted(keys, reverse=True)
+
+    captures, _ = await storage.list_transactions(limit=10, merchant_id=merchant_id, tx_type="CAPTURE")
+    assert len(captures) == 4 and {item["type"] for item in captures} == {"CAPTURE"}
+
+
+async def test_export_streams_every_record(storage):
+    merchant_id = _id("m")
+    records = []
+    for _ in range(3):
+        records += _payment(merchant_id)[1]
+    payment_id = records[0][1]["payment_id"]
+    records.append(refund_record(payment_id, _id("tx"), "APPROVED", _response(merchant_id, payment_id, 10.0)))
+    await storage.write_records(records)
+
+    chunks = [chunk async for chunk in storage.iter_transactions(2, merchant_id=merchant_id)]
+    assert all(len(chunk) <= 2 for chunk in chunks)
+    rows = [row for chunk in chunks for row in chunk]
+    assert sorted(row["source"] for row in rows) == ["authorizations"] * 3 + ["captures"] * 3 + ["refunds"]
+
+    exported = b"".join([data async for data in encode("csv", storage.iter_transactions(2, merchant_id=merchant_id))])
+    lines = list(csv.DictReader(io.StringIO(exported.decode())))
+    assert len(lines) == 7
+    assert {line["merchant_id"] for line in lines} == {merchant_id}
+
+
+async def test_volume_stats_follow_writes_and_status_updates(storage):
+    merchant_id = _id("m")
+    records = []
+    for value in (10.0, 15.0):
+        records += _payment(merchant_id, value)[1]
+    await storage.write_records(records)
+    declined = records[0][1]["transaction_id"]
+    await storage.update_statuses([("authorizations", declined, "DECLINED")])
+
+    end = (datetime.utcnow() + timedelta(hours=1)).isoformat()
+    start, end = stats_window("day", None, end)
+    buckets = await storage.volume_stats("day", merchant_id, start, end)
+
+    assert len(buckets) == 1
+    bucket = buckets[0]
+    assert bucket["currency"] == "USD"
+    assert bucket["AUTHORIZATION"] == {
+        "APPROVED": {"count": 1, "amount": 15.0},
+        "DECLINED": {"count": 1, "amount": 10.0},
+    }
+    assert bucket["CAPTURE"] == {"APPROVED": {"count": 2, "amount": 25.0}}
+
+    await storage.rebuild_rollups()
+    assert await storage.volume_stats("day", merchant_id, start, end) == buckets